@@ -9,8 +9,10 @@ __all__ = (
 
     'text_type',
     'string_types',
+    'integer_types',
 
     'configparser',
+    'queue',
 
     'urlparse',
     'url_quote',
@@ -26,11 +28,13 @@ PY2 = sys.version_info[0] == 2
 if not PY2:
     text_type = str
     string_types = (str,)
+    integer_types = (int,)
     xrange = range
     unichr = chr
 else:
     text_type = unicode  # noqa
     string_types = (str, unicode)  # noqa
+    integer_types = (int, long)  # noqa
     xrange = xrange
     unichr = unichr
 
@@ -39,6 +43,11 @@ try:
 except ImportError:
     import configparser
 
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
 try:
     from urllib import parse as urlparse
     url_quote = urlparse.quote
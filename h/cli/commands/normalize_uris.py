@@ -1,18 +1,12 @@
 # -*- coding: utf-8 -*-
 
-from h._compat import xrange
-from collections import namedtuple
-
 import click
 
 from h import models
 from h.models.document import merge_documents
 from h.search import index
 from h.util import uri
-
-
-class Window(namedtuple('Window', ['start', 'end'])):
-    pass
+from h.util.query import keyset_windows
 
 
 @click.command('normalize-uris')
@@ -30,8 +24,7 @@ def normalize_uris(ctx):
 
 
 def normalize_document_uris(request):
-    windows = _fetch_windows(request.db, models.DocumentURI.updated)
-    request.tm.commit()
+    windows = _fetch_windows(request.db, models.DocumentURI)
 
     for window in windows:
         request.tm.begin()
@@ -40,8 +33,7 @@ def normalize_document_uris(request):
 
 
 def normalize_document_meta(request):
-    windows = _fetch_windows(request.db, models.DocumentMeta.updated)
-    request.tm.commit()
+    windows = _fetch_windows(request.db, models.DocumentMeta)
 
     for window in windows:
         request.tm.begin()
@@ -50,8 +42,7 @@ def normalize_document_meta(request):
 
 
 def normalize_annotations(request):
-    windows = _fetch_windows(request.db, models.Annotation.updated)
-    request.tm.commit()
+    windows = _fetch_windows(request.db, models.Annotation)
 
     for window in windows:
         request.tm.begin()
@@ -65,10 +56,14 @@ def normalize_annotations(request):
 
 def _normalize_document_uris_window(session, window):
     query = session.query(models.DocumentURI) \
-        .filter(models.DocumentURI.updated.between(window.start, window.end)) \
-        .order_by(models.DocumentURI.updated.asc())
+        .filter(window) \
+        .order_by(models.DocumentURI.updated.asc(), models.DocumentURI.id.asc())
+
+    docuris = query.all()
+    claimants = uri.normalize_many(d.claimant for d in docuris)
+    uris = uri.normalize_many(d.uri for d in docuris)
 
-    for docuri in query:
+    for docuri, claimant_normalized, uri_normalized in zip(docuris, claimants, uris):
         documents = models.Document.find_by_uris(session, [docuri.uri])
         if documents.count() > 1:
             merge_documents(session, documents)
@@ -76,47 +71,52 @@ def _normalize_document_uris_window(session, window):
         existing = session.query(models.DocumentURI).filter(
             models.DocumentURI.id != docuri.id,
             models.DocumentURI.document_id == docuri.document_id,
-            models.DocumentURI.claimant_normalized == uri.normalize(docuri.claimant),
-            models.DocumentURI.uri_normalized == uri.normalize(docuri.uri),
+            models.DocumentURI.claimant_normalized == claimant_normalized,
+            models.DocumentURI.uri_normalized == uri_normalized,
             models.DocumentURI.type == docuri.type,
             models.DocumentURI.content_type == docuri.content_type)
 
         if existing.count() > 0:
             session.delete(docuri)
         else:
-            docuri._claimant_normalized = uri.normalize(docuri.claimant)
-            docuri._uri_normalized = uri.normalize(docuri.uri)
+            docuri._claimant_normalized = claimant_normalized
+            docuri._uri_normalized = uri_normalized
 
         session.flush()
 
 
 def _normalize_document_meta_window(session, window):
     query = session.query(models.DocumentMeta) \
-        .filter(models.DocumentMeta.updated.between(window.start, window.end)) \
-        .order_by(models.DocumentMeta.updated.asc())
+        .filter(window) \
+        .order_by(models.DocumentMeta.updated.asc(), models.DocumentMeta.id.asc())
 
-    for docmeta in query:
+    docmetas = query.all()
+    claimants = uri.normalize_many(d.claimant for d in docmetas)
+
+    for docmeta, claimant_normalized in zip(docmetas, claimants):
         existing = session.query(models.DocumentMeta).filter(
             models.DocumentMeta.id != docmeta.id,
-            models.DocumentMeta.claimant_normalized == uri.normalize(docmeta.claimant),
+            models.DocumentMeta.claimant_normalized == claimant_normalized,
             models.DocumentMeta.type == docmeta.type)
 
         if existing.count() > 0:
             session.delete(docmeta)
         else:
-            docmeta._claimant_normalized = uri.normalize(docmeta.claimant)
+            docmeta._claimant_normalized = claimant_normalized
 
         session.flush()
 
 
 def _normalize_annotations_window(session, window):
     query = session.query(models.Annotation) \
-        .filter(models.Annotation.updated.between(window.start, window.end)) \
-        .order_by(models.Annotation.updated.asc())
+        .filter(window) \
+        .order_by(models.Annotation.updated.asc(), models.Annotation.id.asc())
+
+    annotations = query.all()
+    target_uris = uri.normalize_many(a.target_uri for a in annotations)
 
     ids = set()
-    for a in query:
-        normalized = uri.normalize(a.target_uri)
+    for a, normalized in zip(annotations, target_uris):
         if normalized != a.target_uri_normalized:
             a._target_uri_normalized = normalized
             ids.add(a.id)
@@ -133,14 +133,5 @@ def _reindex_annotations(request, ids):
             break
 
 
-def _fetch_windows(session, column, chunksize=100):
-    updated = session.query(column). \
-        execution_options(stream_results=True). \
-        order_by(column.desc()).all()
-
-    count = len(updated)
-    windows = [Window(start=updated[min(x+chunksize, count)-1].updated,
-                      end=updated[x].updated)
-               for x in xrange(0, count, chunksize)]
-
-    return windows
+def _fetch_windows(session, model, chunksize=100):
+    return keyset_windows(session, (model.updated, model.id), windowsize=chunksize)
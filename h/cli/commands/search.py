@@ -1,11 +1,14 @@
 # -*- coding: utf-8 -*-
 
+import datetime
 import os
 
 import click
 
 from h import indexer
+from h.indexer.reindexer import WRITERS
 from h.search import config
+from h.search.index import ES_CHUNK_SIZE
 
 
 @click.group()
@@ -14,16 +17,87 @@ def search():
 
 
 @search.command()
+@click.option('--workers', type=int, default=1, show_default=True,
+              help='The number of processes to index with.')
+@click.option('--chunk-size', type=int, default=ES_CHUNK_SIZE, show_default=True,
+              help='The number of annotations per Elasticsearch bulk request.')
+@click.option('--writers', type=int, default=WRITERS, show_default=True,
+              help='The number of threads per process sending bulk requests '
+                   'while annotations are read from the database.')
 @click.pass_context
-def reindex(ctx):
+def reindex(ctx, workers, chunk_size, writers):
     """
     Reindex all annotations in all clusters.
 
     Creates a new search index from the data in PostgreSQL and atomically
     updates the index alias. This requires that the index is aliased already,
     and will raise an error if it is not.
+
+    If a previous reindex was interrupted, this resumes it.
     """
-    _reindex_old(ctx)
+    _reindex_old(ctx, workers, chunk_size, writers)
+
+
+@search.command()
+@click.option('--since', metavar='TIMESTAMP',
+              help='Reindex annotations changed since this UTC time, for '
+                   'example 2018-04-01T12:00:00. Defaults to when the last '
+                   'catch up ran.')
+@click.pass_context
+def catchup(ctx, since):
+    """
+    Reindex annotations changed since a given time.
+
+    Writes annotations updated or deleted since --since, or since the last
+    catch up, to the search index. Use this to recover from lost indexing
+    jobs or a search outage without a full reindex.
+    """
+    if since is not None:
+        since = _parse_timestamp(since)
+
+    request = ctx.obj['bootstrap']()
+
+    count, errored = indexer.catchup(request.db, request.es, request, since=since)
+    request.tm.commit()
+
+    click.echo('Reindexed {:d} annotations.'.format(count))
+    if errored:
+        raise click.ClickException('failed to reindex {:d} annotations'.format(len(errored)))
+
+
+@search.command()
+@click.option('--workers', type=int, default=1, show_default=True,
+              help='The number of processes to compare with.')
+@click.option('--fix', is_flag=True, default=False,
+              help='Reindex missing and stale annotations, and mark orphaned '
+                   'annotations as deleted.')
+@click.pass_context
+def verify(ctx, workers, fix):
+    """
+    Compare the search index with the database.
+
+    Reports annotations which are missing from the search index, whose
+    indexed copy is out of date (stale), or which are indexed but have been
+    deleted from the database (orphaned).
+    """
+    request = ctx.obj['bootstrap']()
+
+    report = indexer.verify(request.db, request.es, request,
+                            workers=workers,
+                            fix=fix,
+                            bootstrap=ctx.obj['bootstrap'])
+
+    click.echo('Checked {:d} annotations.'.format(report.checked))
+    for kind in ('missing', 'stale', 'orphaned'):
+        count = getattr(report, kind)
+        examples = report.examples[kind]
+        line = '{}: {:d}'.format(kind.capitalize(), count)
+        if examples:
+            line += ' (e.g. {})'.format(', '.join(examples))
+        click.echo(line)
+
+    if not report.ok and not fix:
+        raise click.ClickException('the search index is inconsistent')
 
 
 @search.command('update-settings')
@@ -39,7 +113,7 @@ def update_settings(ctx):
     _update_settings_old(ctx)
 
 
-def _reindex_old(ctx):
+def _reindex_old(ctx, workers=1, chunk_size=ES_CHUNK_SIZE, writers=WRITERS):
     """
     Reindex all annotations in the old cluster.
 
@@ -52,7 +126,11 @@ def _reindex_old(ctx):
 
     request = ctx.obj['bootstrap']()
 
-    indexer.reindex(request.db, request.es, request)
+    indexer.reindex(request.db, request.es, request,
+                    workers=workers,
+                    chunk_size=chunk_size,
+                    writers=writers,
+                    bootstrap=ctx.obj['bootstrap'])
 
 
 def _update_settings_old(ctx):
@@ -70,3 +148,13 @@ def _update_settings_old(ctx):
         config.update_index_settings(request.es)
     except RuntimeError as e:
         raise click.ClickException(str(e))
+
+
+def _parse_timestamp(value):
+    for fmt in ('%Y-%m-%dT%H:%M:%S', '%Y-%m-%dT%H:%M', '%Y-%m-%d'):
+        try:
+            return datetime.datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+    raise click.BadParameter('expected a time like 2018-04-01T12:00:00',
+                             param_hint='--since')
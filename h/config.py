@@ -92,10 +92,21 @@ def configure(environ=None, settings=None):
     # Where should logged-out users visiting the homepage be redirected?
     settings_manager.set('h.homepage_redirect_url', 'HOMEPAGE_REDIRECT_URL')
     settings_manager.set('h.proxy_auth', 'PROXY_AUTH', type_=asbool)
+    # How long (in seconds) to cache the results of anonymous searches for,
+    # and how many to cache in each process. Unset to disable the cache.
+    settings_manager.set('h.search.result_cache_ttl', 'SEARCH_RESULT_CACHE_TTL', type_=float)
+    settings_manager.set('h.search.result_cache_size', 'SEARCH_RESULT_CACHE_SIZE', type_=int)
     # Sentry DSNs for frontend code should be of the public kind, lacking the
     # password component in the DSN URI.
     settings_manager.set('h.sentry_dsn_client', 'SENTRY_DSN_CLIENT')
     settings_manager.set('h.sentry_dsn_frontend', 'SENTRY_DSN_FRONTEND')
+    # Number of worker greenlets handling websocket control messages in each
+    # streamer process.
+    settings_manager.set('h.streamer.control_workers', 'STREAMER_CONTROL_WORKERS', type_=int)
+    # Maximum number of annotation events the streamer handles together, and
+    # how long (in seconds) to wait for a batch to fill.
+    settings_manager.set('h.streamer.batch_size', 'STREAMER_BATCH_SIZE', type_=int)
+    settings_manager.set('h.streamer.batch_wait', 'STREAMER_BATCH_WAIT', type_=float)
     settings_manager.set('h.websocket_url', 'WEBSOCKET_URL')
 
     # Debug/development settings
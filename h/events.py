@@ -25,3 +25,21 @@ class AnnotationTransformEvent(object):
         self.request = request
         self.annotation = annotation
         self.annotation_dict = annotation_dict
+
+
+class AnnotationBatchTransformEvent(object):
+
+    """
+    An event fired before a batch of annotations is bulk reindexed.
+
+    This is the batch equivalent of :py:class:`AnnotationTransformEvent`. It
+    is fired by :py:meth:`h.search.index.BatchIndexer.export_window`, which
+    doesn't load annotations as ORM objects, instead of an
+    :py:class:`AnnotationTransformEvent` per annotation. Subscribers which
+    transform annotations before they are indexed must opt in to this event
+    too if they should be applied when reindexing.
+    """
+
+    def __init__(self, request, annotation_dicts):
+        self.request = request
+        self.annotation_dicts = annotation_dicts
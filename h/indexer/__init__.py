@@ -1,13 +1,20 @@
 # -*- coding: utf-8 -*-
 
 from __future__ import unicode_literals
+from h.indexer.catchup import catchup
 from h.indexer.reindexer import reindex
+from h.indexer.verifier import verify
 
 __all__ = (
+    'catchup',
     'reindex',
+    'verify',
 )
 
 
 def includeme(config):
     config.add_subscriber('h.indexer.subscribers.subscribe_annotation_event',
                           'h.events.AnnotationEvent')
+    config.add_request_method('h.indexer.batch.IndexBatch',
+                              name='index_batch',
+                              reify=True)
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+import datetime
+
+from h.tasks.indexer import TIME_FORMAT, add_annotations
+
+#: The maximum number of annotation IDs to send in a single indexer task.
+BATCH_SIZE = 1000
+
+#: The number of seconds to wait before indexing a batch. Annotations which
+#: are written again by another request within this time are only indexed by
+#: the later request's batch.
+COLLECT_WINDOW = 2
+
+
+class IndexBatch(object):
+    """
+    Coalesces the annotations that a request asks to be indexed.
+
+    Annotation IDs are collected for the duration of the request and, once
+    it has finished, sent to the indexer in batches of at most
+    :py:data:`BATCH_SIZE` deduplicated IDs. Each batch is indexed using the
+    Elasticsearch bulk API.
+
+    Batches are indexed :py:data:`COLLECT_WINDOW` seconds after they are
+    enqueued, and skip annotations which were written again in the meantime,
+    so an annotation which several requests write in quick succession is only
+    indexed by the last of them. The thread root of a reply is still
+    reindexed once per request that replies to it.
+    """
+
+    def __init__(self, request):
+        self.ids = set()
+
+        request.add_finished_callback(self.finished_callback)
+
+    def add(self, annotation_id):
+        """Index the annotation with the given ID once the request finishes."""
+        self.ids.add(annotation_id)
+
+    def flush(self):
+        """Enqueue indexer tasks for all annotations added so far."""
+        ids = sorted(self.ids)
+        self.ids.clear()
+        queued = datetime.datetime.utcnow().strftime(TIME_FORMAT)
+
+        for i in range(0, len(ids), BATCH_SIZE):
+            add_annotations.apply_async((ids[i:i + BATCH_SIZE],),
+                                        {'queued': queued},
+                                        countdown=COLLECT_WINDOW)
+
+    def finished_callback(self, request):
+        self.flush()
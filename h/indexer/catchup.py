@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+import datetime
+import logging
+
+from h import models
+from h.indexer.reindexer import SETTING_NEW_INDEX
+from h.search.index import BatchIndexer, PG_WINDOW_SIZE
+from h.util.query import keyset_windows
+
+log = logging.getLogger(__name__)
+
+#: The time up to which the search index was last caught up
+SETTING_CHECKPOINT = 'catchup.checkpoint'
+
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+# Annotations are timestamped when they are flushed, but may not be visible
+# until their transaction commits a little later, so each run starts a little
+# before the previous one's start time.
+OVERLAP = datetime.timedelta(minutes=5)
+
+
+def catchup(session, es, request, since=None):
+    """
+    Reindex the annotations which have changed since the last catch up.
+
+    Every annotation updated or deleted since `since` (or, if that isn't
+    given, since the checkpoint recorded by the previous catch up) is written
+    to the search index, and to the new index if a reindex is running. The
+    checkpoint is then advanced to the time this catch up started, unless
+    any annotations failed to be reindexed.
+
+    Deleted annotations are only caught up until they are purged from the
+    database.
+
+    If there is no checkpoint and `since` isn't given, nothing is reindexed
+    and the checkpoint is set, so that later catch ups have somewhere to
+    start from.
+
+    :param since: reindex annotations updated at or after this time
+    :type since: datetime.datetime
+
+    :returns: the number of annotations reindexed and the set of ids which
+        failed to be reindexed
+    :rtype: tuple
+    """
+    settings = request.find_service(name='settings')
+    started = datetime.datetime.utcnow()
+
+    if since is None:
+        checkpoint = settings.get(SETTING_CHECKPOINT)
+        if checkpoint is not None:
+            since = datetime.datetime.strptime(checkpoint, TIME_FORMAT) - OVERLAP
+
+    count = 0
+    errored = set()
+    if since is not None:
+        target_indexes = [None]
+        new_index = settings.get(SETTING_NEW_INDEX)
+        if new_index is not None:
+            target_indexes.append(new_index)
+
+        indexers = [BatchIndexer(session, es, request, target_index=target_index)
+                    for target_index in target_indexes]
+        for ids, deleted_ids in _changed_annotations(session, since):
+            for indexer in indexers:
+                if ids:
+                    errored.update(indexer.index(ids))
+                if deleted_ids:
+                    errored.update(indexer.delete(deleted_ids))
+            count += len(ids) + len(deleted_ids)
+
+        log.info('caught up {:d} annotations changed since {}'.format(count, since))
+
+    # Leave the checkpoint where it is if anything failed, so that the next
+    # catch up tries again.
+    if errored:
+        log.warning('failed to catch up {:d} annotations: {!r}'.format(
+            len(errored), errored))
+    else:
+        settings.put(SETTING_CHECKPOINT, started.strftime(TIME_FORMAT))
+
+    return count, errored
+
+
+def _changed_annotations(session, since):
+    """
+    Yield the ids of annotations updated since `since`, a window at a time.
+
+    Each window is a pair of lists: the ids of live annotations and the ids of
+    deleted annotations.
+    """
+    updated = models.Annotation.updated
+    changed = updated >= since
+    windows = keyset_windows(session,
+                             (updated, models.Annotation.id),
+                             windowsize=PG_WINDOW_SIZE,
+                             where=changed)
+
+    for window in windows:
+        ids = []
+        deleted_ids = []
+        query = session.query(models.Annotation.id, models.Annotation.deleted) \
+                       .filter(changed) \
+                       .filter(window)
+        for id_, deleted in query:
+            if deleted:
+                deleted_ids.append(id_)
+            else:
+                ids.append(id_)
+        yield ids, deleted_ids
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""Run bulk indexing jobs in a pool of worker processes."""
+
+from __future__ import unicode_literals
+import multiprocessing
+
+# The request used by each process in a worker pool.
+_worker_request = None
+
+
+def imap_unordered(func, jobs, session, es, request, workers=1, bootstrap=None):
+    """
+    Call ``func(session, es, request, *job)`` for each of `jobs`.
+
+    Yields the results as the jobs complete, which is not necessarily in the
+    order of `jobs`. With one worker, the jobs are run in this process using
+    the given `session`, `es` client and `request`. Otherwise they are shared
+    across a pool of `workers` processes, each of which calls `bootstrap`
+    once to get a request of its own, and uses that request's session and
+    Elasticsearch client.
+
+    :param func: a module-level function, so that it can be sent to workers
+    :param jobs: a list of tuples of extra arguments to `func`
+    :param bootstrap: a callable returning a new request. Required if
+        `workers` is more than one.
+    """
+    if workers <= 1:
+        for job in jobs:
+            yield func(session, es, request, *job)
+        return
+
+    if bootstrap is None:
+        raise ValueError('running multiple workers requires bootstrap')
+
+    pool = multiprocessing.Pool(workers, _init_worker, (bootstrap,))
+    try:
+        calls = [(func, job) for job in jobs]
+        for result in pool.imap_unordered(_call_in_worker, calls):
+            yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def _init_worker(bootstrap):
+    global _worker_request
+    _worker_request = bootstrap()
+
+
+def _call_in_worker(call):
+    func, job = call
+    request = _worker_request
+    return func(request.db, request.es, request, *job)
@@ -1,48 +1,213 @@
 # -*- coding: utf-8 -*-
 
-from __future__ import unicode_literals
+from __future__ import division, unicode_literals
+import datetime
+import json
 import logging
+import time
 
+from h.indexer import pool
 from h.search.config import (
     configure_index,
     get_aliased_index,
     update_aliased_index,
 )
-from h.search.index import BatchIndexer
+from h.search.index import (
+    BatchIndexer,
+    ES_CHUNK_SIZE,
+    Window,
+    annotation_windows,
+)
+from h.util.cache import LRUCache
 
 log = logging.getLogger(__name__)
 
 SETTING_NEW_INDEX = 'reindex.new_index'
 
+#: The windows into which a running reindex has split the annotations
+SETTING_WINDOWS = 'reindex.windows'
+
+#: Which of those windows have been indexed so far
+SETTING_PROGRESS = 'reindex.progress'
+
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+#: The default number of threads per worker sending bulk requests
+WRITERS = 2
+
+#: How long (in seconds) processes may remember which index a reindex is
+#: writing to. A new reindex waits this long before it starts, so that every
+#: process is writing new annotations to the new index by then.
+NEW_INDEX_CACHE_TTL = 30
+
+#: A process-wide cache of the name of the index being reindexed into, so that
+#: indexer tasks don't need to look it up in the database every time.
+new_index_cache = LRUCache(maxsize=1, ttl=NEW_INDEX_CACHE_TTL)
+
+_MISSING = object()
+
+
+def current_new_index(settings):
+    """
+    Return the name of the index that a running reindex is writing to.
+
+    The name is cached for up to :py:data:`NEW_INDEX_CACHE_TTL` seconds.
 
-def reindex(session, es, request):
-    """Reindex all annotations into a new index, and update the alias."""
+    :param settings: the settings service
+    :returns: the index name, or ``None`` if no reindex is running
+    """
+    new_index = new_index_cache.get(SETTING_NEW_INDEX, _MISSING)
+    if new_index is _MISSING:
+        new_index = settings.get(SETTING_NEW_INDEX)
+        new_index_cache.set(SETTING_NEW_INDEX, new_index)
+    return new_index
+
+
+def reindex(session, es, request, workers=1, chunk_size=ES_CHUNK_SIZE, bootstrap=None,
+            writers=WRITERS):
+    """
+    Reindex all annotations into a new index, and update the alias.
+
+    The annotations are split into windows by the time they were last
+    updated, and the windows are indexed by a pool of `workers` processes.
+    Progress is recorded through the settings service after each window, so
+    if a reindex is interrupted, running it again resumes where it stopped.
+
+    :param workers: the number of worker processes to index with
+    :param chunk_size: the number of annotations per Elasticsearch bulk request
+    :param writers: the number of threads in each worker process sending bulk
+        requests while annotations are read from the database
+    :param bootstrap: a callable returning a new request for each worker
+        process to use. Required if `workers` is more than one.
+    """
 
     if get_aliased_index(es) is None:
         raise RuntimeError('cannot reindex if current index is not aliased')
 
+    if workers > 1 and bootstrap is None:
+        raise ValueError('reindexing with multiple workers requires bootstrap')
+
     settings = request.find_service(name='settings')
 
-    new_index = configure_index(es)
+    new_index, windows, done = _resume(settings)
+    if new_index is None:
+        new_index = configure_index(es)
+        windows = annotation_windows(session)
+        done = set()
 
-    try:
         settings.put(SETTING_NEW_INDEX, new_index)
+        settings.put(SETTING_WINDOWS, _dump_windows(new_index, windows))
+        settings.put(SETTING_PROGRESS, _dump_progress(done))
         request.tm.commit()
+        new_index_cache.clear()
 
-        indexer = BatchIndexer(session, es, request, target_index=new_index, op_type='create')
+        # Give processes which have cached the absence of a reindex time to
+        # notice this one, so that annotations written from now on are written
+        # to the new index too. Annotations written in the meantime are still
+        # picked up from the database by the windows below.
+        log.info('waiting {}s for indexers to start writing to {}'.format(
+            NEW_INDEX_CACHE_TTL, new_index))
+        time.sleep(NEW_INDEX_CACHE_TTL)
+    else:
+        log.info('resuming reindex into {}: {}/{} windows already indexed'.format(
+            new_index, len(done), len(windows)))
 
-        errored = indexer.index()
-        if errored:
-            log.debug('failed to index {} annotations, retrying...'.format(
-                len(errored)))
-            errored = indexer.index(errored)
-            if errored:
-                log.warn('failed to index {} annotations: {!r}'.format(
-                    len(errored),
-                    errored))
-
-        update_aliased_index(es, new_index)
-
-    finally:
-        settings.delete(SETTING_NEW_INDEX)
+    jobs = [(new_index, i, window, chunk_size, writers)
+            for i, window in enumerate(windows) if i not in done]
+
+    # If this reindex is interrupted, the settings above are kept so that
+    # running it again resumes it, and so that new annotations continue to be
+    # written to the new index in the meantime.
+    errored = set()
+    indexed = 0
+    started = time.time()
+    results = pool.imap_unordered(_index_window, jobs, session, es, request,
+                                  workers=workers, bootstrap=bootstrap)
+    for i, count, window_errored in results:
+        done.add(i)
+        settings.put(SETTING_PROGRESS, _dump_progress(done))
         request.tm.commit()
+
+        errored.update(window_errored)
+        indexed += count
+        log.info('indexed {}/{} windows, {:d} annotations, rate={:.0f}/s'.format(
+            len(done), len(windows), indexed, indexed / max(time.time() - started, 1e-6)))
+
+    if errored:
+        log.debug('failed to index {} annotations, retrying...'.format(
+            len(errored)))
+        indexer = BatchIndexer(session, es, request, target_index=new_index,
+                               op_type='create', chunk_size=chunk_size)
+        errored = indexer.index(errored)
+        if errored:
+            log.warn('failed to index {} annotations: {!r}'.format(
+                len(errored),
+                errored))
+
+    update_aliased_index(es, new_index)
+
+    settings.delete(SETTING_NEW_INDEX)
+    settings.delete(SETTING_WINDOWS)
+    settings.delete(SETTING_PROGRESS)
+    request.tm.commit()
+    new_index_cache.clear()
+
+
+def _index_window(session, es, request, index_name, i, window, chunk_size, writers):
+    request.tm.begin()
+    indexer = BatchIndexer(session, es, request,
+                           target_index=index_name,
+                           op_type='create',
+                           chunk_size=chunk_size,
+                           writers=writers)
+    errored = indexer.export_window(window)
+    request.tm.commit()
+    return i, indexer.indexed, errored
+
+
+def _resume(settings):
+    """Return the index, windows and progress of an interrupted reindex."""
+    new_index = settings.get(SETTING_NEW_INDEX)
+    windows = settings.get(SETTING_WINDOWS)
+    progress = settings.get(SETTING_PROGRESS)
+    if new_index is None or windows is None or progress is None:
+        return None, None, None
+
+    windows = json.loads(windows)
+    if windows['index'] != new_index:
+        return None, None, None
+
+    starts = [_parse_time(start) for start in windows['starts']]
+    ends = starts[1:] + [None]
+    return (new_index,
+            [Window(start, end) for start, end in zip(starts, ends)],
+            _load_progress(progress))
+
+
+def _dump_windows(index_name, windows):
+    return json.dumps({'index': index_name,
+                       'starts': [w.start.strftime(TIME_FORMAT) for w in windows]})
+
+
+def _dump_progress(done):
+    """
+    Serialize the set of indexed windows.
+
+    Windows are indexed roughly in order, so this is stored compactly as the
+    number of windows indexed without a gap, followed by any windows above
+    that which have also been indexed.
+    """
+    below = 0
+    while below in done:
+        below += 1
+    return json.dumps({'below': below,
+                       'done': sorted(i for i in done if i > below)})
+
+
+def _load_progress(progress):
+    progress = json.loads(progress)
+    return set(range(progress['below'])) | set(progress['done'])
+
+
+def _parse_time(value):
+    return datetime.datetime.strptime(value, TIME_FORMAT)
@@ -1,11 +1,11 @@
 # -*- coding: utf-8 -*-
 
 from __future__ import unicode_literals
-from h.tasks.indexer import add_annotation, delete_annotation
+from h.tasks.indexer import delete_annotation
 
 
 def subscribe_annotation_event(event):
     if event.action in ['create', 'update']:
-        add_annotation.delay(event.annotation_id)
+        event.request.index_batch.add(event.annotation_id)
     elif event.action == 'delete':
         delete_annotation.delay(event.annotation_id)
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""Find annotations which are missing from or out of date in the search index."""
+
+from __future__ import unicode_literals
+import logging
+
+import sqlalchemy as sa
+from elasticsearch1 import helpers as es_helpers
+
+from h import models
+from h.db import types
+from h.indexer import pool
+from h.search.index import (
+    BatchIndexer,
+    ES_CHUNK_SIZE,
+    PG_WINDOW_SIZE,
+    annotation_windows,
+)
+from h.util.datetime import utc_iso8601
+
+log = logging.getLogger(__name__)
+
+#: The number of example IDs of each kind of problem to report
+EXAMPLES = 10
+
+
+class Report(object):
+    """The differences found between Postgres and the search index."""
+
+    def __init__(self):
+        #: The number of annotations compared
+        self.checked = 0
+
+        #: Annotations which aren't in the index, or are marked deleted there
+        self.missing = 0
+
+        #: Annotations whose indexed ``updated`` time differs from Postgres
+        self.stale = 0
+
+        #: Indexed annotations which are deleted from Postgres
+        self.orphaned = 0
+
+        #: Some IDs of each kind of problem, by kind
+        self.examples = {'missing': [], 'stale': [], 'orphaned': []}
+
+    @property
+    def ok(self):
+        return not (self.missing or self.stale or self.orphaned)
+
+    def add(self, kind, ids):
+        setattr(self, kind, getattr(self, kind) + len(ids))
+        examples = self.examples[kind]
+        examples.extend(sorted(ids)[:EXAMPLES - len(examples)])
+
+
+def verify(session, es, request, workers=1, fix=False, bootstrap=None):
+    """
+    Compare the annotations in Postgres with those in the search index.
+
+    Postgres is scanned a window of annotations at a time, and each window is
+    compared with the index using one ``_mget`` request. The windows are
+    shared across a pool of `workers` processes. The index is then scrolled
+    through to find indexed annotations which no longer exist. Only counts
+    and a few examples of each problem are kept, so memory use is bounded.
+
+    :param workers: the number of worker processes to compare with
+    :param fix: whether to reindex missing and stale annotations, and mark
+        orphaned annotations as deleted in the index
+    :param bootstrap: a callable returning a new request for each worker
+        process to use. Required if `workers` is more than one.
+
+    :rtype: h.indexer.verifier.Report
+    """
+    report = Report()
+
+    jobs = [(window, fix) for window in annotation_windows(session)]
+    results = pool.imap_unordered(_verify_window, jobs, session, es, request,
+                                  workers=workers, bootstrap=bootstrap)
+    for checked, missing, stale in results:
+        report.checked += checked
+        report.add('missing', missing)
+        report.add('stale', stale)
+        log.info('verified {:d} annotations'.format(report.checked))
+
+    for orphaned in _orphaned_annotations(session, es):
+        report.add('orphaned', orphaned)
+        if fix:
+            BatchIndexer(session, es, request).delete(orphaned)
+
+    return report
+
+
+def _verify_window(session, es, request, window, fix):
+    """Compare the annotations last updated within `window` with the index."""
+    updated = models.Annotation.updated
+    query = session.query(models.Annotation.id, updated) \
+                   .filter(sa.not_(models.Annotation.deleted)) \
+                   .filter(updated >= window.start)
+    if window.end is not None:
+        query = query.filter(updated < window.end)
+    expected = {id_: utc_iso8601(updated) for id_, updated in query}
+
+    missing = []
+    stale = []
+    if expected:
+        response = es.conn.mget(body={'ids': list(expected)},
+                                index=es.index,
+                                doc_type=es.t.annotation,
+                                _source_include=['updated', 'deleted'])
+        for doc in response['docs']:
+            source = doc.get('_source', {})
+            if not doc.get('found') or source.get('deleted'):
+                missing.append(doc['_id'])
+            elif source.get('updated') != expected[doc['_id']]:
+                stale.append(doc['_id'])
+
+    if fix and (missing or stale):
+        errored = BatchIndexer(session, es, request).index(missing + stale)
+        if errored:
+            log.warning('failed to reindex {:d} annotations'.format(len(errored)))
+
+    return len(expected), missing, stale
+
+
+def _orphaned_annotations(session, es):
+    """
+    Yield batches of the IDs of indexed annotations deleted from Postgres.
+
+    Annotations marked as deleted in the index aren't orphaned.
+    """
+    hits = es_helpers.scan(es.conn,
+                           index=es.index,
+                           doc_type=es.t.annotation,
+                           query={'query': {'filtered': {'filter': {
+                               'bool': {'must_not': {'exists': {'field': 'deleted'}}}}}}},
+                           size=ES_CHUNK_SIZE,
+                           _source=False)
+
+    batch = []
+    for hit in hits:
+        batch.append(hit['_id'])
+        if len(batch) >= PG_WINDOW_SIZE:
+            orphaned = _not_in_postgres(session, batch)
+            if orphaned:
+                yield orphaned
+            batch = []
+
+    orphaned = _not_in_postgres(session, batch)
+    if orphaned:
+        yield orphaned
+
+
+def _not_in_postgres(session, ids):
+    """
+    Return the `ids` which aren't annotations in Postgres.
+
+    IDs which aren't valid annotation IDs can't be in Postgres, so they're
+    always returned.
+    """
+    id_type = types.URLSafeUUID()
+    valid_ids = []
+    for id_ in ids:
+        try:
+            id_type.process_bind_param(id_, None)
+        except types.InvalidUUID:
+            continue
+        valid_ids.append(id_)
+
+    found = set()
+    if valid_ids:
+        query = session.query(models.Annotation.id) \
+                       .filter(sa.not_(models.Annotation.deleted)) \
+                       .filter(models.Annotation.id.in_(valid_ids))
+        found = set(id_ for id_, in query)
+    return [id_ for id_ in ids if id_ not in found]
@@ -6,8 +6,15 @@ Provides links to different representations of annotations.
 from __future__ import unicode_literals
 
 
+from pyramid.traversal import PATH_SAFE, quote_path_segment
+
 from h._compat import urlparse, url_unquote
 
+# A stand-in for an annotation ID, used to generate a URL template for a route
+# once per request rather than routing every annotation's URL separately.
+_ID_PLACEHOLDER = 'h-links-annotation-id'
+_URL_TEMPLATES_KEY = 'h.links.url_templates'
+
 
 def pretty_link(url):
     """
@@ -32,7 +39,7 @@ def html_link(request, annotation):
         # We don't currently support HTML representations of third party
         # annotations.
         return None
-    return request.route_url('annotation', id=annotation.id)
+    return _annotation_url(request, 'annotation', annotation.id)
 
 
 def incontext_link(request, annotation):
@@ -58,11 +65,31 @@ def incontext_link(request, annotation):
 
 
 def json_link(request, annotation):
-    return request.route_url('api.annotation', id=annotation.id)
+    return _annotation_url(request, 'api.annotation', annotation.id)
 
 
 def jsonld_id_link(request, annotation):
-    return request.route_url('annotation', id=annotation.id)
+    return _annotation_url(request, 'annotation', annotation.id)
+
+
+def _annotation_url(request, route_name, annotation_id):
+    """
+    Return the URL of the route `route_name` for the given annotation ID.
+
+    This is equivalent to ``request.route_url(route_name, id=annotation_id)``,
+    but the route is only generated once per request, and the ID substituted
+    into the result, which matters when rendering many annotations at once.
+    """
+    templates = request.environ.setdefault(_URL_TEMPLATES_KEY, {})
+    template = templates.get(route_name)
+    if template is None:
+        url = request.route_url(route_name, id=_ID_PLACEHOLDER)
+        template = templates[route_name] = url.rpartition(_ID_PLACEHOLDER)
+    prefix, placeholder, suffix = template
+    if not placeholder:
+        # The ID doesn't appear verbatim in this route's URLs.
+        return request.route_url(route_name, id=annotation_id)
+    return prefix + quote_path_segment(annotation_id, safe=PATH_SAFE) + suffix
 
 
 def includeme(config):
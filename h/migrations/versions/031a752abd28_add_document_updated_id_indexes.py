@@ -0,0 +1,31 @@
+"""
+Add document URI and metadata (updated, id) indexes
+
+The normalize-uris command reads document URIs and metadata in windows found
+by seeking on (updated, id), see h.util.query.keyset_windows. Without these
+indexes, finding each window reads every row before it.
+"""
+
+from __future__ import unicode_literals
+
+from alembic import op
+
+
+revision = '031a752abd28'
+down_revision = '3db06b5c806d'
+
+
+def upgrade():
+    # Creating a concurrent index does not work inside a transaction
+    op.execute('COMMIT')
+    op.create_index('ix__document_uri_updated_id', 'document_uri',
+                    ['updated', 'id'],
+                    postgresql_concurrently=True)
+    op.create_index('ix__document_meta_updated_id', 'document_meta',
+                    ['updated', 'id'],
+                    postgresql_concurrently=True)
+
+
+def downgrade():
+    op.drop_index('ix__document_meta_updated_id', 'document_meta')
+    op.drop_index('ix__document_uri_updated_id', 'document_uri')
@@ -0,0 +1,31 @@
+"""
+Add annotation group and user export indexes
+
+Exports of a group's or a user's annotations are read in (updated, id) order,
+see h.services.annotation_export. These indexes let them be read in that order
+without sorting all of the group's or user's annotations first.
+"""
+
+from __future__ import unicode_literals
+
+from alembic import op
+
+
+revision = '3db06b5c806d'
+down_revision = 'd89f54ef124a'
+
+
+def upgrade():
+    # Creating a concurrent index does not work inside a transaction
+    op.execute('COMMIT')
+    op.create_index('ix__annotation_groupid_updated_id', 'annotation',
+                    ['groupid', 'updated', 'id'],
+                    postgresql_concurrently=True)
+    op.create_index('ix__annotation_userid_updated_id', 'annotation',
+                    ['userid', 'updated', 'id'],
+                    postgresql_concurrently=True)
+
+
+def downgrade():
+    op.drop_index('ix__annotation_userid_updated_id', 'annotation')
+    op.drop_index('ix__annotation_groupid_updated_id', 'annotation')
@@ -0,0 +1,26 @@
+"""
+Add annotation updated and id index
+
+Windows over the annotation table are found by seeking on (updated, id), see
+h.util.query.keyset_windows. Without an index on both columns, finding each
+window has to sort every remaining annotation.
+"""
+
+from __future__ import unicode_literals
+
+from alembic import op
+
+
+revision = 'd89f54ef124a'
+down_revision = '178270e3ee58'
+
+
+def upgrade():
+    # Creating a concurrent index does not work inside a transaction
+    op.execute('COMMIT')
+    op.create_index('ix__annotation_updated_id', 'annotation', ['updated', 'id'],
+                    postgresql_concurrently=True)
+
+
+def downgrade():
+    op.drop_index('ix__annotation_updated_id', 'annotation')
@@ -29,6 +29,13 @@ class Annotation(Base):
         #
         sa.Index('ix__annotation_tags', 'tags', postgresql_using='gin'),
         sa.Index('ix__annotation_updated', 'updated'),
+        # Windows over all annotations are found by seeking on (updated, id),
+        # see h.util.query.keyset_windows.
+        sa.Index('ix__annotation_updated_id', 'updated', 'id'),
+        # Exports of a group's or a user's annotations are read in the same
+        # order, see h.services.annotation_export.
+        sa.Index('ix__annotation_groupid_updated_id', 'groupid', 'updated', 'id'),
+        sa.Index('ix__annotation_userid_updated_id', 'userid', 'updated', 'id'),
 
         # This is a functional index on the *first* of the annotation's
         # references, pointing to the top-level annotation it refers to. We're
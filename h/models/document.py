@@ -13,10 +13,19 @@ from sqlalchemy.ext.hybrid import hybrid_property
 from h._compat import urlparse
 from h.db import Base, mixins
 from h.models.annotation import Annotation
+from h.util.cache import LRUCache
 from h.util.uri import normalize as uri_normalize
+from h.util.uri import normalize_many as uri_normalize_many
 
 log = logging.getLogger(__name__)
 
+#: A process-wide cache of the URIs (and their types) of the document that
+#: each normalized URI belongs to, used to expand URIs in searches and
+#: streamer filters (see :py:func:`h.storage.expand_uri`). Entries are
+#: invalidated when this process changes a document's URIs, and expire after
+#: a minute so that changes made by other processes are seen eventually.
+uri_expansion_cache = LRUCache(maxsize=10000, ttl=60)
+
 
 class ConcurrentUpdateError(transaction.interfaces.TransientError):
     """Raised when concurrent updates to document data conflict."""
@@ -82,7 +91,7 @@ class Document(Base, mixins.Timestamps):
     @classmethod
     def find_by_uris(cls, session, uris):
         """Find documents by a list of uris."""
-        query_uris = [uri_normalize(u) for u in uris]
+        query_uris = uri_normalize_many(uris)
 
         matching_claims = (
             session.query(DocumentURI)
@@ -135,6 +144,9 @@ class DocumentURI(Base, mixins.Timestamps):
                             'content_type'),
         sa.Index('ix__document_uri_document_id', 'document_id'),
         sa.Index('ix__document_uri_updated', 'updated'),
+        # The normalize-uris command reads document URIs in windows found by
+        # seeking on (updated, id), see h.util.query.keyset_windows.
+        sa.Index('ix__document_uri_updated_id', 'updated', 'id'),
     )
 
     id = sa.Column(sa.Integer, autoincrement=True, primary_key=True)
@@ -203,6 +215,9 @@ class DocumentMeta(Base, mixins.Timestamps):
         sa.UniqueConstraint('claimant_normalized', 'type'),
         sa.Index('ix__document_meta_document_id', 'document_id'),
         sa.Index('ix__document_meta_updated', 'updated'),
+        # The normalize-uris command reads document metadata in windows found
+        # by seeking on (updated, id), see h.util.query.keyset_windows.
+        sa.Index('ix__document_meta_updated_id', 'updated', 'id'),
     )
 
     id = sa.Column(sa.Integer, autoincrement=True, primary_key=True)
@@ -431,6 +446,8 @@ def merge_documents(session, documents, updated=None):
     except sa.exc.IntegrityError:
         raise ConcurrentUpdateError('concurrent document merges')
 
+    _invalidate_uri_expansions(master)
+
     return master
 
 
@@ -506,4 +523,11 @@ def update_document_metadata(session,
             updated=updated,
             **document_meta_dict)
 
+    _invalidate_uri_expansions(document)
+
     return document
+
+
+def _invalidate_uri_expansions(document):
+    for document_uri in document.document_uris:
+        uri_expansion_cache.pop(document_uri.uri_normalized)
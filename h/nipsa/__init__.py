@@ -7,3 +7,5 @@ def includeme(config):
     # written into annotations on save.
     config.add_subscriber('h.nipsa.subscribers.transform_annotation',
                           'h.events.AnnotationTransformEvent')
+    config.add_subscriber('h.nipsa.subscribers.transform_annotations',
+                          'h.events.AnnotationBatchTransformEvent')
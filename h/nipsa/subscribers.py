@@ -15,6 +15,21 @@ def transform_annotation(event):
         payload['nipsa'] = True
 
 
+def transform_annotations(event):
+    """Add a {"nipsa": True} field on a batch of annotations, as above."""
+    payloads = event.annotation_dicts
+
+    moderation_service = event.request.find_service(name='annotation_moderation')
+    moderated = moderation_service.all_hidden([payload['id'] for payload in payloads])
+
+    for payload in payloads:
+        nipsa = _user_nipsa(event.request, payload)
+        nipsa = nipsa or payload['id'] in moderated
+
+        if nipsa:
+            payload['nipsa'] = True
+
+
 def _user_nipsa(request, payload):
     nipsa_service = request.find_service(name='nipsa')
     return 'user' in payload and nipsa_service.is_flagged(payload['user'])
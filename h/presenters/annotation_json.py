@@ -12,6 +12,10 @@ from h.formatters.interfaces import IAnnotationFormatter
 from h.presenters.annotation_base import AnnotationBasePresenter
 from h.presenters.document_json import DocumentJSONPresenter
 
+# The types of formatter known to implement IAnnotationFormatter. A presenter
+# is created for every annotation rendered, so each type is only verified once.
+_verified_formatter_types = set()
+
 
 class AnnotationJSONPresenter(AnnotationBasePresenter):
 
@@ -27,10 +31,12 @@ class AnnotationJSONPresenter(AnnotationBasePresenter):
                 self._add_formatter(formatter)
 
     def _add_formatter(self, formatter):
-        try:
-            verifyObject(IAnnotationFormatter, formatter)
-        except DoesNotImplement:
-            raise ValueError('formatter is not implementing IAnnotationFormatter interface')
+        if type(formatter) not in _verified_formatter_types:
+            try:
+                verifyObject(IAnnotationFormatter, formatter)
+            except DoesNotImplement:
+                raise ValueError('formatter is not implementing IAnnotationFormatter interface')
+            _verified_formatter_types.add(type(formatter))
 
         self._formatters.append(formatter)
 
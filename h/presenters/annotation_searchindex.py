@@ -9,9 +9,16 @@ from h.util.user import split_user
 
 class AnnotationSearchIndexPresenter(AnnotationBasePresenter):
 
-    """Present an annotation in the JSON format used in the search index."""
-    def __init__(self, annotation):
+    """
+    Present an annotation in the JSON format used in the search index.
+
+    The IDs of the replies in the annotation's thread may be given as
+    `thread_ids`, if they have already been loaded, to save loading them
+    through the annotation's ``thread`` relationship.
+    """
+    def __init__(self, annotation, thread_ids=None):
         self.annotation = annotation
+        self._thread_ids = thread_ids
 
     def asdict(self):
         docpresenter = DocumentSearchIndexPresenter(self.annotation.document)
@@ -32,7 +39,7 @@ class AnnotationSearchIndexPresenter(AnnotationBasePresenter):
             'shared': self.annotation.shared,
             'target': self.target,
             'document': docpresenter.asdict(),
-            'thread_ids': self.annotation.thread_ids
+            'thread_ids': self.thread_ids
         }
 
         result['target'][0]['scope'] = [self.annotation.target_uri_normalized]
@@ -42,6 +49,12 @@ class AnnotationSearchIndexPresenter(AnnotationBasePresenter):
 
         return result
 
+    @property
+    def thread_ids(self):
+        if self._thread_ids is None:
+            return self.annotation.thread_ids
+        return self._thread_ids
+
     @property
     def links(self):
         # The search index presenter has no need to generate links, and so the
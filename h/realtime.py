@@ -116,6 +116,10 @@ class Publisher(object):
         """Publish a user message with the routing key 'user'."""
         self._publish('user', payload)
 
+    def publish_nipsa(self, payload):
+        """Publish a NIPSA flag change with the routing key 'nipsa'."""
+        self._publish('nipsa', payload)
+
     def _publish(self, routing_key, payload):
         headers = {'timestamp': datetime.utcnow().isoformat() + 'Z'}
 
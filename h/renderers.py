@@ -2,11 +2,68 @@
 
 from __future__ import unicode_literals
 
+import json
+
 import pyramid.renderers
 
 
 json_sorted_factory = pyramid.renderers.JSON(sort_keys=True)
 
+#: The approximate size (in characters) of each chunk of a rendered NDJSON body
+NDJSON_CHUNK_SIZE = 64 * 1024
+
+
+class NDJSONRenderer(object):
+    """
+    A renderer for newline-delimited JSON.
+
+    A view callable using this renderer returns an iterable (usually a
+    generator), and each of its items is encoded as one line of the response
+    body as it is produced:
+
+        @view_config(renderer="ndjson", ...)
+        def my_view(request):
+            return (present(a) for a in annotations)
+
+    The items are consumed before the view's transaction ends, so that they
+    may use the database, and the whole encoded body (in chunks of about
+    ``NDJSON_CHUNK_SIZE`` characters) is held in memory until it is sent.
+    Views must therefore bound the number of items they return.
+
+    """
+    def __init__(self, info):
+        pass
+
+    def __call__(self, value, system):
+        request = system.get('request')
+
+        def default(obj):
+            if hasattr(obj, '__json__'):
+                return obj.__json__(request)
+            raise TypeError('{!r} is not JSON serializable'.format(obj))
+
+        body = []
+        pending = []
+        pending_size = 0
+        for item in value:
+            line = json.dumps(item, default=default) + '\n'
+            pending.append(line)
+            pending_size += len(line)
+            if pending_size >= NDJSON_CHUNK_SIZE:
+                body.append(''.join(pending).encode('utf-8'))
+                pending = []
+                pending_size = 0
+        if pending:
+            body.append(''.join(pending).encode('utf-8'))
+
+        if request is not None:
+            response = request.response
+            if response.content_type == response.default_content_type:
+                response.content_type = 'application/x-ndjson'
+            response.content_length = sum(len(chunk) for chunk in body)
+
+        return body
+
 
 class SVGRenderer(object):
     """
@@ -45,4 +102,5 @@ class SVGRenderer(object):
 
 def includeme(config):
     config.add_renderer(name='json_sorted', factory=json_sorted_factory)
+    config.add_renderer(name='ndjson', factory=NDJSONRenderer)
     config.add_renderer(name='svg', factory=SVGRenderer)
@@ -91,6 +91,7 @@ def includeme(config):
     config.add_route('api.index', '/api/')
     config.add_route('api.links', '/api/links')
     config.add_route('api.annotations', '/api/annotations')
+    config.add_route('api.annotations.batch', '/api/annotations/batch')
     config.add_route('api.annotation',
                      '/api/annotations/{id:[A-Za-z0-9_-]{20,22}}',
                      factory='h.traversal:AnnotationRoot',
@@ -114,6 +115,7 @@ def includeme(config):
                      factory='h.traversal.GroupRoot',
                      traverse='/{pubid}')
     config.add_route('api.search', '/api/search')
+    config.add_route('api.export', '/api/export')
     config.add_route('api.users', '/api/users')
     config.add_route('api.user', '/api/users/{username}')
     config.add_route('badge', '/api/badge')
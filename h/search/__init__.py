@@ -9,6 +9,7 @@ from h.search.query import TopLevelAnnotationsFilter
 from h.search.query import AuthorityFilter
 from h.search.query import TagsAggregation
 from h.search.query import UsersAggregation
+from h.search.result_cache import DEFAULT_MAXSIZE, ResultCache
 
 __all__ = (
     'Search',
@@ -49,3 +50,13 @@ def includeme(config):
         lambda r: r.registry['es.client'],
         name='es',
         reify=True)
+
+    # Optionally cache the results of anonymous searches for a short time.
+    # Settings from .ini files are strings, so they're converted here.
+    result_cache_ttl = float(settings.get('h.search.result_cache_ttl') or 0)
+    if result_cache_ttl:
+        maxsize = int(settings.get('h.search.result_cache_size', DEFAULT_MAXSIZE))
+        config.registry['search.result_cache'] = ResultCache(ttl=result_cache_ttl,
+                                                             maxsize=maxsize)
+        config.add_subscriber('h.search.subscribers.invalidate_result_cache',
+                              'h.events.AnnotationEvent')
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""Send Elasticsearch bulk requests concurrently with producing them."""
+
+from __future__ import unicode_literals
+
+import itertools
+import logging
+import threading
+import time
+
+from elasticsearch1.exceptions import TransportError
+
+from h._compat import queue
+
+log = logging.getLogger(__name__)
+
+#: How many times to retry actions which Elasticsearch rejected because it
+#: was too busy (with status 429), before giving up on them
+MAX_RETRIES = 5
+
+#: How long (in seconds) to wait before the first retry. Each further retry
+#: waits twice as long as the one before.
+INITIAL_BACKOFF = 1
+
+# Tells a writer thread that there are no more chunks, and tells the consumer
+# that a writer thread has finished.
+_DONE = object()
+
+
+def pipelined_bulk(client, actions, chunk_size, writers=1, queue_size=None,
+                   max_retries=MAX_RETRIES, initial_backoff=INITIAL_BACKOFF):
+    """
+    Send actions to Elasticsearch from a pool of writer threads.
+
+    This is like :py:func:`elasticsearch1.helpers.streaming_bulk`, except
+    that the bulk requests are sent by `writers` threads, each with its own
+    connection, while the calling thread carries on producing `actions`. So
+    reading annotations from the database and writing them to Elasticsearch
+    happen at the same time, rather than taking turns.
+
+    Chunks of actions wait for a writer in a queue of at most `queue_size`
+    chunks, so if Elasticsearch can't keep up, producing actions blocks until
+    it does. Actions which Elasticsearch rejects with status 429 (because its
+    own queues are full) are retried after a growing delay, which also holds
+    up the queue.
+
+    :param client: the Elasticsearch client
+    :type client: elasticsearch1.Elasticsearch
+    :param actions: an iterable of ``(action, data)`` tuples
+    :param chunk_size: the number of actions to send per bulk request
+    :param writers: the number of writer threads
+    :param queue_size: the number of chunks which may wait for a writer,
+        twice the number of writers by default
+
+    :returns: an iterator of ``(ok, item)`` tuples, as returned by
+        :py:func:`elasticsearch1.helpers.streaming_bulk` with
+        ``raise_on_error=False``, though not necessarily in the order of
+        `actions`
+    """
+    if queue_size is None:
+        queue_size = 2 * writers
+
+    chunks = queue.Queue(maxsize=queue_size)
+    results = queue.Queue()
+
+    threads = [threading.Thread(target=_write,
+                                args=(client, chunks, results,
+                                      max_retries, initial_backoff))
+               for _ in range(writers)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    actions = iter(actions)
+    try:
+        while True:
+            chunk = list(itertools.islice(actions, chunk_size))
+            if not chunk:
+                break
+            chunks.put(chunk)
+            for result in _ready(results):
+                yield result
+    finally:
+        for _ in threads:
+            chunks.put(_DONE)
+
+    finished = 0
+    while finished < writers:
+        sent = results.get()
+        if sent is _DONE:
+            finished += 1
+        else:
+            for result in sent:
+                yield result
+
+
+def _ready(results):
+    """Yield the results which the writer threads have finished so far."""
+    while True:
+        try:
+            sent = results.get_nowait()
+        except queue.Empty:
+            return
+        if sent is _DONE:
+            # A writer only finishes once it has been told to, which hasn't
+            # happened yet, so put this back for the final count.
+            results.put(sent)
+            return
+        for result in sent:
+            yield result
+
+
+def _write(client, chunks, results, max_retries, initial_backoff):
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is _DONE:
+                return
+            try:
+                results.put(_send(client, chunk, max_retries, initial_backoff))
+            except Exception as e:
+                log.exception('failed to send bulk request')
+                results.put([(False, _failure(action, e)) for action, _ in chunk])
+    finally:
+        results.put(_DONE)
+
+
+def _send(client, chunk, max_retries, initial_backoff):
+    """Send one chunk of actions, retrying any which are rejected with 429."""
+    serializer = client.transport.serializer
+    sent = []
+    for attempt in range(max_retries + 1):
+        can_retry = attempt < max_retries
+        body = []
+        for action, data in chunk:
+            body.append(serializer.dumps(action))
+            if data is not None:
+                body.append(serializer.dumps(data))
+
+        try:
+            response = client.bulk('\n'.join(body) + '\n')
+        except TransportError as e:
+            if e.status_code == 429 and can_retry:
+                _backoff(initial_backoff, attempt)
+                continue
+            return sent + [(False, _failure(action, e)) for action, _ in chunk]
+
+        rejected = []
+        for (action, data), item in zip(chunk, response['items']):
+            op_type, item = item.popitem()
+            status = item.get('status', 500)
+            if status == 429 and can_retry:
+                rejected.append((action, data))
+            else:
+                sent.append((200 <= status < 300, {op_type: item}))
+
+        if not rejected:
+            break
+        chunk = rejected
+        _backoff(initial_backoff, attempt)
+
+    return sent
+
+
+def _backoff(initial_backoff, attempt):
+    delay = initial_backoff * 2 ** attempt
+    log.warning('Elasticsearch is too busy, retrying in {}s'.format(delay))
+    time.sleep(delay)
+
+
+def _failure(action, exc):
+    op_type, action = next(iter(action.items()))
+    item = {'_id': action.get('_id'),
+            'error': str(exc),
+            'status': getattr(exc, 'status_code', 500)}
+    return {op_type: item}
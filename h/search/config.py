@@ -32,6 +32,11 @@ ANNOTATION_MAPPING = {
         'tags_raw': {'type': 'string', 'index': 'not_analyzed'},
         'text': {'type': 'string', 'analyzer': 'uni_normalizer'},
         'deleted': {'type': 'boolean'},
+        # Cursor paginated search results are sorted by id after the requested
+        # sort field, so that cursors can point between annotations which
+        # sort equally. doc_values keeps the sort values on disk rather than
+        # loading every id into the heap.
+        'id': {'type': 'string', 'index': 'not_analyzed', 'doc_values': True},
         'uri': {
             'type': 'string',
             'index_analyzer': 'uri',
@@ -1,20 +1,31 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
-import logging
 from collections import namedtuple
 from contextlib import contextmanager
 
 from elasticsearch1.exceptions import ConnectionTimeout
+from elasticsearch1.exceptions import TransportError
 
 from h.search import query
 
-log = logging.getLogger(__name__)
-
 SearchResult = namedtuple('SearchResult', [
     'total',
     'annotation_ids',
     'reply_ids',
-    'aggregations'])
+    'aggregations',
+    'reply_total',
+    'cursor'])
+# Results without a next page have no cursor.
+SearchResult.__new__.__defaults__ = (None,)
+
+# Search parameters for which replies can be prefetched (see
+# ``Search._search_with_replies``).
+PREFETCH_PARAMS = frozenset(['uri', 'url', 'group', 'limit', 'offset', 'cursor', 'sort',
+                             'order'])
+
+#: The most replies on a URI which are prefetched. Replies are prefetched with
+#: only their references, so this can be much higher than a page of results.
+PREFETCH_REPLIES_MAX = 2000
 
 
 class Search(object):
@@ -32,17 +43,31 @@ class Search(object):
     :param stats: An optional statsd client to which some metrics will be
         published.
     :type stats: statsd.client.StatsClient
+
+    :param _replies_limit: The maximum number of replies to return when
+        separate_replies is True.
+
+    :param _replies_offset: The offset of the page of replies to return when
+        separate_replies is True.
     """
-    def __init__(self, request, separate_replies=False, stats=None, _replies_limit=200):
+    def __init__(self, request, separate_replies=False, stats=None, _replies_limit=200, _replies_offset=0):
         self.request = request
         self.es = request.es
         self.separate_replies = separate_replies
         self.stats = stats
-        self._replies_limit = _replies_limit
+        self._replies_limit = query.extract_limit({'limit': _replies_limit})
+        self._replies_offset = query.extract_offset({'offset': _replies_offset})
 
         self.builder = self._default_querybuilder(request)
         self.reply_builder = self._default_querybuilder(request)
 
+        # Anonymous searches are the same whoever makes them, so their
+        # results can be shared.
+        self._result_cache = None
+        if request.authenticated_userid is None:
+            self._result_cache = request.registry.get('search.result_cache')
+        self._uris = []
+
     def run(self, params):
         """
         Execute the search query
@@ -53,10 +78,30 @@ class Search(object):
         :returns: The search results
         :rtype: SearchResult
         """
-        total, annotation_ids, aggregations = self._search_annotations(params)
-        reply_ids = self._search_replies(annotation_ids)
+        if self._result_cache is not None:
+            # Tag cached results with every URI of the searched documents, so
+            # that a change to an annotation on any of them discards them.
+            self._uris = query.expand_uris(self.request.db,
+                                           [v for k, v in params.items() if k in ['uri', 'url']])
+
+            # Results of searches which aren't for any URI can't be discarded
+            # when annotations change, so they aren't cached.
+            if not self._uris:
+                self._result_cache = None
 
-        return SearchResult(total, annotation_ids, reply_ids, aggregations)
+        if self.separate_replies:
+            self.builder.append_filter(query.TopLevelAnnotationsFilter())
+
+            if self._can_prefetch_replies(params):
+                result = self._search_with_replies(params)
+                if result is not None:
+                    return result
+
+        total, annotation_ids, aggregations, cursor = self._search_annotations(params)
+        reply_ids, reply_total = self._search_replies(annotation_ids)
+
+        return SearchResult(total, annotation_ids, reply_ids, aggregations, reply_total,
+                            cursor)
 
     def clear(self):
         """Clear search filters, aggregators, and matchers."""
@@ -77,41 +122,112 @@ class Search(object):
         self.builder.append_aggregation(aggregation)
 
     def _search_annotations(self, params):
-        if self.separate_replies:
-            self.builder.append_filter(query.TopLevelAnnotationsFilter())
-
-        response = None
-        with self._instrument():
-            response = self.es.conn.search(index=self.es.index,
-                                           doc_type=self.es.t.annotation,
-                                           _source=False,
-                                           body=self.builder.build(params))
+        body = self.builder.build(params)
+        response = self._query('search',
+                               index=self.es.index,
+                               doc_type=self.es.t.annotation,
+                               _source=False,
+                               body=body)
         total = response['hits']['total']
         annotation_ids = [hit['_id'] for hit in response['hits']['hits']]
         aggregations = self._parse_aggregation_results(response.get('aggregations', None))
-        return (total, annotation_ids, aggregations)
+        cursor = query.next_cursor(body, response['hits']['hits'])
+        return (total, annotation_ids, aggregations, cursor)
 
     def _search_replies(self, annotation_ids):
         if not self.separate_replies:
-            return []
+            return ([], 0)
 
         self.reply_builder.append_matcher(query.RepliesMatcher(annotation_ids))
 
-        response = None
+        response = self._query('search',
+                               index=self.es.index,
+                               doc_type=self.es.t.annotation,
+                               _source=False,
+                               body=self.reply_builder.build(self._reply_page()))
+
+        reply_ids = [hit['_id'] for hit in response['hits']['hits']]
+        return (reply_ids, response['hits']['total'])
+
+    def _can_prefetch_replies(self, params):
+        return (('uri' in params or 'url' in params) and
+                all(key in PREFETCH_PARAMS for key in params.keys()))
+
+    def _search_with_replies(self, params):
+        """
+        Search for annotations and their replies in a single request.
+
+        The replies to a page of annotations can't be searched for until the
+        page is known, which costs a second round trip to Elasticsearch. But
+        replies share the URI of the annotation they reply to, so when the
+        search is only for annotations of a URI we can fetch all the replies
+        on that URI alongside the annotations and pick out the replies to the
+        page. The replies are filtered by the same expanded set of URIs as the
+        annotations (see :py:class:`h.search.query.UriFilter`), so replies on
+        any URI equivalent to the searched one are included.
+
+        Returns ``None`` if there were too many replies on the URI to fetch at
+        once, or the request failed, in which case the replies must be
+        searched for separately.
+        """
+        body = self.builder.build(params)
+        body['_source'] = False
+
+        reply_params = params.copy()
+        for key in set(reply_params.keys()) - set(['uri', 'url']):
+            del reply_params[key]
+        self.reply_builder.append_filter(query.RepliesFilter())
+        reply_body = self.reply_builder.build(reply_params)
+        reply_body['_source'] = ['references']
+        reply_body['size'] = PREFETCH_REPLIES_MAX
+
+        header = {'index': self.es.index, 'type': self.es.t.annotation}
+        try:
+            responses = self._query('msearch', body=[header, body, header, reply_body])
+        except TransportError:
+            return None
+        response, reply_response = responses['responses']
+
+        if 'error' in response or 'error' in reply_response:
+            return None
+        if len(reply_response['hits']['hits']) < reply_response['hits']['total']:
+            return None
+
+        total = response['hits']['total']
+        annotation_ids = [hit['_id'] for hit in response['hits']['hits']]
+        aggregations = self._parse_aggregation_results(response.get('aggregations', None))
+
+        page = set(annotation_ids)
+        reply_ids = [hit['_id'] for hit in reply_response['hits']['hits']
+                     if page.intersection(hit['_source'].get('references', []))]
+
+        offset = self._replies_offset
+        limit = self._replies_limit
+
+        return SearchResult(total,
+                            annotation_ids,
+                            reply_ids[offset:offset + limit],
+                            aggregations,
+                            len(reply_ids),
+                            query.next_cursor(body, response['hits']['hits']))
+
+    def _query(self, method, **kwargs):
+        """Call an Elasticsearch client method, using the result cache if possible."""
+        request = {'method': method, 'kwargs': kwargs}
+        if self._result_cache is not None:
+            response = self._result_cache.get(request)
+            if response is not None:
+                return response
+
         with self._instrument():
-            response = self.es.conn.search(
-                index=self.es.index,
-                doc_type=self.es.t.annotation,
-                _source=False,
-                body=self.reply_builder.build({'limit': self._replies_limit}))
+            response = getattr(self.es.conn, method)(**kwargs)
 
-        if len(response['hits']['hits']) < response['hits']['total']:
-            log.warn("The number of reply annotations exceeded the page size "
-                     "of the Elasticsearch query. We currently don't handle "
-                     "this, our search API doesn't support pagination of the "
-                     "reply set.")
+        if self._result_cache is not None and _succeeded(response):
+            self._result_cache.set(request, response, uris=self._uris)
+        return response
 
-        return [hit['_id'] for hit in response['hits']['hits']]
+    def _reply_page(self):
+        return {'limit': self._replies_limit, 'offset': self._replies_offset}
 
     def _parse_aggregation_results(self, aggregations):
         if not aggregations:
@@ -162,3 +278,8 @@ class Search(object):
         builder.append_matcher(query.AnyMatcher())
         builder.append_matcher(query.TagsMatcher())
         return builder
+
+
+def _succeeded(response):
+    responses = response.get('responses', [response])
+    return not any('error' in r for r in responses)
@@ -3,6 +3,7 @@
 
 from __future__ import division, unicode_literals
 
+import itertools
 import logging
 import time
 from collections import namedtuple
@@ -13,8 +14,10 @@ from sqlalchemy.orm import subqueryload
 
 from h import models
 from h import presenters
-from h.events import AnnotationTransformEvent
-from h.util.query import column_windows
+from h import storage
+from h.events import AnnotationBatchTransformEvent, AnnotationTransformEvent
+from h.search import bulk
+from h.util.query import column_window_bounds, keyset_windows
 
 log = logging.getLogger(__name__)
 
@@ -26,6 +29,27 @@ class Window(namedtuple('Window', ['start', 'end'])):
     pass
 
 
+class _DocumentRow(namedtuple('_DocumentRow', ['title', 'web_uri'])):
+    pass
+
+
+class _AnnotationRow(object):
+    """
+    A row of annotation data which looks enough like an annotation to present.
+
+    This lets :py:class:`h.presenters.AnnotationSearchIndexPresenter` present
+    the rows read by :py:func:`_windowed_annotation_rows` without them being
+    loaded as :py:class:`h.models.Annotation` objects.
+    """
+
+    def __init__(self, row):
+        self._row = row
+        self.document = _DocumentRow(row.document_title, row.document_web_uri)
+
+    def __getattr__(self, name):
+        return getattr(self._row, name)
+
+
 def index(es, annotation, request, target_index=None):
     """
     Index an annotation into the search index.
@@ -43,7 +67,9 @@ def index(es, annotation, request, target_index=None):
     :param target_index: the index name, uses default index if not given
     :type target_index: unicode
     """
-    presenter = presenters.AnnotationSearchIndexPresenter(annotation)
+    thread_ids = storage.fetch_thread_ids(request.db, [annotation.id])
+    presenter = presenters.AnnotationSearchIndexPresenter(
+        annotation, thread_ids=thread_ids[annotation.id])
     annotation_dict = presenter.asdict()
 
     event = AnnotationTransformEvent(request, annotation, annotation_dict)
@@ -95,11 +121,23 @@ class BatchIndexer(object):
     the search index.
     """
 
-    def __init__(self, session, es_client, request, target_index=None, op_type='index'):
+    def __init__(self, session, es_client, request, target_index=None, op_type='index',
+                 chunk_size=ES_CHUNK_SIZE, writers=None):
         self.session = session
         self.es_client = es_client
         self.request = request
         self.op_type = op_type
+        self.chunk_size = chunk_size
+
+        # The number of threads sending bulk requests while annotations are
+        # read, or None to read and send in turn
+        self.writers = writers
+
+        #: The number of annotations sent to Elasticsearch so far
+        self.indexed = 0
+
+        # The thread IDs of annotations which are about to be indexed
+        self._thread_ids = {}
 
         # By default, index into the open index
         if target_index is None:
@@ -127,12 +165,83 @@ class BatchIndexer(object):
         # Report indexing status as we go
         annotations = _log_status(annotations, log_every=PG_WINDOW_SIZE)
 
-        indexing = es_helpers.streaming_bulk(self.es_client.conn, annotations,
-                                             chunk_size=ES_CHUNK_SIZE,
-                                             raise_on_error=False,
-                                             expand_action_callback=self._prepare)
+        return self._index(annotations)
+
+    def index_window(self, window):
+        """
+        Reindex the annotations last updated within the given window.
+
+        :param window: the range of ``updated`` times to reindex. The window
+            includes ``window.start`` but not ``window.end``, and is unbounded
+            above if ``window.end`` is ``None``.
+        :type window: h.search.index.Window
+
+        :returns: a set of errored ids
+        :rtype: set
+        """
+        return self._index(_windowed_annotations(self.session, window))
+
+    def export_window(self, window):
+        """
+        Reindex the annotations last updated within the given window.
+
+        This is a faster equivalent of :py:meth:`index_window` for reindexing
+        lots of annotations. The annotations are read as plain rows through a
+        server-side cursor, rather than being loaded as ORM objects, and
+        instead of an :py:class:`h.events.AnnotationTransformEvent` for each
+        annotation, an :py:class:`h.events.AnnotationBatchTransformEvent` is
+        fired for each chunk of annotations.
+
+        :param window: the range of ``updated`` times to reindex
+        :type window: h.search.index.Window
+
+        :returns: a set of errored ids
+        :rtype: set
+        """
+        actions = self._export(_windowed_annotation_rows(self.session, window))
+        return self._index(actions, expand_action_callback=lambda action: action)
+
+    def delete(self, annotation_ids):
+        """
+        Mark annotations as deleted in the search index.
+
+        This is the bulk equivalent of :py:func:`delete`.
+
+        :param annotation_ids: a list of ids to mark as deleted
+        :type annotation_ids: collection
+
+        :returns: a set of errored ids
+        :rtype: set
+        """
+        actions = ({'_op_type': 'index',
+                    '_index': self._target_index,
+                    '_type': self.es_client.t.annotation,
+                    '_id': id_,
+                    '_source': {'deleted': True}} for id_ in annotation_ids)
+
+        deleting = es_helpers.streaming_bulk(self.es_client.conn, actions,
+                                             chunk_size=self.chunk_size,
+                                             raise_on_error=False)
+        return set(item['index']['_id'] for ok, item in deleting if not ok)
+
+    def _index(self, annotations, expand_action_callback=None):
+        if expand_action_callback is None:
+            annotations = self._with_thread_ids(annotations)
+            expand_action_callback = self._prepare
+
+        if self.writers:
+            indexing = bulk.pipelined_bulk(self.es_client.conn,
+                                           (expand_action_callback(a) for a in annotations),
+                                           chunk_size=self.chunk_size,
+                                           writers=self.writers)
+        else:
+            indexing = es_helpers.streaming_bulk(self.es_client.conn, annotations,
+                                                 chunk_size=self.chunk_size,
+                                                 raise_on_error=False,
+                                                 expand_action_callback=expand_action_callback)
         errored = set()
         for ok, item in indexing:
+            self.indexed += 1
             if not ok:
                 status = item[self.op_type]
 
@@ -143,11 +252,38 @@ class BatchIndexer(object):
                 errored.add(status['_id'])
         return errored
 
+    def _with_thread_ids(self, annotations):
+        """Load the thread IDs of each chunk of annotations before it is indexed."""
+        for chunk in _chunks(annotations, self.chunk_size):
+            self._thread_ids.update(storage.fetch_thread_ids(self.session,
+                                                             [a.id for a in chunk]))
+            for annotation in chunk:
+                yield annotation
+
+    def _export(self, rows):
+        """Present and transform annotation rows a chunk at a time."""
+        for chunk in _chunks(rows, self.chunk_size):
+            data = [presenters.AnnotationSearchIndexPresenter(
+                        _AnnotationRow(row), thread_ids=row.thread_ids or []).asdict()
+                    for row in chunk]
+
+            event = AnnotationBatchTransformEvent(self.request, data)
+            self.request.registry.notify(event)
+
+            for d in data:
+                yield (self._action(d['id']), d)
+
+    def _action(self, annotation_id):
+        return {self.op_type: {'_index': self._target_index,
+                               '_type': self.es_client.t.annotation,
+                               '_id': annotation_id}}
+
     def _prepare(self, annotation):
-        action = {self.op_type: {'_index': self._target_index,
-                                 '_type': self.es_client.t.annotation,
-                                 '_id': annotation.id}}
-        data = presenters.AnnotationSearchIndexPresenter(annotation).asdict()
+        action = self._action(annotation.id)
+        thread_ids = self._thread_ids.pop(annotation.id, None)
+        presenter = presenters.AnnotationSearchIndexPresenter(annotation,
+                                                              thread_ids=thread_ids)
+        data = presenter.asdict()
 
         event = AnnotationTransformEvent(self.request, annotation, data)
         self.request.registry.notify(event)
@@ -155,13 +291,29 @@ class BatchIndexer(object):
         return (action, data)
 
 
+def annotation_windows(session, windowsize=PG_WINDOW_SIZE):
+    """
+    Split the annotations to be indexed into windows by their update time.
+
+    :returns: a list of :py:class:`Window` objects for use with
+        :py:meth:`BatchIndexer.index_window`
+    """
+    bounds = column_window_bounds(session=session,
+                                  column=models.Annotation.updated,
+                                  windowsize=windowsize,
+                                  where=_annotation_filter())
+    return [Window(start, end) for start, end in bounds]
+
+
 def _all_annotations(session, windowsize=2000):
     # This is using a windowed query for loading all annotations in batches.
     # It is the most performant way of loading a big set of records from
     # the database while still supporting eagerloading of associated
-    # document data.
-    windows = column_windows(session=session,
-                             column=models.Annotation.updated,  # implicit ASC
+    # document data. The windows are found lazily by seeking on
+    # (updated, id), so indexing starts straight away.
+    windows = keyset_windows(session=session,
+                             columns=(models.Annotation.updated,
+                                      models.Annotation.id),
                              windowsize=windowsize,
                              where=_annotation_filter())
     query = _eager_loaded_annotations(session).filter(_annotation_filter())
@@ -171,6 +323,62 @@ def _all_annotations(session, windowsize=2000):
             yield a
 
 
+def _windowed_annotations(session, window):
+    updated = models.Annotation.updated
+    query = (_eager_loaded_annotations(session)
+             .execution_options(stream_results=True)
+             .filter(_annotation_filter())
+             .filter(updated >= window.start))
+    if window.end is not None:
+        query = query.filter(updated < window.end)
+
+    for a in query:
+        yield a
+
+
+def _windowed_annotation_rows(session, window):
+    """
+    Yield rows of the data needed to index the annotations within `window`.
+
+    The rows have the attributes of :py:class:`h.models.Annotation` that the
+    search index presenter needs, along with the title and web URI of the
+    annotation's document and the IDs of the replies in its thread.
+    """
+    annotation = models.Annotation.__table__
+    document = models.Document.__table__
+    reply = annotation.alias('reply')
+
+    thread_ids = sa.select([sa.func.array_agg(reply.c.id)]) \
+                   .where(reply.c.references[0] == annotation.c.id) \
+                   .as_scalar()
+
+    query = sa.select([annotation.c.id,
+                       annotation.c.created,
+                       annotation.c.updated,
+                       annotation.c.userid,
+                       annotation.c.groupid,
+                       annotation.c.shared,
+                       annotation.c.text,
+                       annotation.c.tags,
+                       annotation.c.target_uri,
+                       annotation.c.target_uri_normalized,
+                       annotation.c.target_selectors,
+                       annotation.c.references,
+                       document.c.title.label('document_title'),
+                       document.c.web_uri.label('document_web_uri'),
+                       thread_ids.label('thread_ids')]) \
+              .select_from(annotation.outerjoin(document,
+                                                document.c.id == annotation.c.document_id)) \
+              .where(sa.not_(annotation.c.deleted)) \
+              .where(annotation.c.updated >= window.start)
+    if window.end is not None:
+        query = query.where(annotation.c.updated < window.end)
+
+    conn = session.connection().execution_options(stream_results=True)
+    for row in conn.execute(query):
+        yield row
+
+
 def _filtered_annotations(session, ids):
     annotations = (_eager_loaded_annotations(session)
                    .execution_options(stream_results=True)
@@ -191,10 +399,18 @@ def _eager_loaded_annotations(session):
         subqueryload(models.Annotation.document).subqueryload(models.Document.document_uris),
         subqueryload(models.Annotation.document).subqueryload(models.Document.meta),
         subqueryload(models.Annotation.moderation),
-        subqueryload(models.Annotation.thread).load_only("id"),
     )
 
 
+def _chunks(iterable, size):
+    iterable = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterable, size))
+        if not chunk:
+            return
+        yield chunk
+
+
 def _log_status(stream, log_every=1000):
     i = 0
     then = time.time()
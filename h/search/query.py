@@ -1,12 +1,23 @@
 # -*- coding: utf-8 -*-
 
 from __future__ import unicode_literals
+import base64
+import binascii
+import json
+
 from h import storage
+from h._compat import integer_types, string_types
+from h.schemas import ValidationError
 from h.util import uri
 
 LIMIT_DEFAULT = 20
 LIMIT_MAX = 200
 
+#: The field that orders annotations which sort equally otherwise, so that
+#: every annotation has a distinct position for cursors to point at. Results
+#: are only sorted by it when a cursor is passed or requested.
+TIEBREAK_FIELD = 'id'
+
 
 class Builder(object):
 
@@ -32,11 +43,23 @@ class Builder(object):
         """Get the resulting query object from this query builder."""
         params = params.copy()
 
+        # Passing an empty cursor requests the first page of a cursor
+        # paginated search.
+        paginate_by_cursor = "cursor" in params
+        p_cursor = extract_cursor(params)
         p_from = extract_offset(params)
         p_size = extract_limit(params)
-        p_sort = extract_sort(params)
+        p_sort = extract_sort(params, tiebreak=paginate_by_cursor)
 
         filters = [f(params) for f in self.filters]
+        if p_cursor is not None:
+            # Pages after a cursor are found by filtering, not by skipping
+            # over the earlier pages, so they're as quick to find as the
+            # first page however deep they are.
+            p_from = 0
+            p_sort = _sort(p_cursor['field'], p_cursor['order'], tiebreak=True)
+            filters.append(_after(p_cursor))
+
         matchers = [m(params) for m in self.matchers]
         aggregations = {a.key: a(params) for a in self.aggregations}
         filters = [f for f in filters if f is not None]
@@ -91,13 +114,80 @@ def extract_limit(params):
         return val
 
 
-def extract_sort(params):
-    return [{
-        params.pop("sort", "updated"): {
-            "ignore_unmapped": True,
-            "order": params.pop("order", "desc"),
-        }
-    }]
+def extract_sort(params, tiebreak=False):
+    return _sort(params.pop("sort", "updated"), params.pop("order", "desc"),
+                 tiebreak=tiebreak)
+
+
+def extract_cursor(params):
+    """
+    Return the position a ``cursor`` parameter points at, or ``None``.
+
+    :raises h.schemas.ValidationError: if the cursor isn't one returned by
+        :py:func:`next_cursor`
+    """
+    token = params.pop("cursor", None)
+    if not token:
+        return None
+
+    try:
+        padding = '=' * (-len(token) % 4)
+        field, order, value, id_ = json.loads(
+            base64.urlsafe_b64decode(str(token + padding)).decode('utf-8'))
+    except (TypeError, ValueError, binascii.Error):
+        raise ValidationError('cursor is invalid')
+    if (order not in ('asc', 'desc') or
+            not isinstance(field, string_types) or
+            not isinstance(id_, string_types) or
+            not _is_sort_value(value)):
+        raise ValidationError('cursor is invalid')
+
+    return {'field': field, 'order': order, 'value': value, 'id': id_}
+
+
+def next_cursor(body, hits):
+    """
+    Return a cursor for the page of results after `hits`.
+
+    :param body: the query that found `hits`, built by :py:class:`Builder`
+    :param hits: the hits from the Elasticsearch response to that query
+    :returns: an opaque cursor token, or ``None`` if `hits` is the last page
+        or the query wasn't sorted for cursor pagination
+    """
+    if len(body['sort']) < 2 or not hits or len(hits) < body['size']:
+        return None
+
+    (field, spec), = body['sort'][0].items()
+    value, id_ = hits[-1]['sort']
+    token = json.dumps([field, spec['order'], value, id_], separators=(',', ':'))
+    return base64.urlsafe_b64encode(token.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def _sort(field, order, tiebreak=False):
+    sort = [{field: {"ignore_unmapped": True, "order": order}}]
+    if tiebreak:
+        sort.append({TIEBREAK_FIELD: {"ignore_unmapped": True, "order": order}})
+    return sort
+
+
+def _is_sort_value(value):
+    """Return whether `value` could be a field's value to sort on."""
+    if isinstance(value, bool):
+        return False
+    return isinstance(value, string_types + integer_types + (float,))
+
+
+def _after(cursor):
+    """Return a filter matching the annotations sorted after `cursor`."""
+    field = cursor['field']
+    op = 'gt' if cursor['order'] == 'asc' else 'lt'
+    return {'or': [
+        {'range': {field: {op: cursor['value']}}},
+        {'and': [
+            {'term': {field: cursor['value']}},
+            {'range': {TIEBREAK_FIELD: {op: cursor['id']}}},
+        ]},
+    ]}
 
 
 class TopLevelAnnotationsFilter(object):
@@ -108,6 +198,14 @@ class TopLevelAnnotationsFilter(object):
         return {'missing': {'field': 'references'}}
 
 
+class RepliesFilter(object):
+
+    """Matches replies only, filters out top-level annotations."""
+
+    def __call__(self, _):
+        return {'exists': {'field': 'references'}}
+
+
 class AuthorityFilter(object):
 
     """
@@ -200,16 +298,27 @@ class UriFilter(object):
         if 'url' in params:
             del params['url']
 
-        uris = set()
-        for query_uri in query_uris:
-            expanded = storage.expand_uri(self.request.db, query_uri)
-
-            us = [uri.normalize(u) for u in expanded]
-            uris.update(us)
+        uris = expand_uris(self.request.db, query_uris)
 
         return {"terms": {"target.scope": list(uris)}}
 
 
+def expand_uris(session, query_uris):
+    """
+    Return the normalized URIs to search for to find annotations of `query_uris`.
+
+    Each URI is expanded to all the URIs of the same document (see
+    :py:func:`h.storage.expand_uri`) before being normalized.
+    """
+    uris = set()
+    for query_uri in query_uris:
+        expanded = storage.expand_uri(session, query_uri)
+
+        uris.update(uri.normalize_many(expanded))
+
+    return uris
+
+
 class UserFilter(object):
 
     """
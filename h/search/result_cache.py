@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""A short-lived cache of Elasticsearch responses to anonymous searches."""
+
+from __future__ import unicode_literals
+
+import json
+import time
+
+from h.util.cache import LRUCache
+
+#: The default number of responses to cache in each process
+DEFAULT_MAXSIZE = 1000
+
+
+class ResultCache(object):
+    """
+    A short-lived, in-process cache of Elasticsearch search responses.
+
+    Responses are cached by the complete request sent to Elasticsearch,
+    including the query body, so this must only be used for searches whose
+    query is the same whoever makes them. :py:class:`h.search.Search` only
+    uses it for unauthenticated requests.
+
+    Each response is tagged with the normalized URIs that were searched for,
+    including the other URIs of the same documents (see
+    :py:func:`h.search.query.expand_uris`). When annotations of a URI change,
+    the responses for it are discarded, and responses for it aren't cached again until `ttl` seconds later, to
+    give the change time to be indexed. This only affects the cache of the
+    process which saw the change; other processes serve their copies until
+    they expire. Responses which aren't tagged with any URIs are never
+    discarded early, so :py:class:`h.search.Search` only caches searches for
+    a URI.
+
+    Cached responses are shared, and must not be modified.
+
+    :param ttl: how long (in seconds) to cache each response for
+    :param maxsize: the maximum number of responses to cache
+    :param clock: a callable returning the current time in seconds
+    """
+
+    def __init__(self, ttl, maxsize=DEFAULT_MAXSIZE, clock=time.time):
+        self._responses = LRUCache(maxsize=maxsize, ttl=ttl, clock=clock)
+        self._changed_uris = LRUCache(maxsize=maxsize, ttl=ttl, clock=clock)
+
+    def get(self, request):
+        """
+        Return the cached response to an Elasticsearch request, or ``None``.
+
+        :param request: the name and keyword arguments of the Elasticsearch
+            client method called
+        :type request: dict
+        """
+        entry = self._responses.get(_key(request))
+        if entry is None:
+            return None
+        return entry[1]
+
+    def set(self, request, response, uris=()):
+        """
+        Cache the response to an Elasticsearch request.
+
+        :param uris: the normalized URIs that were searched for
+        """
+        uris = frozenset(uris)
+        if any(self._changed_uris.get(uri) for uri in uris):
+            return
+        self._responses.set(_key(request), (uris, response))
+
+    def invalidate(self, uris):
+        """Discard the cached responses for any of the given normalized URIs."""
+        uris = frozenset(uris)
+        for uri in uris:
+            self._changed_uris.set(uri, True)
+        self._responses.discard(lambda entry: entry[0] & uris)
+
+
+def _key(request):
+    return json.dumps(request, sort_keys=True)
@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from h import storage
+
+
+def invalidate_result_cache(event):
+    """Stop serving cached search results for the URI of a changed annotation."""
+    cache = event.request.registry.get('search.result_cache')
+    if cache is None:
+        return
+
+    annotation = storage.fetch_annotation(event.request.db, event.annotation_id)
+    if annotation is not None:
+        cache.invalidate([annotation.target_uri_normalized])
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import sqlalchemy as sa
+from sqlalchemy.orm import aliased
+from sqlalchemy.orm import joinedload
+
+from h import storage
+from h.models import Annotation, AnnotationModeration
+from h.util import uri
+
+#: How many annotations are read from the database and presented at once
+BATCH_SIZE = 200
+
+
+class AnnotationExportService(object):
+    """
+    A service for exporting the annotations a user can read.
+
+    Annotations are read from Postgres through a server-side cursor and
+    presented a batch at a time, so that exporting many annotations doesn't
+    need them all to be in memory at once, or to be searched for in
+    Elasticsearch first.
+    """
+
+    def __init__(self, session, user, group_service, nipsa_service, presentation_service):
+        self.session = session
+        self.user = user
+        self.group_service = group_service
+        self.nipsa_service = nipsa_service
+        self.presentation_service = presentation_service
+
+    def export(self, limit, group=None, userid=None, uri=None, since=None, after=None):
+        """
+        Yield the presented annotations matching the given filters.
+
+        Annotations are yielded least recently updated first, and then in
+        order of ID, so an interrupted export can be resumed by passing the
+        ``updated`` time and ID of the last annotation received as `since`
+        and `after`.
+
+        :param limit: the maximum number of annotations to export
+        :param group: only export annotations in the group with this pubid
+        :param userid: only export annotations by the user with this userid
+        :param uri: only export annotations of documents with this URI
+        :param since: only export annotations updated at or after this time
+        :type since: datetime.datetime
+        :param after: with `since`, skip annotations updated at exactly
+            `since` which don't have an ID greater than this
+        """
+        query = self._query(group, userid, uri, since, after).limit(limit)
+
+        batch = []
+        for annotation in query.yield_per(BATCH_SIZE):
+            batch.append(annotation)
+            if len(batch) >= BATCH_SIZE:
+                for presented in self.presentation_service.present_annotations(batch):
+                    yield presented
+                batch = []
+
+        for presented in self.presentation_service.present_annotations(batch):
+            yield presented
+
+    def _query(self, group, userid, uri_, since, after):
+        query = self.session.query(Annotation) \
+                            .execution_options(stream_results=True) \
+                            .options(joinedload(Annotation.document)) \
+                            .filter_by(deleted=False) \
+                            .filter(self._readable()) \
+                            .order_by(Annotation.updated, Annotation.id)
+
+        if group is not None:
+            query = query.filter(Annotation.groupid == group)
+        if userid is not None:
+            query = query.filter(Annotation.userid == userid)
+        if uri_ is not None:
+            uris = [uri.normalize(u) for u in storage.expand_uri(self.session, uri_)]
+            query = query.filter(Annotation.target_uri_normalized.in_(uris))
+        if since is not None:
+            if after is not None:
+                query = query.filter(sa.or_(
+                    Annotation.updated > since,
+                    sa.and_(Annotation.updated == since, Annotation.id > after)))
+            else:
+                query = query.filter(Annotation.updated >= since)
+
+        return query
+
+    def _readable(self):
+        """
+        Return a clause matching the annotations the user can read.
+
+        These are the same annotations that search would return to the user
+        (see :py:func:`h.search.query.nipsa_filter`): shared annotations in
+        groups the user can read and the user's own private annotations.
+        Annotations by NIPSA'd users and annotations hidden by a moderator
+        (which are indexed as NIPSA'd, see :py:mod:`h.nipsa.subscribers`) are
+        only included if they're the user's own, in groups the user created,
+        or have replies.
+        """
+        groups = self.group_service.groupids_readable_by(self.user)
+        clauses = [
+            Annotation.groupid.in_(groups),
+            sa.or_(Annotation.shared, Annotation.userid == self.user.userid),
+        ]
+
+        hidden = sa.exists().where(AnnotationModeration.annotation_id == Annotation.id)
+        nipsad = self.nipsa_service.flagged_userids
+        if nipsad:
+            hidden = sa.or_(Annotation.userid.in_(nipsad), hidden)
+
+        reply = aliased(Annotation)
+        visible = [
+            sa.not_(hidden),
+            Annotation.userid == self.user.userid,
+            sa.exists().where(reply.references[0] == Annotation.id),
+        ]
+        created_groups = self.group_service.groupids_created_by(self.user)
+        if created_groups:
+            visible.append(Annotation.groupid.in_(created_groups))
+        clauses.append(sa.or_(*visible))
+
+        return sa.and_(*clauses)
+
+
+def annotation_export_factory(context, request):
+    """Return an AnnotationExportService instance for the passed context and request."""
+    return AnnotationExportService(
+        session=request.db,
+        user=request.user,
+        group_service=request.find_service(name='group'),
+        nipsa_service=request.find_service(name='nipsa'),
+        presentation_service=request.find_service(name='annotation_json_presentation'))
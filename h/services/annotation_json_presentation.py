@@ -19,13 +19,27 @@ class AnnotationJSONPresentationService(object):
         self.group_svc = group_svc
         self.links_svc = links_svc
 
+        # Whether the user has a permission on a group is checked for every
+        # annotation presented, so remember the answers while presenting a
+        # batch of annotations, most of which are usually in a few groups.
+        self._permissions = {}
+
+        def group_permission(permission, context):
+            pubid = getattr(context, 'pubid', None)
+            if pubid is None:
+                return has_permission(permission, context)
+            key = (permission, pubid)
+            if key not in self._permissions:
+                self._permissions[key] = has_permission(permission, context)
+            return self._permissions[key]
+
         def moderator_check(group):
-            return has_permission('admin', group)
+            return group_permission('admin', group)
 
         self.formatters = [
             formatters.AnnotationFlagFormatter(flag_svc, user),
             formatters.AnnotationHiddenFormatter(moderation_svc, moderator_check, user),
-            formatters.AnnotationModerationFormatter(flag_count_svc, user, has_permission),
+            formatters.AnnotationModerationFormatter(flag_count_svc, user, group_permission),
         ]
 
         if render_user_info:
@@ -43,12 +57,30 @@ class AnnotationJSONPresentationService(object):
         annotations = storage.fetch_ordered_annotations(
             self.session, annotation_ids, query_processor=eager_load_documents)
 
+        return self.present_annotations(annotations, annotation_ids)
+
+    def present_annotations(self, annotations, annotation_ids=None):
+        """
+        Present a batch of annotations which have already been loaded.
+
+        :param annotations: the annotations to present
+        :param annotation_ids: the IDs of `annotations`, if already known
+        """
+        if annotation_ids is None:
+            annotation_ids = [ann.id for ann in annotations]
+
         # preload formatters, so they can optimize database access
         for formatter in self.formatters:
             formatter.preload(annotation_ids)
 
+        # Compute who can read each group, and what the user may do in it,
+        # once per group rather than once per annotation.
+        self._permissions.clear()
+        group_principals = {}
+
         return [self.present(
-                    traversal.AnnotationContext(ann, self.group_svc, self.links_svc))
+                    traversal.AnnotationContext(ann, self.group_svc, self.links_svc,
+                                                group_principals=group_principals))
                 for ann in annotations]
 
     def _get_presenter(self, annotation_resource):
@@ -4,6 +4,8 @@ from __future__ import unicode_literals
 
 from h.events import AnnotationEvent
 from h.models import Annotation
+from h.services.group import CACHE as groupids_cache
+from h.services.group import invalidate_cache
 from h import storage
 
 
@@ -12,8 +14,9 @@ class DeletePublicGroupError(Exception):
 
 
 class DeleteGroupService(object):
-    def __init__(self, request):
+    def __init__(self, request, cache=None):
         self.request = request
+        self.cache = groupids_cache if cache is None else cache
 
     def delete(self, group):
         """
@@ -23,6 +26,7 @@ class DeleteGroupService(object):
 
         self._delete_annotations(group)
         self.request.db.delete(group)
+        invalidate_cache(self.cache, getattr(self.request, 'tm', None))
 
     def _delete_annotations(self, group):
         if group.pubid == '__world__':
@@ -4,6 +4,8 @@ from __future__ import unicode_literals
 
 from h.events import AnnotationEvent
 from h.models import Annotation, Group
+from h.services.group import CACHE as groupids_cache
+from h.services.group import invalidate_cache
 from h import storage
 
 
@@ -12,8 +14,9 @@ class UserDeleteError(Exception):
 
 
 class DeleteUserService(object):
-    def __init__(self, request):
+    def __init__(self, request, cache=None):
         self.request = request
+        self.cache = groupids_cache if cache is None else cache
 
     def delete(self, user):
         """
@@ -61,6 +64,7 @@ class DeleteUserService(object):
     def _delete_groups(self, groups):
         for group in groups:
             self.request.db.delete(group)
+        invalidate_cache(self.cache, getattr(self.request, 'tm', None))
 
 
 def delete_user_service_factory(context, request):
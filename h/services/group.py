@@ -8,23 +8,48 @@ import sqlalchemy as sa
 from h import session
 from h.models import Group, GroupScope, Organization, User
 from h.models.group import ReadableBy, OPEN_GROUP_TYPE_FLAGS, PRIVATE_GROUP_TYPE_FLAGS, RESTRICTED_GROUP_TYPE_FLAGS
+from h.util.cache import LRUCache
+from h.util.db import lru_cache_in_transaction
+
+#: How long (in seconds) a process may use cached group pubids before
+#: reloading them from the database.
+CACHE_TTL = 60
+
+#: The cache of group pubids shared by all GroupService instances in this
+#: process.
+#:
+#: It only holds pubids which don't grant access to anything: the pubids of
+#: the world-readable groups, and of the groups each user created. The groups
+#: a signed-in user can read through their memberships are only cached by
+#: each GroupService until the end of the current transaction, as other
+#: processes can change them without telling this one.
+CACHE = LRUCache(maxsize=10000, ttl=CACHE_TTL)
 
 
 class GroupService(object):
 
     """A service for manipulating groups and group membership."""
 
-    def __init__(self, session, user_fetcher, publish):
+    def __init__(self, session, user_fetcher, publish, cache=None, transaction_manager=None):
         """
         Create a new groups service.
 
         :param session: the SQLAlchemy session object
         :param user_fetcher: a callable for fetching users by userid
         :param publish: a callable for publishing events
+        :param cache: the :py:class:`h.util.cache.LRUCache` to cache group
+            pubids in (defaults to the process-wide cache)
+        :param transaction_manager: an optional transaction manager, whose
+            transaction's commit also invalidates the cache
         """
         self.session = session
         self.user_fetcher = user_fetcher
         self.publish = publish
+        self.cache = CACHE if cache is None else cache
+        self.transaction_manager = transaction_manager
+
+        self._cached_groupids_readable_by_member = lru_cache_in_transaction(self.session)(
+            self._groupids_readable_by_member)
 
     def create_private_group(self, name, userid, description=None, organization=None):
         """
@@ -136,6 +161,7 @@ class GroupService(object):
             return
 
         group.members.append(user)
+        self._cached_groupids_readable_by_member.cache_clear()
 
         self.publish('group-join', group.pubid, userid)
 
@@ -147,6 +173,7 @@ class GroupService(object):
             return
 
         group.members.remove(user)
+        self._cached_groupids_readable_by_member.cache_clear()
 
         self.publish('group-leave', group.pubid, userid)
 
@@ -157,13 +184,10 @@ class GroupService(object):
         If the passed-in user is ``None``, this returns the list of
         world-readable groups.
         """
-        readable = (Group.readable_by == ReadableBy.world)
-
         if user is not None:
-            readable_member = sa.and_(Group.readable_by == ReadableBy.members, Group.members.any(User.id == user.id))
-            readable = sa.or_(readable, readable_member)
+            return list(self._cached_groupids_readable_by_member(user.id))
 
-        return [record.pubid for record in self.session.query(Group.pubid).filter(readable)]
+        return self._cached(('readable', None), self._groupids_readable_by_world)
 
     def groupids_created_by(self, user):
         """
@@ -174,6 +198,27 @@ class GroupService(object):
         if user is None:
             return []
 
+        return self._cached(('created', user.userid),
+                            partial(self._groupids_created_by, user))
+
+    def _cached(self, key, load):
+        pubids = self.cache.get(key)
+        if pubids is None:
+            pubids = tuple(load())
+            self.cache.set(key, pubids)
+        return list(pubids)
+
+    def _groupids_readable_by_world(self):
+        readable = (Group.readable_by == ReadableBy.world)
+        return [record.pubid for record in self.session.query(Group.pubid).filter(readable)]
+
+    def _groupids_readable_by_member(self, user_id):
+        readable = (Group.readable_by == ReadableBy.world)
+        readable_member = sa.and_(Group.readable_by == ReadableBy.members, Group.members.any(User.id == user_id))
+        readable = sa.or_(readable, readable_member)
+        return tuple(record.pubid for record in self.session.query(Group.pubid).filter(readable))
+
+    def _groupids_created_by(self, user):
         return [g.pubid for g in self.session.query(Group.pubid).filter_by(creator=user)]
 
     def _create(self, name, userid, description, type_flags,
@@ -207,6 +252,11 @@ class GroupService(object):
                       )
         self.session.add(group)
 
+        # A new group may be readable by everyone, so the cached pubids may
+        # be out of date.
+        invalidate_cache(self.cache, self.transaction_manager)
+        self._cached_groupids_readable_by_member.cache_clear()
+
         if add_creator_as_member:
             group.members.append(group.creator)
 
@@ -228,7 +278,22 @@ def groups_factory(context, request):
     user_service = request.find_service(name='user')
     return GroupService(session=request.db,
                         user_fetcher=user_service.fetch,
-                        publish=partial(_publish, request))
+                        publish=partial(_publish, request),
+                        transaction_manager=getattr(request, 'tm', None))
+
+
+def invalidate_cache(cache=None, transaction_manager=None):
+    """
+    Discard all cached group pubids.
+
+    The pubids are discarded at once, and again once the current transaction
+    of `transaction_manager` (if given) ends, so that pubids which other
+    requests load before the transaction commits aren't kept either.
+    """
+    cache = CACHE if cache is None else cache
+    cache.clear()
+    if transaction_manager is not None:
+        transaction_manager.get().addAfterCommitHook(lambda committed: cache.clear())
 
 
 def _publish(request, event_type, groupid, userid):
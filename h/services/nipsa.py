@@ -1,32 +1,130 @@
 # -*- coding: utf-8 -*-
 
 from __future__ import unicode_literals
+from functools import partial
+import threading
+import time
+
 from h.models import User
 from h.tasks.indexer import reindex_user_annotations
 
+#: How long (in seconds) a process may use its set of NIPSA'd userids before
+#: reloading it from the database. Only the process which changes a flag, and
+#: the streamer (which consumes NIPSA messages), see the change immediately.
+#: Other web processes keep hiding (or showing) the user's annotations in
+#: search and presentation for up to this long afterwards.
+CACHE_TTL = 60
+
+
+class NipsaCache(object):
+
+    """
+    A process-wide cache of the set of NIPSA'd userids.
+
+    The set is loaded from the database when first needed and reloaded once
+    it is older than ``ttl`` seconds. Processes which are told about changes
+    to NIPSA flags (see :py:meth:`update`) see them immediately; the TTL puts
+    an upper bound on how stale the set can be in processes which are not.
+    Processes which must never use a stale set, such as the Celery workers
+    which index annotations, should :py:meth:`invalidate` it before each unit
+    of work instead.
+
+    The set itself is never modified in place: changes replace it, and bump
+    ``version``, so readers can safely hold on to a set they have been given.
+    """
+
+    def __init__(self, ttl=CACHE_TTL, clock=time.time):
+        self.ttl = ttl
+        self.version = 0
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._userids = None
+        self._loaded_at = None
+
+    def get(self, session):
+        """
+        Return the set of NIPSA'd userids, loading it if necessary.
+
+        :param session: the SQLAlchemy session to load the set with
+        :rtype: frozenset of unicode strings
+        """
+        userids = self._userids
+        if userids is None or self._stale():
+            # Only one thread (or greenlet) loads the set; the others wait for
+            # it and then use the set it loaded.
+            with self._load_lock:
+                userids = self._userids
+                if userids is None or self._stale():
+                    userids = self._load(session)
+        return userids
+
+    def update(self, userid, nipsa):
+        """Record a change to the NIPSA flag of `userid`."""
+        with self._lock:
+            if self._userids is None:
+                return
+            if nipsa:
+                self._userids = self._userids | {userid}
+            else:
+                self._userids = self._userids - {userid}
+            self.version += 1
+
+    def invalidate(self):
+        """Discard the cached set, so it is reloaded on next access."""
+        with self._lock:
+            self._userids = None
+            self.version += 1
+
+    def _stale(self):
+        return self._clock() - self._loaded_at >= self.ttl
+
+    def _load(self, session):
+        loaded_at = self._clock()
+        query = session.query(User.userid).filter_by(nipsa=True)
+        userids = frozenset(u.userid for u in query)
+        with self._lock:
+            self._userids = userids
+            self._loaded_at = loaded_at
+            self.version += 1
+        return userids
+
+
+#: The cache shared by all NipsaService instances in this process.
+CACHE = NipsaCache()
+
 
 class NipsaService(object):
 
     """
     A service which provides access to the state of "not-in-public-site-areas"
     (NIPSA) flags on userids.
+
+    :param session: the SQLAlchemy session object
+    :param cache: the :py:class:`NipsaCache` to read flagged userids from
+        (defaults to the process-wide cache)
+    :param publish: an optional callable which is called with the userid and
+        new NIPSA flag of a user whenever it is changed, to tell other
+        processes about the change
+    :param transaction_manager: an optional transaction manager; if given,
+        the cache is only updated, and changes only published and reindexed,
+        once the transaction which changed the flag commits
     """
 
-    def __init__(self, session):
+    def __init__(self, session, cache=None, publish=None, transaction_manager=None):
         self.session = session
-        self._flagged_userids = None
+        self.cache = CACHE if cache is None else cache
+        self.publish = publish
+        self.transaction_manager = transaction_manager
 
     @property
     def flagged_userids(self):
         """
         A list of all the NIPSA'd userids.
 
-        :rtype: set of unicode strings
+        :rtype: frozenset of unicode strings
         """
-        if self._flagged_userids is None:
-            query = self.session.query(User).filter_by(nipsa=True)
-            self._flagged_userids = set([u.userid for u in query])
-        return self._flagged_userids
+        return self.cache.get(self.session)
 
     def is_flagged(self, userid):
         """Return whether the given userid is flagged as "NIPSA"."""
@@ -41,7 +139,7 @@ class NipsaService(object):
         message for the user will still be published to the queue).
         """
         user.nipsa = True
-        reindex_user_annotations.delay(user.userid)
+        self._changed(user)
 
     def unflag(self, user):
         """
@@ -52,12 +150,38 @@ class NipsaService(object):
         queue).
         """
         user.nipsa = False
-        reindex_user_annotations.delay(user.userid)
+        self._changed(user)
 
     def clear(self):
-        self._flagged_userids = None
+        """Discard the cached NIPSA'd userids, reloading them on next access."""
+        self.cache.invalidate()
+
+    def _changed(self, user):
+        userid, nipsa = user.userid, user.nipsa
+
+        def apply_change(committed=True):
+            if not committed:
+                return
+            self.cache.update(userid, nipsa)
+            if self.publish is not None:
+                self.publish(userid, nipsa)
+            reindex_user_annotations.delay(userid)
+
+        if self.transaction_manager is None:
+            apply_change()
+        else:
+            self.transaction_manager.get().addAfterCommitHook(apply_change)
 
 
 def nipsa_factory(context, request):
     """Return a NipsaService instance for the passed context and request."""
-    return NipsaService(request.db)
+    return NipsaService(request.db,
+                        publish=partial(_publish, request),
+                        transaction_manager=getattr(request, 'tm', None))
+
+
+def _publish(request, userid, nipsa):
+    request.realtime.publish_nipsa({
+        'userid': userid,
+        'nipsa': nipsa,
+    })
@@ -18,17 +18,25 @@ from __future__ import unicode_literals
 #        such, it probably makes more sense for this to be split up into a
 #        couple of different services at some point.
 
+from collections import OrderedDict
 from datetime import datetime
+import json
 
 from pyramid import i18n
+import sqlalchemy as sa
 
 from h import models, schemas
 from h.db import types
 from h.util.group_scope import match as group_scope_match
+from h.util.uri import normalize as uri_normalize
+from h.models import document as document_model
 from h.models.document import update_document_metadata
 
 _ = i18n.TranslationStringFactory(__package__)
 
+# Marks a cache miss in _document_uris
+_MISSING = object()
+
 
 def fetch_annotation(session, id_):
     """
@@ -49,6 +57,39 @@ def fetch_annotation(session, id_):
         return None
 
 
+def fetch_annotations(session, ids):
+    """
+    Fetch the annotations with the given ids in a single query.
+
+    Like :py:func:`fetch_annotation`, and unlike
+    :py:func:`fetch_ordered_annotations`, ids which aren't valid annotation
+    ids are ignored.
+
+    :param session: the database session
+    :type session: sqlalchemy.orm.session.Session
+
+    :param ids: the annotation ids
+    :type ids: list
+
+    :returns: a dict mapping the id of each annotation found to the annotation
+    :rtype: dict
+    """
+    id_type = types.URLSafeUUID()
+    valid_ids = []
+    for id_ in ids:
+        try:
+            id_type.process_bind_param(id_, None)
+        except types.InvalidUUID:
+            continue
+        valid_ids.append(id_)
+
+    if not valid_ids:
+        return {}
+
+    query = session.query(models.Annotation).filter(models.Annotation.id.in_(valid_ids))
+    return {annotation.id: annotation for annotation in query}
+
+
 def fetch_ordered_annotations(session, ids, query_processor=None):
     """
     Fetch all annotations with the given ids and order them based on the list
@@ -85,6 +126,38 @@ def fetch_ordered_annotations(session, ids, query_processor=None):
     return anns
 
 
+def fetch_thread_ids(session, ids):
+    """
+    Fetch the IDs of the annotations in the threads of the given annotations.
+
+    This is equivalent to reading :py:attr:`h.models.Annotation.thread_ids`
+    for each annotation, but uses a single query for all of them and doesn't
+    load the replies themselves.
+
+    :param session: the database session
+    :type session: sqlalchemy.orm.session.Session
+
+    :param ids: the list of annotation ids
+    :type ids: list
+
+    :returns: a dict mapping each of the given ids to a list of the ids of
+        the replies in its thread. Annotations which aren't thread roots map
+        to an empty list.
+    :rtype: dict
+    """
+    thread_ids = {id_: [] for id_ in ids}
+    if not thread_ids:
+        return thread_ids
+
+    root_id = models.Annotation.references[0]
+    query = session.query(root_id, sa.func.array_agg(models.Annotation.id)) \
+                   .filter(root_id.in_(list(thread_ids))) \
+                   .group_by(root_id)
+    for id_, reply_ids in query:
+        thread_ids[id_] = reply_ids
+    return thread_ids
+
+
 def create_annotation(request, data, group_service):
     """
     Create an annotation from already-validated data.
@@ -105,48 +178,21 @@ def create_annotation(request, data, group_service):
     """
     created = updated = datetime.utcnow()
 
-    document_uri_dicts = data['document']['document_uri_dicts']
-    document_meta_dicts = data['document']['document_meta_dicts']
-    del data['document']
+    document = data.pop('document')
 
-    # Replies must have the same group as their parent.
+    parent = None
     if data['references']:
-        top_level_annotation_id = data['references'][0]
-        top_level_annotation = fetch_annotation(request.db,
-                                                top_level_annotation_id)
-        if top_level_annotation:
-            data['groupid'] = top_level_annotation.groupid
-        else:
-            raise schemas.ValidationError(
-                'references.0: ' +
-                _('Annotation {id} does not exist').format(
-                    id=top_level_annotation_id)
-            )
+        parent = fetch_annotation(request.db, data['references'][0])
 
-    # The user must have permission to create an annotation in the group
-    # they've asked to create one in. If the application didn't configure
-    # a groupfinder we will allow writing this annotation without any
-    # further checks.
-    group = group_service.find(data['groupid'])
-    if group is None or not request.has_permission('write', context=group):
-        raise schemas.ValidationError('group: ' +
-                                      _('You may not create annotations '
-                                        'in the specified group!'))
-
-    _validate_group_scope(group, data['target_uri'])
-
-    annotation = models.Annotation(**data)
+    annotation = _new_annotation(request, data, group_service, parent)
     annotation.created = created
     annotation.updated = updated
 
-    document = update_document_metadata(
-        request.db,
-        annotation.target_uri,
-        document_meta_dicts,
-        document_uri_dicts,
-        created=created,
-        updated=updated)
-    annotation.document = document
+    annotation.document = _update_document(request.db,
+                                           annotation.target_uri,
+                                           document,
+                                           created=created,
+                                           updated=updated)
 
     request.db.add(annotation)
     request.db.flush()
@@ -154,6 +200,86 @@ def create_annotation(request, data, group_service):
     return annotation
 
 
+def create_annotations(request, datas, group_service):
+    """
+    Create annotations from a batch of already-validated data.
+
+    This is the batch equivalent of :py:func:`create_annotation`. The parents
+    of replies are fetched in one query, the document of each distinct target
+    is updated once however many annotations there are of it, and all of the
+    annotations are inserted by a single flush. An annotation which can't be
+    created doesn't stop the others from being created.
+
+    :param request: the request object
+    :type request: pyramid.request.Request
+
+    :param datas: annotation data dicts that have already been validated by
+        :py:class:`h.schemas.annotation.CreateAnnotationSchema`
+    :type datas: list of dicts
+
+    :param group_service: a service object that implements
+        :py:class:`h.interfaces.IGroupService`
+    :type group_service: :py:class:`h.interfaces.IGroupService`
+
+    :returns: for each of `datas` in order, either the created annotation or
+        the :py:exc:`h.schemas.ValidationError` which prevented it from being
+        created
+    :rtype: list
+    """
+    created = updated = datetime.utcnow()
+
+    parents = fetch_annotations(request.db,
+                                [data['references'][0] for data in datas
+                                 if data['references']])
+
+    results = []
+    targets = OrderedDict()
+    for data in datas:
+        document = data.pop('document')
+
+        parent = None
+        if data['references']:
+            parent = parents.get(data['references'][0])
+
+        try:
+            annotation = _new_annotation(request, data, group_service, parent)
+        except schemas.ValidationError as err:
+            results.append(err)
+            continue
+        annotation.created = created
+        annotation.updated = updated
+        results.append(annotation)
+
+        key = json.dumps([annotation.target_uri, document], sort_keys=True)
+        if key not in targets:
+            targets[key] = (annotation.target_uri, document, [])
+        targets[key][2].append(annotation)
+
+    documents = {}
+    for key, (target_uri, document, _) in targets.items():
+        documents[key] = _update_document(request.db, target_uri, document,
+                                          created=created, updated=updated)
+
+    # Updating a later document can merge an earlier one into it, deleting
+    # the earlier one, so update any which were merged again to find the
+    # documents they were merged into.
+    for key, document in documents.items():
+        if sa.inspect(document).was_deleted:
+            target_uri, document, _ = targets[key]
+            documents[key] = _update_document(request.db, target_uri, document,
+                                              created=created, updated=updated)
+
+    # The annotations are only attached to their documents now, as doing so
+    # adds them to the session, and updating documents flushes the session.
+    for key, (_, _, annotations) in targets.items():
+        for annotation in annotations:
+            annotation.document = documents[key]
+            request.db.add(annotation)
+    request.db.flush()
+
+    return results
+
+
 def update_annotation(request, id_, data, group_service):
     """
     Update an existing annotation and its associated document metadata.
@@ -183,8 +309,9 @@ def update_annotation(request, id_, data, group_service):
     document = data.pop('document', None)
 
     annotation = request.db.query(models.Annotation).get(id_)
-    annotation.updated = updated
 
+    # Validate the update before changing the annotation at all, as the batch
+    # API commits the changes of other operations after this raises.
     group = group_service.find(annotation.groupid)
     if group is None:
         raise schemas.ValidationError('group: ' +
@@ -192,6 +319,7 @@ def update_annotation(request, id_, data, group_service):
     if data.get('target_uri', None):
         _validate_group_scope(group, data['target_uri'])
 
+    annotation.updated = updated
     annotation.extra.update(data.pop('extra', {}))
 
     for key, value in data.items():
@@ -242,20 +370,83 @@ def expand_uri(session, uri):
     :returns: a list of equivalent URIs
     :rtype: list
     """
-    doc = models.Document.find_by_uris(session, [uri]).one_or_none()
+    docuris = _document_uris(session, uri)
 
-    if doc is None:
+    if docuris is None:
         return [uri]
 
     # We check if the match was a "canonical" link. If so, all annotations
     # created on that page are guaranteed to have that as their target.source
     # field, so we don't need to expand to other URIs and risk false positives.
-    docuris = doc.document_uris
-    for docuri in docuris:
-        if docuri.uri == uri and docuri.type == 'rel-canonical':
+    for docuri, type_ in docuris:
+        if docuri == uri and type_ == 'rel-canonical':
             return [uri]
 
-    return [docuri.uri for docuri in docuris]
+    return [docuri for docuri, _ in docuris]
+
+
+def _document_uris(session, uri):
+    """
+    Return the (uri, type) pairs of the document that `uri` belongs to.
+
+    Returns ``None`` if there is no such document. Results are cached in
+    :py:data:`h.models.document.uri_expansion_cache`.
+    """
+    cache = document_model.uri_expansion_cache
+    key = uri_normalize(uri)
+
+    docuris = cache.get(key, _MISSING)
+    if docuris is _MISSING:
+        doc = models.Document.find_by_uris(session, [uri]).one_or_none()
+        if doc is not None:
+            docuris = tuple((d.uri, d.type) for d in doc.document_uris)
+        else:
+            docuris = None
+        cache.set(key, docuris)
+    return docuris
+
+
+def _new_annotation(request, data, group_service, parent):
+    """
+    Return a new, unsaved annotation from already-validated data.
+
+    :param parent: the annotation that `data` replies to, or ``None`` if it
+        isn't a reply or the annotation it replies to doesn't exist
+    :raises h.schemas.ValidationError: if the annotation may not be created
+    """
+    # Replies must have the same group as their parent.
+    if data['references']:
+        if parent is None:
+            raise schemas.ValidationError(
+                'references.0: ' +
+                _('Annotation {id} does not exist').format(
+                    id=data['references'][0])
+            )
+        data['groupid'] = parent.groupid
+
+    # The user must have permission to create an annotation in the group
+    # they've asked to create one in. If the application didn't configure
+    # a groupfinder we will allow writing this annotation without any
+    # further checks.
+    group = group_service.find(data['groupid'])
+    if group is None or not request.has_permission('write', context=group):
+        raise schemas.ValidationError('group: ' +
+                                      _('You may not create annotations '
+                                        'in the specified group!'))
+
+    _validate_group_scope(group, data['target_uri'])
+
+    return models.Annotation(**data)
+
+
+def _update_document(session, target_uri, document, created, updated):
+    """Create or update the document from a validated "document" dict."""
+    return update_document_metadata(session,
+                                     target_uri,
+                                     document['document_meta_dicts'],
+                                     document['document_uri_dicts'],
+                                     created=created,
+                                     updated=updated)
 
 
 def _validate_group_scope(group, target_uri):
@@ -1,11 +1,10 @@
 # -*- coding: utf-8 -*-
 
 from __future__ import unicode_literals
-import copy
 import operator
 import unicodedata
 
-from jsonpointer import resolve_pointer
+from jsonpointer import JsonPointer
 from h._compat import text_type
 
 SCHEMA = {
@@ -42,127 +41,171 @@ SCHEMA = {
 
 
 class FilterHandler(object):
+
+    """
+    A compiled streamer filter.
+
+    The filter is compiled once, when the client sends it: JSON pointers are
+    parsed, clause values are folded (and turned into sets where possible)
+    and operators are bound into closures. Matching an annotation then only
+    needs to fold the annotation's fields and compare them.
+
+    Raises :py:exc:`jsonpointer.JsonPointerException` for a filter with an
+    invalid field pointer and :py:exc:`ValueError` for a filter with an
+    unknown match policy or operator, or with an incomplete clause.
+    """
+
     def __init__(self, filter_json):
         self.filter = filter_json
 
-    # operators
-    operators = {
-        'equals': 'eq',
-        'matches': 'contains',
-        'lt': 'lt',
-        'le': 'le',
-        'gt': 'gt',
-        'ge': 'ge',
-        'one_of': 'contains',
-        'first_of': 'first_of',
-        'match_of': 'match_of',
-        'lene': 'lene',
-        'leng': 'leng',
-        'lenge': 'lenge',
-        'lenl': 'lenl',
-        'lenle': 'lenle',
-    }
-
-    def evaluate_clause(self, clause, target):
-        if isinstance(clause['field'], list):
-            for field in clause['field']:
-                copied = copy.deepcopy(clause)
-                copied['field'] = field
-                result = self.evaluate_clause(copied, target)
-                if result:
-                    return True
-            return False
+        self._actions = filter_json['actions']
+        clauses = [_compile_clause(c) for c in filter_json['clauses']]
+        if clauses:
+            self._predicate = _compile_policy(filter_json['match_policy'],
+                                              clauses)
         else:
-            field_value = resolve_pointer(target, clause['field'], None)
-            if field_value is None:
-                return False
+            self._predicate = None
 
-            cval = clause['value']
-            fval = field_value
+    def match(self, target, action=None):
+        """
+        Return True if `target` matches this filter.
+
+        `target` is either a serialized annotation or a :py:class:`Target`
+        wrapping one. Passing the same :py:class:`Target` to many filters
+        means that its fields are only looked up and folded once.
+        """
+        if action and action != 'past' and action not in self._actions:
+            return False
+        if self._predicate is None:
+            return True
+        if not isinstance(target, Target):
+            target = Target(target)
+        return self._predicate(target)
 
-            if isinstance(cval, list):
-                tval = []
-                for cv in cval:
-                    tval.append(uni_fold(cv))
-                cval = tval
-            else:
-                cval = uni_fold(cval)
 
-            if isinstance(fval, list):
-                tval = []
-                for fv in fval:
-                    tval.append(uni_fold(fv))
-                fval = tval
-            else:
-                fval = uni_fold(fval)
-
-            reversed_order = False
-            # Determining operator order
-            # Normal order: field_value, clause['value']
-            # i.e. condition created > 2000.01.01
-            # Here clause['value'] = '2001.01.01'.
-            # The field_value is target['created']
-            # So the natural order is: ge(field_value, clause['value']
-
-            # But!
-            # Reversed operator order for contains (b in a)
-            if isinstance(cval, list) or isinstance(fval, list):
-                if clause['operator'] in ['one_of', 'matches']:
-                    reversed_order = True
-                    # But not in every case. (i.e. tags matches 'b')
-                    # Here field_value is a list, because an annotation can
-                    # have many tags.
-                    if isinstance(field_value, list):
-                        reversed_order = False
-
-            if reversed_order:
-                lval = cval
-                rval = fval
-            else:
-                lval = fval
-                rval = cval
+class Target(object):
 
-            op = getattr(operator, self.operators[clause['operator']])
-            return op(lval, rval)
+    """
+    A serialized annotation to be matched against streamer filters.
 
-    # match_policies
-    def include_any(self, target):
-        for clause in self.filter['clauses']:
-            if self.evaluate_clause(clause, target):
-                return True
-        return False
+    Caches the folded value of each field that filters look up, so that
+    matching an annotation against many filters folds each field once.
+    """
 
-    def include_all(self, target):
-        for clause in self.filter['clauses']:
-            if not self.evaluate_clause(clause, target):
-                return False
-        return True
+    def __init__(self, annotation):
+        self.annotation = annotation
+        self._fields = {}
 
-    def exclude_all(self, target):
-        for clause in self.filter['clauses']:
-            if not self.evaluate_clause(clause, target):
-                return True
-        return False
+    def field(self, path, pointer):
+        """
+        Return the value of the field at `pointer` and its folded form.
 
-    def exclude_any(self, target):
-        for clause in self.filter['clauses']:
-            if self.evaluate_clause(clause, target):
-                return False
-        return True
+        :param path: the JSON pointer string, used as the cache key
+        :param pointer: the parsed ``jsonpointer.JsonPointer`` for `path`
 
-    def match(self, target, action=None):
-        if not action or action == 'past' or action in self.filter['actions']:
-            if len(self.filter['clauses']) > 0:
-                return getattr(self, self.filter['match_policy'])(target)
+        :returns: a ``(value, folded)`` tuple, where `value` is None if the
+            annotation has no such field
+        """
+        try:
+            return self._fields[path]
+        except KeyError:
+            pass
+
+        value = pointer.resolve(self.annotation, None)
+        if isinstance(value, list):
+            folded = [uni_fold(v) for v in value]
+        else:
+            folded = uni_fold(value)
+
+        self._fields[path] = (value, folded)
+        return value, folded
+
+
+def _compile_policy(match_policy, clauses):
+    if match_policy == 'include_any':
+        return lambda target: any(c(target) for c in clauses)
+    if match_policy == 'include_all':
+        return lambda target: all(c(target) for c in clauses)
+    if match_policy == 'exclude_all':
+        return lambda target: not all(c(target) for c in clauses)
+    if match_policy == 'exclude_any':
+        return lambda target: not any(c(target) for c in clauses)
+    raise ValueError('unknown match policy: {!r}'.format(match_policy))
+
+
+def _compile_clause(clause):
+    """
+    Compile a filter clause into a predicate on a :py:class:`Target`.
+
+    Normally a clause compares the field value with the clause value, so a
+    clause ``created gt 2000-01-01`` means ``created > '2000-01-01'``. The
+    ``one_of`` and ``matches`` operators test for containment, though, and if
+    the clause value is a list and the field value isn't (``uri one_of
+    [...]``) the order is reversed: they test whether the field value is in
+    the clause value. When the field value is itself a list (``tags matches
+    'foo'``) the normal order applies.
+    """
+    try:
+        fields = clause['field']
+        operator_name = clause['operator']
+        value = clause['value']
+    except KeyError as exc:
+        raise ValueError('clause is missing {}'.format(exc))
+
+    if not isinstance(fields, list):
+        fields = [fields]
+    pointers = [(f, JsonPointer(f)) for f in fields]
+
+    try:
+        op = OPERATORS[operator_name]
+    except KeyError:
+        raise ValueError('unknown operator: {!r}'.format(operator_name))
+
+    value_is_list = isinstance(value, list)
+    if value_is_list:
+        value = [uni_fold(v) for v in value]
+        members = _frozenset_or_none(value)
+    else:
+        value = uni_fold(value)
+        members = None
+
+    reversible = value_is_list and operator_name in ('one_of', 'matches')
+
+    def evaluate(target):
+        for path, pointer in pointers:
+            field_value, folded = target.field(path, pointer)
+            if field_value is None:
+                continue
+            if reversible and not isinstance(field_value, list):
+                result = _contains(members, value, folded)
             else:
+                result = op(folded, value)
+            if result:
                 return True
-        else:
-            return False
+        return False
+
+    return evaluate
+
+
+def _frozenset_or_none(values):
+    try:
+        return frozenset(values)
+    except TypeError:
+        return None
+
+
+def _contains(members, values, item):
+    """Return True if `item` is in `values`, using `members` if possible."""
+    if members is not None:
+        try:
+            return item in members
+        except TypeError:
+            pass
+    return item in values
 
 
 def first_of(a, b):
     return a[0] == b
-setattr(operator, 'first_of', first_of)  # noqa:E305
 
 
 def match_of(a, b):
@@ -170,32 +213,45 @@ def match_of(a, b):
         if subb in a:
             return True
     return False
-setattr(operator, 'match_of', match_of)  # noqa:E305
 
 
 def lene(a, b):
     return len(a) == b
-setattr(operator, 'lene', lene)  # noqa:E305
 
 
 def leng(a, b):
     return len(a) > b
-setattr(operator, 'leng', leng)  # noqa:E305
 
 
 def lenge(a, b):
     return len(a) >= b
-setattr(operator, 'lenge', lenge)  # noqa:E305
 
 
 def lenl(a, b):
     return len(a) < b
-setattr(operator, 'lenl', lenl)  # noqa:E305
 
 
 def lenle(a, b):
     return len(a) <= b
-setattr(operator, 'lenle', lenle)  # noqa:E305
+
+
+# Filter clause operators, as functions of (field value, clause value)
+OPERATORS = {
+    'equals': operator.eq,
+    'matches': operator.contains,
+    'lt': operator.lt,
+    'le': operator.le,
+    'gt': operator.gt,
+    'ge': operator.ge,
+    'one_of': operator.contains,
+    'first_of': first_of,
+    'match_of': match_of,
+    'lene': lene,
+    'leng': leng,
+    'lenge': lenge,
+    'lenl': lenl,
+    'lenle': lenle,
+}
 
 
 def uni_fold(text):
@@ -5,16 +5,21 @@ from collections import namedtuple
 import logging
 
 from gevent.queue import Full
+from sqlalchemy.orm import joinedload
 
+from h import models
 from h import presenters
 from h import realtime
 from h import storage
 from h.realtime import Consumer
 from h.traversal import AnnotationContext
 from h.auth.util import translate_annotation_principals
+from h.db import types
 from h.services.links import LinksService
+from h.services import nipsa
 from h.services.nipsa import NipsaService
 from h.services.groupfinder import GroupfinderService
+from h.streamer import filter
 from h.streamer import websocket
 import h.sentry
 import h.stats
@@ -28,6 +33,56 @@ log = logging.getLogger(__name__)
 Message = namedtuple('Message', ['topic', 'payload'])
 
 
+class PresentedAnnotation(object):
+
+    """
+    An annotation serialized for fan-out to many websockets.
+
+    Rendering an annotation (building its links, evaluating its ACL and
+    running the JSON presenter) is by far the most expensive part of deciding
+    whether to notify a socket about an annotation event, and its result does
+    not depend on the socket. This renders the annotation lazily, the first
+    time a socket needs it, and shares the result with every other socket.
+    """
+
+    def __init__(self, annotation, group_service):
+        self.annotation = annotation
+        self.group_service = group_service
+
+        # Sockets all share the application registry in practice, but links
+        # are generated from a socket's registry so we render once per
+        # distinct registry.
+        self._rendered = {}
+
+    def render(self, registry):
+        """
+        Return the serialized annotation, its read principals and a filter
+        target.
+
+        :param registry: the registry in which to look up routes for links
+        :type registry: pyramid.registry.Registry
+
+        :returns: a ``(serialized, read_principals, target)`` tuple, where
+            ``read_principals`` is a frozenset of the principals allowed to
+            read the annotation and ``target`` is a
+            :py:class:`h.streamer.filter.Target` to match socket filters
+            against
+        """
+        key = id(registry)
+        if key not in self._rendered:
+            base_url = registry.settings.get('h.app_url',
+                                             'http://localhost:5000')
+            links_service = LinksService(base_url, registry)
+            resource = AnnotationContext(self.annotation,
+                                         self.group_service,
+                                         links_service)
+            serialized = presenters.AnnotationJSONPresenter(resource).asdict()
+            read_principals = _read_principals(serialized.get('permissions', {}))
+            target = filter.Target(serialized)
+            self._rendered[key] = (serialized, read_principals, target)
+        return self._rendered[key]
+
+
 def process_messages(settings, routing_key, work_queue, raise_error=True):
     """
     Configure, start, and monitor a realtime consumer for the specified
@@ -77,14 +132,31 @@ def handle_message(message, settings, session, topic_handlers):
         raise RuntimeError("Don't know how to handle message from topic: "
                            "{}".format(message.topic))
 
-    # N.B. We iterate over a non-weak list of instances because there's nothing
-    # to stop connections being added or dropped during iteration, and if that
-    # happens Python will throw a "Set changed size during iteration" error.
-    sockets = list(websocket.WebSocket.instances)
-    handler(message.payload, sockets, settings, session)
+    handler(message.payload, websocket.WebSocket.instances, settings, session)
+
+
+def handle_annotation_batch(batch, settings, session):
+    """
+    Process a batch of messages from the annotation topic.
+
+    This is equivalent to calling :py:func:`handle_message` for each message
+    in turn, but loads all of the annotations in one query and shares NIPSA
+    and group lookups between them.
+    """
+    handle_annotation_events([m.payload for m in batch],
+                             websocket.WebSocket.instances,
+                             settings,
+                             session)
 
 
 def handle_annotation_event(message, sockets, settings, session):
+    """
+    Send an annotation event to those of `sockets` subscribed to it.
+
+    The subscribed sockets are looked up in
+    :py:attr:`h.streamer.websocket.WebSocket.subscriptions`, rather than by
+    checking the filter of every one of `sockets`.
+    """
     id_ = message['annotation_id']
     annotation = storage.fetch_annotation(session, id_)
 
@@ -93,27 +165,90 @@ def handle_annotation_event(message, sockets, settings, session):
         return
 
     nipsa_service = NipsaService(session)
-    user_nipsad = nipsa_service.is_flagged(annotation.userid)
+    authority = text_type(settings.get('h.authority', 'localhost'))
+    group_service = GroupfinderService(session, authority)
+
+    _fan_out_annotation_event(message, annotation, sockets, nipsa_service, group_service)
 
+
+def handle_annotation_events(messages, sockets, settings, session):
+    """
+    Handle several annotation event messages, in order.
+
+    An error handling one of the events is logged and reported, and doesn't
+    stop the other events from being sent.
+    """
+    ids = [m['annotation_id'] for m in messages]
+    annotations = {a.id: a for a in _fetch_annotations(session, ids)}
+
+    # One snapshot of NIPSA'd users, and one cache of groups, for the batch
+    nipsa_service = NipsaService(session)
     authority = text_type(settings.get('h.authority', 'localhost'))
     group_service = GroupfinderService(session, authority)
 
+    for message in messages:
+        annotation = annotations.get(message['annotation_id'])
+        if annotation is None:
+            log.warn('received annotation event for missing annotation: %s',
+                     message['annotation_id'])
+            continue
+        try:
+            _fan_out_annotation_event(message, annotation, sockets, nipsa_service, group_service)
+        except Exception:
+            log.exception('Caught exception handling annotation event: %s',
+                          message['annotation_id'])
+            h.sentry.get_client(settings).captureException()
+
+
+def _fetch_annotations(session, ids):
+    def eager_load_documents(query):
+        return query.options(joinedload(models.Annotation.document))
+
+    try:
+        return storage.fetch_ordered_annotations(session, list(set(ids)),
+                                                 query_processor=eager_load_documents)
+    except types.InvalidUUID:
+        # Fall back to fetching the valid IDs one by one
+        annotations = [storage.fetch_annotation(session, id_) for id_ in set(ids)]
+        return [a for a in annotations if a is not None]
+
+
+def _fan_out_annotation_event(message, annotation, sockets, nipsa_service, group_service):
+    user_nipsad = nipsa_service.is_flagged(annotation.userid)
+
+    # Only sockets whose filters could match the annotation's URI need to be
+    # considered at all.
+    candidates = websocket.WebSocket.subscriptions.candidates(annotation.target_uri)
+    sockets = [socket for socket in candidates if socket in sockets]
+
+    # The annotation is serialized once for the whole event, rather than once
+    # for every connected socket.
+    presented = PresentedAnnotation(annotation, group_service)
+
     for socket in sockets:
-        reply = _generate_annotation_event(message, socket, annotation, user_nipsad, group_service)
+        reply = _generate_annotation_event(message, socket, presented, user_nipsad)
         if reply is None:
             continue
         socket.send_json(reply)
 
 
 def handle_user_event(message, sockets, settings, session):
-    for socket in sockets:
+    # N.B. We iterate over a non-weak list of sockets because there's nothing
+    # to stop connections being added or dropped during iteration, and if that
+    # happens Python will throw a "Set changed size during iteration" error.
+    for socket in list(sockets):
         reply = _generate_user_event(message, socket)
         if reply is None:
             continue
         socket.send_json(reply)
 
 
-def _generate_annotation_event(message, socket, annotation, user_nipsad, group_service):
+def handle_nipsa_event(message, sockets, settings, session):
+    """Apply a change to a user's NIPSA flag to the process-wide cache."""
+    nipsa.CACHE.update(message['userid'], message['nipsa'])
+
+
+def _generate_annotation_event(message, socket, presented, user_nipsad):
     """
     Get message about annotation event `message` to be sent to `socket`.
 
@@ -137,30 +272,25 @@ def _generate_annotation_event(message, socket, annotation, user_nipsad, group_s
 
     # Don't sent annotations from NIPSA'd users to anyone other than that
     # user.
-    if user_nipsad and socket.authenticated_userid != annotation.userid:
+    if user_nipsad and socket.authenticated_userid != presented.annotation.userid:
         return None
 
-    notification = {
-        'type': 'annotation-notification',
-        'options': {'action': action},
-    }
-
-    base_url = socket.registry.settings.get('h.app_url',
-                                            'http://localhost:5000')
-    links_service = LinksService(base_url, socket.registry)
-    resource = AnnotationContext(annotation, group_service, links_service)
-    serialized = presenters.AnnotationJSONPresenter(resource).asdict()
+    serialized, read_principals, target = presented.render(socket.registry)
 
-    permissions = serialized.get('permissions')
-    if not _authorized_to_read(socket.effective_principals, permissions):
+    if read_principals.isdisjoint(socket.effective_principals):
         return None
 
-    if not socket.filter.match(serialized, action):
+    if not socket.filter.match(target, action):
         return None
 
+    notification = {
+        'type': 'annotation-notification',
+        'options': {'action': action},
+    }
+
     notification['payload'] = [serialized]
     if action == 'delete':
-        notification['payload'] = [{'id': annotation.id}]
+        notification['payload'] = [{'id': presented.annotation.id}]
     return notification
 
 
@@ -187,14 +317,14 @@ def _generate_user_event(message, socket):
     }
 
 
-def _authorized_to_read(effective_principals, permissions):
-    """Return True if the passed request is authorized to read the annotation.
+def _read_principals(permissions):
+    """
+    Return the principals allowed to read an annotation.
 
-    If the annotation belongs to a private group, this will return False if the
-    authenticated user isn't a member of that group.
+    `permissions` is the legacy permissions dict of a serialized annotation.
+    A socket may receive the annotation if any of its effective principals
+    are in the returned set. For annotations in private groups this means
+    only members of the group.
     """
     read_permissions = permissions.get('read', [])
-    read_principals = translate_annotation_principals(read_permissions)
-    if set(read_principals).intersection(effective_principals):
-        return True
-    return False
+    return frozenset(translate_annotation_principals(read_permissions))
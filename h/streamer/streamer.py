@@ -5,25 +5,96 @@ import logging
 import sys
 
 import gevent
+from gevent.queue import Full
 
 from h import db
 from h import stats
+from h.models.document import uri_expansion_cache
 from h.streamer import messages
 from h.streamer import websocket
 
 log = logging.getLogger(__name__)
 
-# Queue of messages to process, from both client websockets and message queues
-# to which the streamer is subscribed.
-#
-# The maxsize ensures that memory used by this queue is bounded. Producers
-# writing to the queue must consider their behaviour when the queue is full,
-# using .put(...) with a timeout or .put_nowait(...) as appropriate.
-WORK_QUEUE = gevent.queue.Queue(maxsize=4096)
+
+class Lane(object):
+
+    """
+    A lane of streamer work, drained by a pool of worker greenlets.
+
+    Each worker drains its own bounded queue, and work is assigned to a queue
+    by hashing a key computed from each message. Messages with the same key
+    are therefore always handled in the order they were queued, while
+    messages with different keys can be handled concurrently. A lane without
+    a `key` must only have one worker.
+
+    The maxsize ensures that memory used by the lane is bounded. Producers
+    writing to the lane must consider their behaviour when it is full, using
+    .put(...) with a timeout or .put_nowait(...) as appropriate. The lane
+    counts messages dropped because it was full.
+    """
+
+    def __init__(self, name, key=None, maxsize=4096, workers=1):
+        self.name = name
+        self.maxsize = maxsize
+        self.dropped = 0
+        self._key = key
+        self.resize(workers)
+
+    def resize(self, workers):
+        """
+        Set the number of workers (and queues) in this lane.
+
+        This must only be called before any work has been queued.
+        """
+        workers = max(1, workers)
+        maxsize = max(1, self.maxsize // workers)
+        self.queues = [gevent.queue.Queue(maxsize=maxsize)
+                       for _ in range(workers)]
+
+    def put(self, message, block=True, timeout=None):
+        """Queue `message`, raising :py:exc:`gevent.queue.Full` if full."""
+        queue = self._queue_for(message)
+        try:
+            queue.put(message, block=block, timeout=timeout)
+        except Full:
+            self.dropped += 1
+            raise
+
+    def put_nowait(self, message):
+        self.put(message, block=False)
+
+    def qsize(self):
+        return sum(q.qsize() for q in self.queues)
+
+    def _queue_for(self, message):
+        if len(self.queues) == 1:
+            return self.queues[0]
+        key = self._key(message)
+        return self.queues[hash(key) % len(self.queues)]
+
+
+def _socket_key(message):
+    """Keep control messages from each websocket in order."""
+    return id(message.socket)
+
+
+# Lanes of messages to process. Control messages from client websockets (ping,
+# filter, etc.) are cheap and must not wait behind annotation fan-out, so they
+# have their own lane. Realtime messages from the message queues to which the
+# streamer is subscribed go in the fan-out lane. Each realtime event is sent to
+# many sockets, and every socket must receive events in the order they were
+# published, so the fan-out lane always has a single worker.
+CONTROL_LANE = Lane('control', key=_socket_key)
+FANOUT_LANE = Lane('fanout')
+LANES = (CONTROL_LANE, FANOUT_LANE)
 
 # Message queues that the streamer processes messages from
 ANNOTATION_TOPIC = 'annotation'
 USER_TOPIC = 'user'
+NIPSA_TOPIC = 'nipsa'
+
+# Marks the end of a (finite) work queue
+_END = object()
 
 
 class UnknownMessageType(Exception):
@@ -35,26 +106,35 @@ def start(event):
     Start some greenlets to process the incoming data from the message queue.
 
     This subscriber is called when the application is booted, and kicks off
-    greenlets running `process_queue` for each message queue we subscribe to.
-    The function does not block.
+    greenlets running `process_queue` for each message queue we subscribe to,
+    and a pool of workers for each lane of work. The function does not block.
     """
     settings = event.app.registry.settings
+    CONTROL_LANE.resize(int(settings.get('h.streamer.control_workers', 1)))
+
     greenlets = [
         # Start greenlets to process messages from RabbitMQ
         gevent.spawn(messages.process_messages,
                      settings,
                      ANNOTATION_TOPIC,
-                     WORK_QUEUE),
+                     FANOUT_LANE),
         gevent.spawn(messages.process_messages,
                      settings,
                      USER_TOPIC,
-                     WORK_QUEUE),
+                     FANOUT_LANE),
+        gevent.spawn(messages.process_messages,
+                     settings,
+                     NIPSA_TOPIC,
+                     FANOUT_LANE),
         # A greenlet to periodically report to statsd
         gevent.spawn(report_stats, settings),
-        # And one to process the queued work
-        gevent.spawn(process_work_queue, settings, WORK_QUEUE)
     ]
 
+    # And pools of greenlets to process the queued work
+    for lane in LANES:
+        for queue in lane.queues:
+            greenlets.append(gevent.spawn(process_work_queue, settings, queue))
+
     # Start a "greenlet of last resort" to monitor the worker greenlets and
     # bail if any unexpected errors occur.
     gevent.spawn(supervise, greenlets)
@@ -68,6 +148,9 @@ def process_work_queue(settings, queue, session_factory=None):
     dispatching them as appropriate. The handling of each message is wrapped in
     code that ensures the database session is appropriately committed and
     closed between messages.
+
+    Consecutive annotation events are handled together in batches (see
+    :py:func:`_batches`), so that their annotations can be loaded at once.
     """
     if session_factory is None:
         session_factory = _get_session
@@ -76,9 +159,13 @@ def process_work_queue(settings, queue, session_factory=None):
     topic_handlers = {
         ANNOTATION_TOPIC: messages.handle_annotation_event,
         USER_TOPIC: messages.handle_user_event,
+        NIPSA_TOPIC: messages.handle_nipsa_event,
     }
+    batch_size = int(settings.get('h.streamer.batch_size', 50))
+    batch_wait = float(settings.get('h.streamer.batch_wait', 0.005))
 
-    for msg in queue:
+    for batch in _batches(queue, batch_size, batch_wait):
+        msg = batch[0]
         t_total = s.timer('streamer.msg.handler_total')
         t_total.start()
         try:
@@ -89,7 +176,10 @@ def process_work_queue(settings, queue, session_factory=None):
                             "READ ONLY "
                             "DEFERRABLE")
 
-            if isinstance(msg, messages.Message):
+            if len(batch) > 1:
+                with s.timer('streamer.msg.handler_batch'):
+                    messages.handle_annotation_batch(batch, settings, session)
+            elif isinstance(msg, messages.Message):
                 with s.timer('streamer.msg.handler_message'):
                     messages.handle_message(msg, settings, session, topic_handlers)
             elif isinstance(msg, websocket.Message):
@@ -112,12 +202,62 @@ def process_work_queue(settings, queue, session_factory=None):
         s.send()
 
 
+def _batches(queue, size, wait):
+    """
+    Yield lists of messages from `queue`, batching annotation events.
+
+    Each annotation event is batched together with up to `size - 1` annotation
+    events which immediately follow it in the queue, waiting up to `wait`
+    seconds for them to arrive. All other messages are yielded on their own,
+    and the order of messages is preserved.
+    """
+    iterator = iter(queue)
+    pending = None
+    exhausted = False
+
+    while not exhausted:
+        if pending is not None:
+            msg, pending = pending, None
+        else:
+            msg = next(iterator, _END)
+            if msg is _END:
+                return
+
+        batch = [msg]
+        if _is_annotation_event(msg):
+            with gevent.Timeout(wait, False):
+                while len(batch) < size:
+                    nxt = next(iterator, _END)
+                    if nxt is _END:
+                        exhausted = True
+                        break
+                    if not _is_annotation_event(nxt):
+                        pending = nxt
+                        break
+                    batch.append(nxt)
+        yield batch
+
+
+def _is_annotation_event(msg):
+    return isinstance(msg, messages.Message) and msg.topic == ANNOTATION_TOPIC
+
+
 def report_stats(settings):
     client = stats.get_client(settings)
     while True:
         client.gauge('streamer.connected_clients',
                      len(websocket.WebSocket.instances))
-        client.gauge('streamer.queue_length', WORK_QUEUE.qsize())
+        for lane in LANES:
+            client.gauge('streamer.lane.{}.queue_length'.format(lane.name),
+                         lane.qsize())
+            client.gauge('streamer.lane.{}.dropped'.format(lane.name),
+                         lane.dropped)
+        client.gauge('streamer.uri_expansion_cache.size',
+                     len(uri_expansion_cache))
+        client.gauge('streamer.uri_expansion_cache.hits',
+                     uri_expansion_cache.hits)
+        client.gauge('streamer.uri_expansion_cache.misses',
+                     uri_expansion_cache.misses)
         gevent.sleep(10)
 
 
@@ -17,7 +17,7 @@ def websocket_view(request):
         'h.ws.authenticated_userid': request.authenticated_userid,
         'h.ws.effective_principals': request.effective_principals,
         'h.ws.registry': request.registry,
-        'h.ws.streamer_work_queue': streamer.WORK_QUEUE,
+        'h.ws.streamer_work_queue': streamer.CONTROL_LANE,
     })
 
     # ...and ensure that any persistent connections associated with this
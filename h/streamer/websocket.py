@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 
 from __future__ import unicode_literals
-from collections import namedtuple
+from collections import defaultdict, namedtuple
 import copy
 import json
 import logging
@@ -9,9 +9,11 @@ import weakref
 
 from gevent.queue import Full
 import jsonschema
+from jsonpointer import JsonPointerException
 from ws4py.websocket import WebSocket as _WebSocket
 
 from h import storage
+from h._compat import text_type
 from h.streamer import filter
 
 log = logging.getLogger(__name__)
@@ -43,10 +45,121 @@ class Message(namedtuple('Message', [
         self.socket.send_json(data)
 
 
+class SubscriptionIndex(object):
+
+    """
+    An index of websockets by the annotation URIs their filters subscribe to.
+
+    Almost all clients send a filter consisting of ``/uri`` ``one_of``
+    clauses, which only ever match annotations on one of a handful of URIs.
+    Rather than asking every socket's filter whether it matches each
+    annotation event, the streamer looks up the sockets subscribed to the
+    annotation's URI here.
+
+    Sockets whose filters can't be expressed as a set of URIs are kept in a
+    separate "unindexed" set and are always returned as candidates, so that
+    their filters can be evaluated as usual. Sockets without a filter never
+    receive annotation events and are not indexed at all.
+
+    Sockets are weakly referenced, as in :py:attr:`WebSocket.instances`.
+    URIs are removed from the index when their last socket is removed or
+    garbage collected, so the index doesn't grow as clients come and go.
+    """
+
+    def __init__(self):
+        self._by_uri = defaultdict(weakref.WeakSet)
+        # Weak references to the indexed sockets, and the URIs of each.
+        self._uris = {}
+        self._unindexed = weakref.WeakSet()
+
+    def update(self, socket, filter_):
+        """Index `socket` by the URIs `filter_` (a filter dict) matches."""
+        self.remove(socket)
+        if filter_ is None:
+            return
+
+        uris = _filter_uris(filter_)
+        if uris is None:
+            self._unindexed.add(socket)
+            return
+
+        self._uris[weakref.ref(socket, self._collected)] = uris
+        for uri in uris:
+            self._by_uri[uri].add(socket)
+
+    def remove(self, socket):
+        """Remove `socket` from the index, if present."""
+        self._unindexed.discard(socket)
+        for uri in self._uris.pop(weakref.ref(socket), ()):
+            sockets = self._by_uri.get(uri)
+            if sockets is None:
+                continue
+            sockets.discard(socket)
+            self._prune(uri)
+
+    def _collected(self, ref):
+        """Remove the URIs of a garbage collected socket from the index."""
+        for uri in self._uris.pop(ref, ()):
+            self._prune(uri)
+
+    def _prune(self, uri):
+        # Iterating over a WeakSet skips sockets which have been collected
+        # but not yet removed from it.
+        sockets = self._by_uri.get(uri)
+        if sockets is not None and not any(True for _ in sockets):
+            del self._by_uri[uri]
+
+    def candidates(self, uri):
+        """
+        Return the open sockets which may be subscribed to `uri`.
+
+        The returned sockets' filters must still be checked against the
+        annotation: this only excludes sockets which cannot possibly match.
+        The cost depends only on the number of sockets returned, as closed
+        sockets are removed from the index when they close.
+        """
+        candidates = set(self._unindexed)
+        candidates.update(self._by_uri.get(filter.uni_fold(uri), ()))
+        return list(candidates)
+
+
+def _filter_uris(filter_):
+    """
+    Return the set of URIs which `filter_` matches, or None.
+
+    Returns None if the filter could match annotations on other URIs (or on
+    no particular URI at all) and so cannot be indexed. URIs are folded in the
+    same way that :py:class:`h.streamer.filter.FilterHandler` folds them
+    before comparison.
+    """
+    if filter_.get('match_policy') != 'include_any':
+        return None
+
+    clauses = filter_.get('clauses')
+    if not clauses:
+        return None
+
+    uris = set()
+    for clause in clauses:
+        if clause.get('field') != '/uri' or clause.get('operator') != 'one_of':
+            return None
+        value = clause.get('value')
+        if not isinstance(value, list):
+            return None
+        for item in value:
+            if not isinstance(item, (bytes, text_type)):
+                return None
+            uris.add(filter.uni_fold(item))
+    return frozenset(uris)
+
+
 class WebSocket(_WebSocket):
     # All instances of WebSocket, allowing us to iterate over open websockets
     instances = weakref.WeakSet()
 
+    # Open websockets indexed by the annotation URIs they are subscribed to
+    subscriptions = SubscriptionIndex()
+
     # Instance attributes
     client_id = None
     filter = None
@@ -88,6 +201,7 @@ class WebSocket(_WebSocket):
             self.instances.remove(self)
         except KeyError:
             pass
+        self.subscriptions.remove(self)
 
     def send_json(self, payload):
         if not self.terminated:
@@ -156,7 +270,16 @@ def handle_filter_message(message, session=None):
     if session is not None:
         # Add backend expands for clauses
         _expand_clauses(session, filter_)
-    message.socket.filter = filter.FilterHandler(filter_)
+    try:
+        filter_handler = filter.FilterHandler(filter_)
+    except (JsonPointerException, ValueError):
+        message.reply({'type': 'error',
+                       'error': {'type': 'invalid_data',
+                                 'description': 'failed to compile filter'}},
+                      ok=False)
+        return
+    message.socket.filter = filter_handler
+    WebSocket.subscriptions.update(message.socket, filter_)
 MESSAGE_HANDLERS['filter'] = handle_filter_message  # noqa: E305
 
 
@@ -1,13 +1,19 @@
 # -*- coding: utf-8 -*-
 
 from __future__ import unicode_literals
+import datetime
+
 from h import models, storage
 from h.celery import celery, get_task_logger
-from h.indexer.reindexer import SETTING_NEW_INDEX
+from h.indexer.catchup import catchup
+from h.indexer.reindexer import current_new_index
 from h.search.index import BatchIndexer, delete, index
 
 log = get_task_logger(__name__)
 
+#: The format of the times at which batches of annotations are queued
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
 
 @celery.task
 def add_annotation(id_):
@@ -26,6 +32,49 @@ def add_annotation(id_):
             add_annotation.delay(annotation.thread_root_id)
 
 
+@celery.task
+def add_annotations(ids, queued=None):
+    """
+    Index a batch of annotations using the Elasticsearch bulk API.
+
+    If `queued` is given, annotations which were updated after that time are
+    skipped: the request which updated them queued a batch of its own, which
+    will index them. Batches are queued a little while after they are
+    collected (see :py:class:`h.indexer.batch.IndexBatch`), so an annotation
+    edited by several requests in quick succession is only indexed once.
+
+    The thread roots of any replies in the batch are indexed as part of the
+    same batch, so a thread which receives many replies in one batch has its
+    root indexed only once.
+
+    :param ids: the IDs of the annotations to index
+    :param queued: the time at which the batch was queued, formatted with
+        :py:data:`TIME_FORMAT`
+    """
+    ids = set(ids)
+    if ids and queued is not None:
+        queued = datetime.datetime.strptime(queued, TIME_FORMAT)
+        ids.difference_update(_updated_ids(celery.request.db, ids, since=queued))
+    if not ids:
+        return
+
+    ids.update(_thread_root_ids(celery.request.db, ids))
+
+    indexer = BatchIndexer(celery.request.db, celery.request.es, celery.request)
+    errored = indexer.index(ids)
+
+    # If a reindex is running at the moment, add annotations to the new index
+    # as well.
+    future_index = _current_reindex_new_name(celery.request)
+    if future_index is not None:
+        indexer = BatchIndexer(celery.request.db, celery.request.es, celery.request,
+                               target_index=future_index)
+        errored.update(indexer.index(ids))
+
+    if errored:
+        log.warning('Failed to index annotations %s', errored)
+
+
 @celery.task
 def delete_annotation(id_):
     delete(celery.request.es, id_)
@@ -47,8 +96,25 @@ def reindex_user_annotations(userid):
         log.warning('Failed to re-index annotations %s', errored)
 
 
-def _current_reindex_new_name(request):
-    settings = celery.request.find_service(name='settings')
-    new_index = settings.get(SETTING_NEW_INDEX)
+@celery.task
+def catchup_annotations():
+    """Reindex the annotations which have changed since the last catch up."""
+    catchup(celery.request.db, celery.request.es, celery.request)
 
-    return new_index
+
+def _updated_ids(session, ids, since):
+    query = session.query(models.Annotation.id) \
+                   .filter(models.Annotation.id.in_(ids),
+                           models.Annotation.updated > since)
+    return set(id_ for (id_,) in query)
+
+
+def _thread_root_ids(session, ids):
+    query = session.query(models.Annotation.references) \
+                   .filter(models.Annotation.id.in_(ids))
+    return set(references[0] for (references,) in query if references)
+
+
+def _current_reindex_new_name(request):
+    settings = request.find_service(name='settings')
+    return current_new_index(settings)
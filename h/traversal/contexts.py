@@ -31,10 +31,17 @@ from h.models.organization import ORGANIZATION_DEFAULT_PUBID
 class AnnotationContext(object):
     """Context for annotation-based views."""
 
-    def __init__(self, annotation, group_service, links_service):
+    def __init__(self, annotation, group_service, links_service,
+                 group_principals=None):
+        """
+        :param group_principals: an optional dict, shared between the contexts
+            of many annotations, in which to remember the principals allowed
+            to read each group, so that they are only computed once per group
+        """
         self.group_service = group_service
         self.links_service = links_service
         self.annotation = annotation
+        self._group_principals_cache = group_principals
 
     @property
     def group(self):
@@ -56,7 +63,7 @@ class AnnotationContext(object):
 
         acl = []
         if self.annotation.shared:
-            for principal in self._group_principals(self.group):
+            for principal in self._read_principals():
                 acl.append((Allow, principal, 'read'))
         else:
             acl.append((Allow, self.annotation.userid, 'read'))
@@ -69,6 +76,17 @@ class AnnotationContext(object):
 
         return acl
 
+    def _read_principals(self):
+        cache = self._group_principals_cache
+        if cache is None:
+            return self._group_principals(self.group)
+
+        groupid = self.annotation.groupid
+        principals = cache.get(groupid)
+        if principals is None:
+            principals = cache[groupid] = self._group_principals(self.group)
+        return principals
+
     @staticmethod
     def _group_principals(group):
         if group is None:
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from collections import OrderedDict
+import threading
+import time
+
+
+class LRUCache(object):
+    """
+    A bounded, thread-safe least-recently-used cache with an optional TTL.
+
+    Unlike :py:func:`functools.lru_cache` this is a mapping rather than a
+    decorator, so entries can be invalidated individually, and it counts hits
+    and misses so that its size can be tuned.
+
+    Example::
+
+        cache = LRUCache(maxsize=1000, ttl=60)
+
+        value = cache.get(key)
+        if value is None:
+            value = load(key)
+            cache.set(key, value)
+
+    :param maxsize: the maximum number of entries to keep
+    :param ttl: how long (in seconds) an entry may be used for, or ``None``
+        if entries don't expire
+    :param clock: a callable returning the current time in seconds
+    """
+
+    def __init__(self, maxsize=128, ttl=None, clock=time.time):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key, default=None):
+        """Return the value cached for `key`, or `default` if there isn't one."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None or self._expired(entry):
+                self.misses += 1
+                return default
+            self._entries[key] = entry
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        """Cache `value` for `key`, evicting the least recently used entry if full."""
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, self._clock())
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def pop(self, key):
+        """Discard the value cached for `key`, if any."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def discard(self, predicate):
+        """Discard every value for which `predicate(value)` is true."""
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if predicate(entry[0]):
+                    del self._entries[key]
+
+    def clear(self):
+        """Discard all cached values."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _expired(self, entry):
+        return self.ttl is not None and self._clock() - entry[1] >= self.ttl
@@ -3,6 +3,8 @@
 """Database query utilities."""
 from __future__ import unicode_literals
 
+import operator
+
 import sqlalchemy as sa
 
 
@@ -20,18 +22,6 @@ def column_windows(session, column, windowsize=2000, where=None):
     .filter(...) clause.
     """
 
-    # This function is adapted from a recipe supplied by the SQLAlchemy
-    # maintainers:
-    #
-    #   https://bitbucket.org/zzzeek/sqlalchemy/wiki/UsageRecipes/WindowedRangeQuery
-    #
-    # In overview: we generate a list of all the possible values of `column`
-    # on the server, and then turn that list into a subquery with
-    # Query#from_self(). We then use the row number of the inner query to
-    # select every `windowsize`'th row. The resulting values are then
-    # translated into an iterable of SQLAlchemy expressions suitable for use
-    # in Query#filter(...).
-
     def interval_for_range(start_id, end_id):
         if end_id:
             return sa.and_(
@@ -41,26 +31,116 @@ def column_windows(session, column, windowsize=2000, where=None):
         else:
             return column >= start_id
 
-    q = session.query(
-        column,
-        sa.func.row_number().over(order_by=column).label('rownum')
-    )
+    for start, end in column_window_bounds(session, column, windowsize, where):
+        yield interval_for_range(start, end)
+
 
-    if where is not None:
-        q = q.filter(where)
+def column_window_bounds(session, column, windowsize=2000, where=None):
+    """
+    Return a series of ``(start, end)`` pairs that break a column into windows.
 
-    q = q.from_self(column)
+    Each window includes the rows whose value of `column` is at least
+    ``start`` and less than ``end``. The ``end`` of the last window is
+    ``None``, meaning that the window is unbounded above.
 
-    # Select every "windowsize'th" row from the inner query.
-    if windowsize > 1:
-        q = q.filter(sa.text("rownum %% %d=1" % windowsize))
+    Each bound is found by seeking `windowsize` rows past the previous one,
+    which only reads those rows if `column` is indexed. A window holds more
+    than `windowsize` rows if many rows share the value at its start.
 
-    intervals = [id for id, in q]
+    The arguments are the same as for :py:func:`column_windows`.
+    """
 
-    while intervals:
-        start = intervals.pop(0)
-        if intervals:
-            end = intervals[0]
-        else:
-            end = None
-        yield interval_for_range(start, end)
+    def query():
+        q = session.query(column)
+        if where is not None:
+            q = q.filter(where)
+        return q
+
+    start = query().order_by(column).limit(1).scalar()
+
+    while start is not None:
+        end = query() \
+            .filter(column >= start) \
+            .order_by(column) \
+            .offset(windowsize) \
+            .limit(1) \
+            .scalar()
+
+        if end == start:
+            # The window must include every row with the value at its start.
+            end = query() \
+                .filter(column > start) \
+                .order_by(column) \
+                .limit(1) \
+                .scalar()
+
+        yield start, end
+        start = end
+
+
+def keyset_windows(session, columns, windowsize=2000, where=None):
+    """
+    Return a series of WHERE clauses that break a table into windows.
+
+    Rows are ordered by `columns`, which together must uniquely identify a
+    row, for example ``(Annotation.updated, Annotation.id)``. Each window is
+    found by seeking from the start of the previous one, so windows are
+    generated lazily and in constant memory, which makes this suitable for
+    scanning very large tables. Finding each window only reads the rows in it
+    if there is an index on `columns`.
+
+    Only rows that existed when iteration started are included: a row whose
+    key changes during iteration (for example because its ``updated`` column
+    is bumped) moves beyond the end of the last window rather than being
+    visited twice.
+
+    :param session: the SQLAlchemy session object
+    :param columns: the SQLAlchemy column objects with which to generate windows
+    :param windowsize: how many rows to include in each window
+    :param where: an optional SQLAlchemy expression to filter the base query
+
+    Returns an iterable of SQLAlchemy expressions which can be used in a
+    .filter(...) clause, in order of `columns`.
+    """
+    columns = tuple(columns)
+    key = sa.tuple_(*columns)
+
+    def bind(column, value):
+        return sa.bindparam(None, value, type_=column.type)
+
+    def literal(row):
+        return sa.tuple_(*[bind(c, v) for c, v in zip(columns, row)])
+
+    def query():
+        q = session.query(*columns)
+        if where is not None:
+            q = q.filter(where)
+        return q
+
+    def window(start, end, compare_end):
+        # The redundant conditions on the first column let Postgres use an
+        # index on that column alone.
+        first = columns[0]
+        return sa.and_(first >= bind(first, start[0]),
+                       first <= bind(first, end[0]),
+                       key >= literal(start),
+                       compare_end(key, literal(end)))
+
+    last = query().order_by(*[c.desc() for c in columns]).first()
+    if last is None:
+        return
+    start = query().order_by(*columns).first()
+
+    while True:
+        end = query() \
+            .filter(window(start, last, operator.le)) \
+            .order_by(*columns) \
+            .offset(windowsize) \
+            .first()
+
+        if end is None:
+            yield window(start, last, operator.le)
+            return
+
+        yield window(start, end, operator.lt)
+        start = end
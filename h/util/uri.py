@@ -64,6 +64,11 @@ elsewhere in the Hypothesis application. URI expansion is handled by
 """
 import re
 
+try:
+    from functools import lru_cache
+except ImportError:
+    from backports.functools_lru_cache import lru_cache
+
 from h._compat import (
     PY2,
     url_quote,
@@ -129,11 +134,21 @@ UNRESERVED_QUERY_VALUE = "-._~:@!$'()*,="
 # redirect your browser to https://via.hypothes.is/https://example.com.
 VIA_PREFIX = "https://via.hypothes.is/"
 
+# The number of normalized URIs to remember. Normalization is a pure function
+# of its input and the same URIs (and path segments and query parameter names)
+# are normalized over and over, so remembering recent results avoids most of
+# the parsing and percent-encoding work.
+NORMALIZE_CACHE_SIZE = 10000
+
 
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
 def normalize(uristr):
     """
     Translate the given URI into a normalized form.
 
+    Results are memoized, so normalizing a URI that was recently normalized is
+    cheap. Use :py:func:`normalize_many` to normalize a batch of URIs.
+
     :type uristr: unicode
     :rtype: unicode
     """
@@ -181,6 +196,23 @@ def normalize(uristr):
     return decode_result(uri.geturl())
 
 
+def normalize_many(uris):
+    """
+    Translate each of the given URIs into a normalized form.
+
+    Each distinct URI is normalized only once, and path segments and query
+    parameter names shared between URIs are only normalized once.
+
+    :param uris: an iterable of URIs
+    :type uris: iterable of unicode
+    :returns: the normalized URIs, in the same order as ``uris``
+    :rtype: list of unicode
+    """
+    uris = list(uris)
+    normalized = {uri: normalize(uri) for uri in set(uris)}
+    return [normalized[uri] for uri in uris]
+
+
 def _normalize_scheme(uri):
     scheme = uri.scheme
 
@@ -243,6 +275,7 @@ def _normalize_path(uri):
     return path
 
 
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
 def _normalize_pathsegment(segment):
     return url_quote(url_unquote(segment), safe=UNRESERVED_PATHSEGMENT)
 
@@ -275,6 +308,7 @@ def _normalize_queryitems(items):
     return '&'.join(segments)
 
 
+@lru_cache(maxsize=1000)
 def _normalize_queryname(name):
     return url_quote_plus(url_unquote_plus(name), safe=UNRESERVED_QUERY_NAME)
 
@@ -283,6 +317,7 @@ def _normalize_queryvalue(value):
     return url_quote_plus(url_unquote_plus(value), safe=UNRESERVED_QUERY_VALUE)
 
 
+@lru_cache(maxsize=1000)
 def _blacklisted_query_param(s):
     """Return True if the given string matches any BLACKLISTED_QUERY_PARAMS."""
     return any(re.match(patt, s) for patt in BLACKLISTED_QUERY_PARAMS)
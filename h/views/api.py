@@ -22,16 +22,24 @@ from pyramid import security
 
 from h import search as search_lib
 from h import storage
+from h._compat import string_types, text_type
 from h.exceptions import PayloadError
 from h.events import AnnotationEvent
 from h.interfaces import IGroupService
 from h.presenters import AnnotationJSONLDPresenter
+from h.schemas import ValidationError
 from h.traversal import AnnotationContext
 from h.schemas.annotation import CreateAnnotationSchema, UpdateAnnotationSchema
 from h.views.api_config import api_config, AngularRouteTemplater
 
 _ = i18n.TranslationStringFactory(__package__)
 
+#: The maximum number of operations in one request to the batch API
+BATCH_LIMIT = 200
+
+#: The actions which the batch API can perform on annotations
+BATCH_ACTIONS = ('create', 'update', 'delete')
+
 
 @api_config(route_name='api.index')
 def index(context, request):
@@ -98,10 +106,14 @@ def search(request):
     params = request.params.copy()
 
     separate_replies = params.pop('_separate_replies', False)
+    replies_limit = params.pop('_replies_limit', 200)
+    replies_offset = params.pop('_replies_offset', 0)
     stats = getattr(request, 'stats', None)
     result = search_lib.Search(request,
                                separate_replies=separate_replies,
-                               stats=stats).run(params)
+                               stats=stats,
+                               _replies_limit=replies_limit,
+                               _replies_offset=replies_offset).run(params)
 
     svc = request.find_service(name='annotation_json_presentation')
 
@@ -112,6 +124,11 @@ def search(request):
 
     if separate_replies:
         out['replies'] = svc.present_all(result.reply_ids)
+        out['replies_total'] = result.reply_total
+
+    # Passing this back as the `cursor` parameter fetches the next page.
+    if result.cursor is not None:
+        out['cursor'] = result.cursor
 
     return out
 
@@ -135,6 +152,61 @@ def create(request):
     return svc.present(annotation_resource)
 
 
+@api_config(route_name='api.annotations.batch',
+            request_method='POST',
+            effective_principals=security.Authenticated,
+            link_name='annotation.batch',
+            description='Create, update and delete annotations in bulk')
+def batch(request):
+    """
+    Create, update and delete annotations from a list of operations.
+
+    Each operation is an object with an ``action`` of ``create``, ``update``
+    or ``delete``, the ``id`` of the annotation to update or delete, and the
+    ``data`` to create or update it with. The result of each operation is
+    reported separately and in order, and an operation failing doesn't stop
+    the others: creations are all made first, and then the updates and
+    deletions. Each annotation may only be updated or deleted once in a batch.
+    """
+    operations = _json_payload(request)
+    if not isinstance(operations, list):
+        raise PayloadError()
+    if len(operations) > BATCH_LIMIT:
+        raise ValidationError(_('Batches may not have more than {limit} '
+                                'operations').format(limit=BATCH_LIMIT))
+
+    group_service = request.find_service(IGroupService)
+    results = [None] * len(operations)
+
+    creations = []
+    changes = []
+    changed_ids = set()
+    for i, operation in enumerate(operations):
+        try:
+            action, id_, data = _batch_operation(operation)
+            if action == 'create':
+                schema = CreateAnnotationSchema(request)
+                creations.append((i, schema.validate(data)))
+            else:
+                if id_ in changed_ids:
+                    raise ValidationError('id: ' + _('Annotations may only be '
+                                                     'changed once in a batch'))
+                changed_ids.add(id_)
+                changes.append((i, action, id_, data))
+        except ValidationError as err:
+            results[i] = _batch_failure(400, err)
+
+    saved = _batch_create(request, creations, group_service, results)
+    saved.extend(_batch_change(request, changes, group_service, results))
+
+    svc = request.find_service(name='annotation_json_presentation')
+    presented = svc.present_annotations([annotation for i, annotation in saved])
+    for (i, annotation), body in zip(saved, presented):
+        results[i] = {'status': 200, 'annotation': body}
+
+    return {'results': results}
+
+
 @api_config(route_name='api.annotation',
             request_method='GET',
             permission='read',
@@ -220,6 +292,100 @@ def _json_payload(request):
         raise PayloadError()
 
 
+def _batch_operation(operation):
+    """
+    Return the action, annotation ID and data of an operation in a batch.
+
+    :raises ValidationError: if the operation is malformed
+    """
+    if not isinstance(operation, dict) or operation.get('action') not in BATCH_ACTIONS:
+        raise ValidationError('action: ' + _('Must be one of {actions}').format(
+            actions=', '.join(BATCH_ACTIONS)))
+
+    action = operation['action']
+    id_ = operation.get('id')
+    data = operation.get('data')
+    if action != 'create' and not isinstance(id_, string_types):
+        raise ValidationError('id: ' + _('Required to {action} an annotation').format(
+            action=action))
+    if action != 'delete' and not isinstance(data, dict):
+        raise ValidationError('data: ' + _('Required to {action} an annotation').format(
+            action=action))
+
+    return action, id_, data
+
+
+def _batch_create(request, creations, group_service, results):
+    """
+    Create the annotations for the create operations in a batch.
+
+    :param creations: (index, appstruct) pairs for the create operations
+    :param results: the batch's results, to which failures are added
+    :returns: (index, annotation) pairs for the annotations created
+    """
+    created = storage.create_annotations(request,
+                                         [appstruct for i, appstruct in creations],
+                                         group_service)
+
+    saved = []
+    for (i, appstruct), annotation in zip(creations, created):
+        if isinstance(annotation, ValidationError):
+            results[i] = _batch_failure(400, annotation)
+            continue
+        _publish_annotation_event(request, annotation, 'create')
+        saved.append((i, annotation))
+    return saved
+
+
+def _batch_change(request, changes, group_service, results):
+    """
+    Update and delete the annotations for the other operations in a batch.
+
+    :param changes: (index, action, id, data) tuples for the operations
+    :param results: the batch's results, to which deletions and failures are
+        added
+    :returns: (index, annotation) pairs for the annotations updated
+    """
+    annotations = storage.fetch_annotations(request.db,
+                                            [change[2] for change in changes])
+
+    saved = []
+    for i, action, id_, data in changes:
+        annotation = annotations.get(id_)
+        if annotation is None or not request.has_permission(
+                action, _annotation_resource(request, annotation)):
+            results[i] = _batch_failure(404, _("Either the annotation doesn't "
+                                               "exist, or you are not "
+                                               "authorized to {action} it.")
+                                        .format(action=action))
+            continue
+
+        if action == 'delete':
+            storage.delete_annotation(request.db, id_)
+            _publish_annotation_event(request, annotation, 'delete')
+            results[i] = {'status': 200, 'id': id_, 'deleted': True}
+            continue
+
+        try:
+            schema = UpdateAnnotationSchema(request,
+                                            annotation.target_uri,
+                                            annotation.groupid)
+            annotation = storage.update_annotation(request,
+                                                   id_,
+                                                   schema.validate(data),
+                                                   group_service)
+        except ValidationError as err:
+            results[i] = _batch_failure(400, err)
+            continue
+        _publish_annotation_event(request, annotation, 'update')
+        saved.append((i, annotation))
+    return saved
+
+
+def _batch_failure(status, reason):
+    return {'status': status, 'reason': text_type(reason)}
+
+
 def _publish_annotation_event(request,
                               annotation,
                               action):
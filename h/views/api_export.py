@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+"""
+API view for exporting annotations in bulk.
+
+Exporting reads annotations straight from the database, oldest update first,
+rather than searching for them a page at a time, so it is much cheaper than
+paging through ``/api/search`` to fetch every annotation in a group, by a
+user or of a document.
+"""
+
+from __future__ import unicode_literals
+
+from dateutil import parser as date_parser
+from dateutil import tz
+from pyramid import security
+
+from h.db import types
+from h.schemas import ValidationError
+from h.views.api_config import api_config
+
+#: The default and maximum numbers of annotations exported by one request.
+#: The whole response is encoded before it is sent (see
+#: :py:class:`h.renderers.NDJSONRenderer`), so the maximum bounds the memory
+#: used by an export. Larger exports are made by resuming with `since` and
+#: `after`.
+LIMIT_DEFAULT = 200
+LIMIT_MAX = 1000
+
+
+@api_config(route_name='api.export',
+            link_name='export',
+            renderer='ndjson',
+            accept=None,
+            effective_principals=security.Authenticated,
+            description='Export annotations as newline-delimited JSON')
+def export(request):
+    """
+    Export the annotations in a group, by a user or of a URI.
+
+    The response has one annotation per line, least recently updated first.
+    If it has `limit` lines there may be more to export: pass the `updated`
+    and `id` fields of the last line as the `since` and `after` parameters to
+    continue from there.
+    """
+    params = request.params
+
+    group = params.get('group')
+    userid = params.get('user')
+    uri = params.get('uri')
+    if group is None and userid is None and uri is None:
+        raise ValidationError('export requires a group, user or uri parameter')
+    if userid is not None and not userid.startswith('acct:'):
+        userid = 'acct:{}@{}'.format(userid, request.authority)
+
+    since = _since(params.get('since'))
+    after = params.get('after')
+    if after is not None:
+        if since is None:
+            raise ValidationError('after requires since')
+        try:
+            types.URLSafeUUID().process_bind_param(after, None)
+        except types.InvalidUUID:
+            raise ValidationError('after must be an annotation id')
+
+    svc = request.find_service(name='annotation_export')
+    return svc.export(_limit(params.get('limit')),
+                      group=group,
+                      userid=userid,
+                      uri=uri,
+                      since=since,
+                      after=after)
+
+
+def _since(value):
+    """Parse an ISO 8601 time into the naive UTC datetime stored in the DB."""
+    if value is None:
+        return None
+    try:
+        since = date_parser.parse(value)
+    except (ValueError, OverflowError):
+        raise ValidationError('since must be an ISO 8601 time')
+    if since.tzinfo is not None:
+        since = since.astimezone(tz.tzutc()).replace(tzinfo=None)
+    return since
+
+
+def _limit(value):
+    if value is None:
+        return LIMIT_DEFAULT
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ValidationError('limit must be a number')
+    if limit < 1:
+        raise ValidationError('limit must be positive')
+    return min(limit, LIMIT_MAX)
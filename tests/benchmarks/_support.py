@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""Shared helpers for the benchmark scripts in this package."""
+
+from __future__ import print_function, unicode_literals
+
+import datetime
+import timeit
+
+from pyramid import security
+from pyramid.config import Configurator
+
+from h import models
+from h.services.links import add_annotation_link_generator
+
+
+def make_registry(settings=None):
+    """Return an application registry with routes and link generators."""
+    if settings is None:
+        settings = {'h.app_url': 'http://localhost:5000',
+                    'h.authority': 'localhost'}
+    config = Configurator(settings=settings)
+    config.add_directive('add_annotation_link_generator',
+                         add_annotation_link_generator)
+    config.include('h.routes')
+    config.include('h.links')
+    config.commit()
+    return config.registry
+
+
+def make_annotation(n=0, groupid='__world__', uri=None):
+    """Return a transient annotation that is never added to a session."""
+    if uri is None:
+        uri = 'http://example.com/articles/{}'.format(n)
+    now = datetime.datetime(2018, 1, 1)
+    annotation = models.Annotation(
+        id='ann{:019d}'.format(n),
+        userid='acct:user{}@localhost'.format(n),
+        groupid=groupid,
+        shared=True,
+        target_uri=uri,
+        text='Some annotation text number {}'.format(n),
+        tags=['tag{}'.format(n % 10), 'benchmark'],
+        target_selectors=[{'type': 'TextQuoteSelector',
+                           'exact': 'quoted text',
+                           'prefix': 'before ',
+                           'suffix': ' after'}],
+        created=now,
+        updated=now,
+        references=[],
+        extra={},
+    )
+    annotation.document = models.Document(title=['Example article'])
+    return annotation
+
+
+class FakeGroup(object):
+    def __init__(self, pubid='__world__'):
+        self.pubid = pubid
+
+    def __acl__(self):
+        return [(security.Allow, security.Everyone, 'read')]
+
+
+class FakeGroupService(object):
+    def find(self, id_):
+        return FakeGroup(id_)
+
+
+def report(name, func, number, repeat=3):
+    """Time `func` and print the best time per call."""
+    best = min(timeit.repeat(func, number=number, repeat=repeat)) / number
+    print('{:<40} {:>12.3f} ms'.format(name, best * 1000))
+    return best
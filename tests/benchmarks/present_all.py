@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark presenting a page of annotations with `present_all`.
+
+Times :py:meth:`h.services.annotation_json_presentation.AnnotationJSONPresentationService.present_all`
+for a page of search results, and compares it with the previous behaviour
+(copied below as `LegacyPresentationService`), which evaluated every
+group's ACL and checked the user's permissions on it once per annotation,
+verified every formatter for every annotation, and routed every link of every
+annotation separately.
+
+The database isn't used: annotations are transient, and the services which
+would query the database return nothing.
+
+Run from the root of the repository::
+
+    python -m tests.benchmarks.present_all --annotations 200 --profile
+"""
+
+from __future__ import print_function, unicode_literals
+
+import argparse
+import cProfile
+import pstats
+
+import mock
+from pyramid import security
+from pyramid.authorization import ACLAuthorizationPolicy
+from pyramid.interfaces import IAuthorizationPolicy
+from pyramid.threadlocal import manager
+from zope.interface.verify import verifyObject
+
+from h import formatters
+from h import presenters
+from h import storage
+from h import traversal
+from h.formatters.interfaces import IAnnotationFormatter
+from h.services.annotation_json_presentation import AnnotationJSONPresentationService
+from h.services.links import LinksService, add_annotation_link_generator
+from tests.benchmarks._support import FakeGroup, make_annotation, make_registry, report
+
+#: How many distinct groups the annotations on a page are in
+GROUPS = 3
+
+
+class LegacyPresentationService(AnnotationJSONPresentationService):
+    """`present_all` as it was before permissions were computed per group."""
+
+    def __init__(self, session, user, group_svc, links_svc, flag_svc, flag_count_svc,
+                 moderation_svc, user_svc, has_permission, render_user_info):
+        self.session = session
+        self.group_svc = group_svc
+        self.links_svc = links_svc
+
+        def moderator_check(group):
+            return has_permission('admin', group)
+
+        self.formatters = [
+            formatters.AnnotationFlagFormatter(flag_svc, user),
+            formatters.AnnotationHiddenFormatter(moderation_svc, moderator_check, user),
+            formatters.AnnotationModerationFormatter(flag_count_svc, user, has_permission),
+        ]
+
+    def present_all(self, annotation_ids):
+        annotations = storage.fetch_ordered_annotations(self.session, annotation_ids)
+        for formatter in self.formatters:
+            formatter.preload(annotation_ids)
+        return [self.present(LegacyAnnotationContext(ann, self.group_svc, self.links_svc))
+                for ann in annotations]
+
+    def _get_presenter(self, annotation_resource):
+        return LegacyAnnotationJSONPresenter(annotation_resource, self.formatters)
+
+
+class LegacyAnnotationJSONPresenter(presenters.AnnotationJSONPresenter):
+    def _add_formatter(self, formatter):
+        verifyObject(IAnnotationFormatter, formatter)
+        self._formatters.append(formatter)
+
+
+class LegacyAnnotationContext(traversal.AnnotationContext):
+    def _read_principals(self):
+        return self._group_principals(self.group)
+
+
+def legacy_html_link(request, annotation):
+    if annotation.authority != request.authority:
+        return None
+    return request.route_url('annotation', id=annotation.id)
+
+
+def legacy_json_link(request, annotation):
+    return request.route_url('api.annotation', id=annotation.id)
+
+
+def legacy_jsonld_id_link(request, annotation):
+    return request.route_url('annotation', id=annotation.id)
+
+
+def make_legacy_registry():
+    """Return a registry whose link generators route every link."""
+    registry = make_registry()
+    config = mock.Mock(registry=registry)
+    add_annotation_link_generator(config, 'html', legacy_html_link)
+    add_annotation_link_generator(config, 'json', legacy_json_link)
+    add_annotation_link_generator(config, 'jsonld_id', legacy_jsonld_id_link, hidden=True)
+    return registry
+
+
+class CachingGroupService(object):
+    """Like `GroupfinderService`, which remembers the groups it has found."""
+
+    def __init__(self):
+        self._groups = {}
+
+    def find(self, id_):
+        if id_ not in self._groups:
+            self._groups[id_] = FakeGroup(id_)
+        return self._groups[id_]
+
+
+class FakeUser(object):
+    userid = 'acct:reader@localhost'
+
+
+class EmptyService(object):
+    """Stands in for the flag, flag count and moderation services."""
+
+    def all_flagged(self, user, annotation_ids):
+        return set()
+
+    def flag_counts(self, ids):
+        return {}
+
+    def all_hidden(self, ids):
+        return set()
+
+
+def make_service(cls, registry):
+    policy = registry.getUtility(IAuthorizationPolicy)
+    principals = [security.Everyone, security.Authenticated, FakeUser.userid]
+
+    def has_permission(permission, context):
+        return policy.permits(context, principals, permission)
+
+    empty = EmptyService()
+    return cls(session=None,
+               user=FakeUser(),
+               group_svc=CachingGroupService(),
+               links_svc=LinksService('http://localhost:5000', registry),
+               flag_svc=empty,
+               flag_count_svc=empty,
+               moderation_svc=empty,
+               user_svc=None,
+               has_permission=has_permission,
+               render_user_info=False)
+
+
+def profile(name, func):
+    """Run `func` once under the profiler and print the calls it made."""
+    profiler = cProfile.Profile()
+    profiler.runcall(func)
+    stats = pstats.Stats(profiler)
+    counts = {}
+    for (_, _, funcname), (_, ncalls, _, _, _) in stats.stats.items():
+        counts[funcname] = counts.get(funcname, 0) + ncalls
+    print('{}: {} function calls, {} principals_allowed_by_permission, '
+          '{} route_url, {} permits'.format(name,
+                                           stats.total_calls,
+                                           counts.get('principals_allowed_by_permission', 0),
+                                           counts.get('route_url', 0),
+                                           counts.get('permits', 0)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--annotations', type=int, default=200,
+                        help='number of annotations on the page (default: 200)')
+    parser.add_argument('--number', type=int, default=10,
+                        help='runs per timing (default: 10)')
+    parser.add_argument('--profile', action='store_true',
+                        help='print the number of calls made by each implementation')
+    args = parser.parse_args()
+
+    registry = make_registry()
+    legacy_registry = make_legacy_registry()
+    for reg in (registry, legacy_registry):
+        reg.registerUtility(ACLAuthorizationPolicy(), IAuthorizationPolicy)
+    manager.push({'registry': registry, 'request': None})
+
+    annotations = [make_annotation(n, groupid='group{}'.format(n % GROUPS))
+                   for n in range(args.annotations)]
+    ids = [a.id for a in annotations]
+
+    # Services are created for each request, so each run gets new ones.
+    def run_legacy():
+        return make_service(LegacyPresentationService, legacy_registry).present_all(ids)
+
+    def run_batched():
+        return make_service(AnnotationJSONPresentationService, registry).present_all(ids)
+
+    fetch = 'h.storage.fetch_ordered_annotations'
+    with mock.patch(fetch, return_value=annotations):
+        assert run_batched() == run_legacy(), 'implementations disagree'
+
+        print('{} annotations in {} groups'.format(args.annotations, GROUPS))
+        before = report('per-annotation ACLs and routes', run_legacy, number=args.number)
+        after = report('batched present_all', run_batched, number=args.number)
+        print('speedup: {:.1f}x'.format(before / after))
+
+        if args.profile:
+            profile('per-annotation', run_legacy)
+            profile('batched', run_batched)
+
+
+if __name__ == '__main__':
+    main()
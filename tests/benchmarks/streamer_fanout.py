@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark fan-out of realtime annotation events to websockets.
+
+Times :py:func:`h.streamer.messages.handle_annotation_event` for a single
+annotation event delivered to N synthetic sockets, and compares it with
+rendering the annotation separately for each socket and evaluating every
+socket's filter, which is what the streamer used to do.
+
+Every socket is considered for the event in both cases, rather than only
+those found in :py:attr:`h.streamer.websocket.WebSocket.subscriptions`, so
+that only the effect of rendering once per event is measured.
+
+Run from the root of the repository::
+
+    python -m tests.benchmarks.streamer_fanout --sockets 5000
+"""
+
+from __future__ import print_function, unicode_literals
+
+import argparse
+import weakref
+
+import mock
+from pyramid import security
+
+from h.streamer import filter
+from h.streamer import messages
+from h.streamer import websocket
+from tests.benchmarks._support import (FakeGroupService, make_annotation,
+                                       make_registry, report)
+
+
+class FakeSocket(object):
+    def __init__(self, n, registry, uri):
+        self.client_id = 'client{}'.format(n)
+        self.authenticated_userid = None
+        self.effective_principals = [security.Everyone]
+        self.registry = registry
+        filter_ = {
+            'match_policy': 'include_any',
+            'actions': {'create': True, 'update': True, 'delete': True},
+            'clauses': [{'field': '/uri',
+                         'operator': 'one_of',
+                         'value': [uri]}],
+        }
+        self.filter = filter.FilterHandler(filter_)
+        self.sent = 0
+
+    def send_json(self, payload):
+        self.sent += 1
+
+
+def _per_socket_render(message, sockets, settings, session):
+    """The old behaviour: render the annotation once for every socket."""
+    annotation = messages.storage.fetch_annotation(session, message['annotation_id'])
+    for socket in sockets:
+        presented = messages.PresentedAnnotation(annotation, FakeGroupService())
+        reply = messages._generate_annotation_event(message, socket, presented, False)
+        if reply is not None:
+            socket.send_json(reply)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sockets', type=int, default=1000,
+                        help='number of connected sockets (default: 1000)')
+    parser.add_argument('--matching', type=float, default=0.1,
+                        help='fraction of sockets whose filter matches the '
+                             'annotation (default: 0.1)')
+    parser.add_argument('--number', type=int, default=5,
+                        help='events per timing run (default: 5)')
+    args = parser.parse_args()
+
+    registry = make_registry()
+    annotation = make_annotation(uri='http://example.com/popular')
+    matching = int(args.sockets * args.matching)
+    sockets = [FakeSocket(n,
+                          registry,
+                          'http://example.com/popular' if n < matching
+                          else 'http://example.com/other/{}'.format(n))
+               for n in range(args.sockets)]
+    # The open sockets, like h.streamer.websocket.WebSocket.instances
+    instances = weakref.WeakSet(sockets)
+    message = {'annotation_id': annotation.id,
+               'action': 'create',
+               'src_client_id': 'source'}
+    settings = {'h.authority': 'localhost'}
+
+    with mock.patch('h.streamer.messages.storage') as storage, \
+            mock.patch('h.streamer.messages.NipsaService') as nipsa, \
+            mock.patch('h.streamer.messages.GroupfinderService') as groupfinder, \
+            mock.patch.object(websocket.WebSocket.subscriptions, 'candidates',
+                              lambda uri: sockets):
+        storage.fetch_annotation.return_value = annotation
+        nipsa.return_value.is_flagged.return_value = False
+        groupfinder.return_value = FakeGroupService()
+
+        print('{} sockets, {} matching'.format(args.sockets, matching))
+        before = report('render per socket',
+                        lambda: _per_socket_render(message, sockets, settings, None),
+                        number=args.number)
+        after = report('render once per event',
+                       lambda: messages.handle_annotation_event(message, instances, settings, None),
+                       number=args.number)
+        print('speedup: {:.1f}x'.format(before / after))
+
+        for socket in sockets:
+            socket.sent = 0
+        messages.handle_annotation_event(message, instances, settings, None)
+        print('notifications sent per event: {}'.format(
+            sum(s.sent for s in sockets)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark streamer filter matching.
+
+Compares :py:class:`h.streamer.filter.FilterHandler`, which compiles filters
+when they are received, with the previous implementation which interpreted
+each clause for every annotation event (copied below as `LegacyFilter`).
+Both matchers are checked to agree on every annotation before timing.
+
+Run from the root of the repository::
+
+    python -m tests.benchmarks.streamer_filter
+"""
+
+from __future__ import print_function, unicode_literals
+
+import argparse
+import copy
+import operator
+
+from jsonpointer import resolve_pointer
+
+from h.streamer import filter
+from tests.benchmarks._support import report
+
+LEGACY_OPERATORS = {
+    'equals': operator.eq,
+    'matches': operator.contains,
+    'lt': operator.lt,
+    'le': operator.le,
+    'gt': operator.gt,
+    'ge': operator.ge,
+    'one_of': operator.contains,
+    'first_of': filter.first_of,
+    'match_of': filter.match_of,
+    'lene': filter.lene,
+    'leng': filter.leng,
+    'lenge': filter.lenge,
+    'lenl': filter.lenl,
+    'lenle': filter.lenle,
+}
+
+
+class LegacyFilter(object):
+    """The streamer filter as it was before filters were compiled."""
+
+    def __init__(self, filter_json):
+        self.filter = filter_json
+
+    def evaluate_clause(self, clause, target):
+        if isinstance(clause['field'], list):
+            for field in clause['field']:
+                copied = copy.deepcopy(clause)
+                copied['field'] = field
+                if self.evaluate_clause(copied, target):
+                    return True
+            return False
+
+        field_value = resolve_pointer(target, clause['field'], None)
+        if field_value is None:
+            return False
+
+        cval = clause['value']
+        if isinstance(cval, list):
+            cval = [filter.uni_fold(cv) for cv in cval]
+        else:
+            cval = filter.uni_fold(cval)
+
+        if isinstance(field_value, list):
+            fval = [filter.uni_fold(fv) for fv in field_value]
+        else:
+            fval = filter.uni_fold(field_value)
+
+        reversed_order = False
+        if isinstance(cval, list) or isinstance(fval, list):
+            if clause['operator'] in ['one_of', 'matches']:
+                reversed_order = not isinstance(field_value, list)
+
+        op = LEGACY_OPERATORS[clause['operator']]
+        if reversed_order:
+            return op(cval, fval)
+        return op(fval, cval)
+
+    def match(self, target, action=None):
+        if action and action != 'past' and action not in self.filter['actions']:
+            return False
+        clauses = self.filter['clauses']
+        if not clauses:
+            return True
+        results = (self.evaluate_clause(c, target) for c in clauses)
+        policy = self.filter['match_policy']
+        if policy == 'include_any':
+            return any(results)
+        if policy == 'include_all':
+            return all(results)
+        if policy == 'exclude_all':
+            return not all(results)
+        return not any(results)
+
+
+def realistic_filters(count):
+    """
+    Return `count` filters like those sent by the client.
+
+    Most are a single `/uri` clause with a few expanded URIs, as sent by the
+    sidebar; some also follow a user or a tag.
+    """
+    actions = {'create': True, 'update': True, 'delete': True}
+    filters = []
+    for n in range(count):
+        uris = ['http://example.com/articles/{}'.format(n),
+                'https://example.com/articles/{}'.format(n),
+                'http://example.com/articles/{}?utm_source=feed'.format(n),
+                'urn:x-pdf:{:032x}'.format(n)]
+        clauses = [{'field': '/uri', 'operator': 'one_of', 'value': uris}]
+        if n % 5 == 0:
+            clauses.append({'field': '/user',
+                            'operator': 'equals',
+                            'value': 'acct:User{}@example.com'.format(n)})
+        if n % 7 == 0:
+            clauses.append({'field': ['/tags', '/text'],
+                            'operator': 'matches',
+                            'value': 'Café'})
+        filters.append({'match_policy': 'include_any',
+                        'actions': actions,
+                        'clauses': clauses})
+    return filters
+
+
+def realistic_annotations(count):
+    return [{'uri': 'http://example.com/articles/{}'.format(n * 3),
+             'user': 'acct:user{}@example.com'.format(n),
+             'text': 'Annotation text about a café, number {}'.format(n),
+             'tags': ['Research', 'cafe'] if n % 2 else []}
+            for n in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--filters', type=int, default=1000,
+                        help='number of socket filters (default: 1000)')
+    parser.add_argument('--annotations', type=int, default=20,
+                        help='number of annotation events (default: 20)')
+    parser.add_argument('--number', type=int, default=3,
+                        help='runs per timing (default: 3)')
+    args = parser.parse_args()
+
+    filters = realistic_filters(args.filters)
+    annotations = realistic_annotations(args.annotations)
+    legacy = [LegacyFilter(f) for f in filters]
+    compiled = [filter.FilterHandler(f) for f in filters]
+
+    for annotation in annotations:
+        target = filter.Target(annotation)
+        expected = [f.match(annotation, 'create') for f in legacy]
+        actual = [f.match(target, 'create') for f in compiled]
+        assert expected == actual, 'matchers disagree on {!r}'.format(annotation)
+
+    def run_legacy():
+        for annotation in annotations:
+            for f in legacy:
+                f.match(annotation, 'create')
+
+    def run_compiled():
+        for annotation in annotations:
+            target = filter.Target(annotation)
+            for f in compiled:
+                f.match(target, 'create')
+
+    print('{} filters x {} annotations'.format(args.filters, args.annotations))
+    before = report('interpreted filters', run_legacy, number=args.number)
+    after = report('compiled filters', run_compiled, number=args.number)
+    print('speedup: {:.1f}x'.format(before / after))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark URI normalization.
+
+Compares :py:func:`h.util.uri.normalize_many`, which is memoized and shares
+the normalization of path segments and query parameter names between URIs,
+with the previous implementation which normalized every URI from scratch
+(reproduced below by calling the undecorated functions).
+Both are checked to agree on every URI before timing.
+
+The corpus resembles the URIs of annotated pages: a long tail of articles
+on a few sites, most with tracking parameters, and a minority of popular
+pages which are annotated (and so normalized) many times.
+
+Run from the root of the repository::
+
+    python -m tests.benchmarks.uri_normalize
+"""
+
+from __future__ import print_function, unicode_literals
+
+import argparse
+import random
+
+from h._compat import urlparse
+from h.util import uri
+from tests.benchmarks._support import report
+
+SITES = ['https://www.example.com', 'http://blog.example.org:80',
+         'https://news.example.net', 'https://via.hypothes.is/https://example.edu']
+
+TRACKING = ['utm_source=twitter&utm_medium=social&utm_campaign=launch',
+            'utm_source=newsletter&utm_medium=email',
+            'gclid=EAIaIQobChMI',
+            'WT.mc_id=TWT_NatureNews',
+            'fbclid=IwAR0abc']
+
+
+def realistic_uri(rng, article):
+    site = SITES[article % len(SITES)]
+    path = '/{}/articles/{}/some%20article-title-{}/'.format(
+        2010 + article % 8, article % 12, article)
+    query = TRACKING[rng.randrange(len(TRACKING))]
+    if article % 3 == 0:
+        query += '&page={}'.format(article % 5)
+    return '{}{}?{}#section-{}'.format(site, path, query, article % 4)
+
+
+def realistic_uris(count, seed=1):
+    """Return `count` URIs, around a third of which are popular repeats."""
+    rng = random.Random(seed)
+    popular = [realistic_uri(rng, n) for n in range(count // 50 or 1)]
+    return [rng.choice(popular) if rng.random() < 0.35
+            else realistic_uri(rng, n)
+            for n in range(count)]
+
+
+def legacy_normalize(uristr):
+    """Normalize `uristr` without any memoization."""
+    for scheme in uri.URL_SCHEMES:
+        if uristr.startswith(uri.VIA_PREFIX + scheme + ':'):
+            uristr = uristr[len(uri.VIA_PREFIX):]
+            break
+    parsed = urlparse.urlsplit(uristr)
+    if parsed.scheme.lower() not in uri.URL_SCHEMES or parsed.hostname is None:
+        return uristr
+    path = parsed.path.rstrip('/')
+    path = '/'.join(uri._normalize_pathsegment.__wrapped__(s)
+                    for s in path.split('/'))
+    try:
+        items = urlparse.parse_qsl(parsed.query, keep_blank_values=True,
+                                   strict_parsing=True)
+    except ValueError:
+        query = parsed.query
+    else:
+        items = sorted(items, key=lambda x: x[0])
+        items = [i for i in items
+                 if not uri._blacklisted_query_param.__wrapped__(i[0])]
+        query = '&'.join('='.join([uri._normalize_queryname.__wrapped__(k),
+                                   uri._normalize_queryvalue(v)])
+                         for k, v in items)
+    return urlparse.SplitResult(uri._normalize_scheme(parsed),
+                                uri._normalize_netloc(parsed),
+                                path, query, None).geturl()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--uris', type=int, default=5000,
+                        help='number of URIs (default: 5000)')
+    parser.add_argument('--number', type=int, default=3,
+                        help='runs per timing (default: 3)')
+    args = parser.parse_args()
+
+    uris = realistic_uris(args.uris)
+    expected = [legacy_normalize(u) for u in uris]
+    assert uri.normalize_many(uris) == expected, 'normalizers disagree'
+
+    def run_legacy():
+        for u in uris:
+            legacy_normalize(u)
+
+    def run_cold():
+        uri.normalize.cache_clear()
+        uri._normalize_pathsegment.cache_clear()
+        uri._normalize_queryname.cache_clear()
+        uri._blacklisted_query_param.cache_clear()
+        uri.normalize_many(uris)
+
+    def run_warm():
+        uri.normalize_many(uris)
+
+    print('{} URIs, {} distinct'.format(len(uris), len(set(uris))))
+    before = report('normalize (unmemoized)', run_legacy, number=args.number)
+    cold = report('normalize_many (cold cache)', run_cold, number=args.number)
+    warm = report('normalize_many (warm cache)', run_warm, number=args.number)
+    print('speedup: {:.1f}x cold, {:.1f}x warm'.format(before / cold,
+                                                       before / warm))
+
+
+if __name__ == '__main__':
+    main()
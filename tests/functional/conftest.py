@@ -32,6 +32,7 @@ def app(pyramid_app, db_engine):
     from h import db
 
     _clean_database(db_engine)
+    _clear_process_caches()
     db.init(db_engine, authority=text_type(TEST_SETTINGS['h.authority']))
 
     return TestApp(pyramid_app)
@@ -90,3 +91,13 @@ def _clean_database(engine):
         tnames = ', '.join('"' + t.name + '"' for t in tables)
         conn.execute('TRUNCATE {};'.format(tnames))
         tx.commit()
+
+
+def _clear_process_caches():
+    from h.indexer import reindexer
+    from h.models import document
+    from h.services import group, nipsa
+    document.uri_expansion_cache.clear()
+    group.CACHE.clear()
+    nipsa.CACHE.invalidate()
+    reindexer.new_index_cache.clear()
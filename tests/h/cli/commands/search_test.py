@@ -1,10 +1,12 @@
 # -*- coding: utf-8 -*-
 
+import datetime
 import mock
 import os
 import pytest
 
 from h.cli.commands import search
+from h.indexer.verifier import Report
 
 
 class TestReindexCommand(object):
@@ -19,7 +21,28 @@ class TestReindexCommand(object):
         assert result.exit_code == 0
         reindex.assert_called_once_with(pyramid_request.db,
                                         pyramid_request.es,
-                                        pyramid_request)
+                                        pyramid_request,
+                                        workers=1,
+                                        chunk_size=100,
+                                        writers=2,
+                                        bootstrap=cliconfig['bootstrap'])
+
+    def test_passes_workers_and_chunk_size(self, cli, cliconfig, reindex):
+        result = cli.invoke(search.reindex,
+                            ['--workers', '4', '--chunk-size', '500'],
+                            obj=cliconfig)
+
+        assert result.exit_code == 0
+        _, kwargs = reindex.call_args
+        assert kwargs['workers'] == 4
+        assert kwargs['chunk_size'] == 500
+
+    def test_passes_writers(self, cli, cliconfig, reindex):
+        result = cli.invoke(search.reindex, ['--writers', '3'], obj=cliconfig)
+
+        assert result.exit_code == 0
+        _, kwargs = reindex.call_args
+        assert kwargs['writers'] == 3
 
     @pytest.fixture
     def reindex(self, patch):
@@ -27,6 +50,98 @@ class TestReindexCommand(object):
         return index.reindex
 
 
+class TestCatchupCommand(object):
+    def test_calls_catchup(self, cli, cliconfig, pyramid_request, catchup):
+        result = cli.invoke(search.catchup, [], obj=cliconfig)
+
+        assert result.exit_code == 0
+        catchup.assert_called_once_with(pyramid_request.db,
+                                        pyramid_request.es,
+                                        pyramid_request,
+                                        since=None)
+
+    @pytest.mark.parametrize('value,expected', [
+        ('2018-04-01T12:30:15', datetime.datetime(2018, 4, 1, 12, 30, 15)),
+        ('2018-04-01T12:30', datetime.datetime(2018, 4, 1, 12, 30)),
+        ('2018-04-01', datetime.datetime(2018, 4, 1)),
+    ])
+    def test_passes_since(self, cli, cliconfig, catchup, value, expected):
+        result = cli.invoke(search.catchup, ['--since', value], obj=cliconfig)
+
+        assert result.exit_code == 0
+        _, kwargs = catchup.call_args
+        assert kwargs['since'] == expected
+
+    def test_rejects_invalid_since(self, cli, cliconfig, catchup):
+        result = cli.invoke(search.catchup, ['--since', 'yesterday'], obj=cliconfig)
+
+        assert result.exit_code == 2
+        assert not catchup.called
+
+    def test_commits_the_checkpoint(self, cli, cliconfig, pyramid_request, catchup):
+        cli.invoke(search.catchup, [], obj=cliconfig)
+
+        pyramid_request.tm.commit.assert_called_once_with()
+
+    def test_fails_if_annotations_failed(self, cli, cliconfig, catchup):
+        catchup.return_value = (2, {'id-1'})
+
+        result = cli.invoke(search.catchup, [], obj=cliconfig)
+
+        assert result.exit_code == 1
+        assert 'failed to reindex 1 annotations' in result.output
+
+    @pytest.fixture
+    def catchup(self, patch, pyramid_request):
+        pyramid_request.tm = mock.Mock()
+        indexer = patch('h.cli.commands.search.indexer')
+        indexer.catchup.return_value = (0, set())
+        return indexer.catchup
+
+
+class TestVerifyCommand(object):
+    def test_calls_verify(self, cli, cliconfig, pyramid_request, verify):
+        result = cli.invoke(search.verify, ['--workers', '2', '--fix'], obj=cliconfig)
+
+        assert result.exit_code == 0
+        verify.assert_called_once_with(pyramid_request.db,
+                                       pyramid_request.es,
+                                       pyramid_request,
+                                       workers=2,
+                                       fix=True,
+                                       bootstrap=cliconfig['bootstrap'])
+
+    def test_prints_report(self, cli, cliconfig, verify):
+        report = verify.return_value
+        report.checked = 10
+        report.missing = 2
+        report.examples['missing'] = ['id-1', 'id-2']
+
+        result = cli.invoke(search.verify, ['--fix'], obj=cliconfig)
+
+        assert 'Checked 10 annotations.' in result.output
+        assert 'Missing: 2 (e.g. id-1, id-2)' in result.output
+        assert 'Stale: 0\n' in result.output
+
+    def test_fails_if_inconsistent(self, cli, cliconfig, verify):
+        verify.return_value.missing = 1
+
+        result = cli.invoke(search.verify, [], obj=cliconfig)
+
+        assert result.exit_code == 1
+
+    def test_succeeds_if_consistent(self, cli, cliconfig, verify):
+        result = cli.invoke(search.verify, [], obj=cliconfig)
+
+        assert result.exit_code == 0
+
+    @pytest.fixture
+    def verify(self, patch):
+        indexer = patch('h.cli.commands.search.indexer')
+        indexer.verify.return_value = Report()
+        return indexer.verify
+
+
 class TestUpdateSettingsCommand(object):
     def test_calls_update_index_settings(self, cli, cliconfig, pyramid_request, update_index_settings):
         result = cli.invoke(search.update_settings, [], obj=cliconfig)
@@ -109,6 +109,18 @@ def cli():
         yield runner
 
 
+@pytest.fixture(autouse=True)
+def clear_process_caches():
+    """Don't let the process-wide service caches leak state between tests."""
+    from h.indexer import reindexer
+    from h.models import document
+    from h.services import group, nipsa
+    document.uri_expansion_cache.clear()
+    group.CACHE.clear()
+    nipsa.CACHE.invalidate()
+    reindexer.new_index_cache.clear()
+
+
 @pytest.fixture(scope='session')
 def db_engine():
     """Set up the database connection and create tables."""
@@ -4,7 +4,11 @@ from __future__ import unicode_literals
 
 import mock
 
-from h.events import AnnotationEvent, AnnotationTransformEvent
+from h.events import (
+    AnnotationBatchTransformEvent,
+    AnnotationEvent,
+    AnnotationTransformEvent,
+)
 
 s = mock.sentinel
 
@@ -23,3 +27,10 @@ def test_annotation_transform_event():
     assert evt.request == s.request
     assert evt.annotation == s.annotation
     assert evt.annotation_dict == s.annotation_dict
+
+
+def test_annotation_batch_transform_event():
+    evt = AnnotationBatchTransformEvent(s.request, s.annotation_dicts)
+
+    assert evt.request == s.request
+    assert evt.annotation_dicts == s.annotation_dicts
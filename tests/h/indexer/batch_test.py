@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import datetime
+
+import mock
+import pytest
+
+from h.indexer import batch
+
+
+@pytest.mark.usefixtures('utcnow')
+class TestIndexBatch(object):
+
+    def test_it_enqueues_nothing_until_the_request_finishes(self, add_annotations, pyramid_request):
+        index_batch = batch.IndexBatch(pyramid_request)
+
+        index_batch.add('id-1')
+
+        assert not add_annotations.apply_async.called
+
+    def test_it_enqueues_the_batch_when_the_request_finishes(self, add_annotations, pyramid_request):
+        index_batch = batch.IndexBatch(pyramid_request)
+        index_batch.add('id-2')
+        index_batch.add('id-1')
+
+        pyramid_request._process_finished_callbacks()
+
+        add_annotations.apply_async.assert_called_once_with((['id-1', 'id-2'],),
+                                                            mock.ANY,
+                                                            countdown=mock.ANY)
+
+    def test_it_enqueues_the_batch_after_the_collect_window(self, add_annotations, pyramid_request):
+        index_batch = batch.IndexBatch(pyramid_request)
+        index_batch.add('id-1')
+
+        index_batch.flush()
+
+        _, kwargs = add_annotations.apply_async.call_args
+        assert kwargs['countdown'] == batch.COLLECT_WINDOW
+
+    def test_it_passes_the_time_the_batch_was_queued(self, add_annotations, pyramid_request):
+        index_batch = batch.IndexBatch(pyramid_request)
+        index_batch.add('id-1')
+
+        index_batch.flush()
+
+        args, _ = add_annotations.apply_async.call_args
+        assert args[1] == {'queued': '2018-03-01T12:30:00.000000'}
+
+    def test_it_deduplicates_ids(self, add_annotations, pyramid_request):
+        index_batch = batch.IndexBatch(pyramid_request)
+        index_batch.add('id-1')
+        index_batch.add('id-1')
+
+        index_batch.flush()
+
+        args, _ = add_annotations.apply_async.call_args
+        assert args[0] == (['id-1'],)
+
+    def test_it_splits_large_batches(self, add_annotations, pyramid_request, monkeypatch):
+        monkeypatch.setattr(batch, 'BATCH_SIZE', 2)
+        index_batch = batch.IndexBatch(pyramid_request)
+        for id_ in ['id-1', 'id-2', 'id-3']:
+            index_batch.add(id_)
+
+        index_batch.flush()
+
+        batches = [args[0] for args, _ in add_annotations.apply_async.call_args_list]
+        assert batches == [(['id-1', 'id-2'],), (['id-3'],)]
+
+    def test_it_enqueues_nothing_when_empty(self, add_annotations, pyramid_request):
+        index_batch = batch.IndexBatch(pyramid_request)
+
+        index_batch.flush()
+
+        assert not add_annotations.apply_async.called
+
+    def test_flush_empties_the_batch(self, add_annotations, pyramid_request):
+        index_batch = batch.IndexBatch(pyramid_request)
+        index_batch.add('id-1')
+
+        index_batch.flush()
+        index_batch.flush()
+
+        assert add_annotations.apply_async.call_count == 1
+
+    @pytest.fixture
+    def add_annotations(self, patch):
+        return patch('h.indexer.batch.add_annotations')
+
+    @pytest.fixture
+    def utcnow(self, patch):
+        datetime_ = patch('h.indexer.batch.datetime')
+        datetime_.datetime.utcnow.return_value = datetime.datetime(2018, 3, 1, 12, 30)
+        return datetime_.datetime.utcnow
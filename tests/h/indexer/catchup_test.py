@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+import datetime
+
+import mock
+import pytest
+
+from h.indexer.catchup import catchup, SETTING_CHECKPOINT
+from h.indexer.reindexer import SETTING_NEW_INDEX
+
+
+class FakeSettingsService(object):
+    def __init__(self):
+        self._data = {}
+
+    def get(self, key):
+        return self._data.get(key)
+
+    def put(self, key, value):
+        self._data[key] = value
+
+
+@pytest.mark.usefixtures('batchindexer', 'settings_service')
+class TestCatchup(object):
+    def test_it_reindexes_annotations_updated_since(self, db_session, pyramid_request, es, batchindexer, factories):
+        factories.Annotation(updated=datetime.datetime(2018, 1, 1))
+        changed = factories.Annotation(updated=datetime.datetime(2018, 3, 1))
+
+        catchup(db_session, es, pyramid_request, since=datetime.datetime(2018, 2, 1))
+
+        batchindexer.index.assert_called_once_with([changed.id])
+
+    def test_it_marks_deleted_annotations_deleted(self, db_session, pyramid_request, es, batchindexer, factories):
+        deleted = factories.Annotation(updated=datetime.datetime(2018, 3, 1), deleted=True)
+
+        catchup(db_session, es, pyramid_request, since=datetime.datetime(2018, 2, 1))
+
+        batchindexer.delete.assert_called_once_with([deleted.id])
+        assert not batchindexer.index.called
+
+    def test_it_returns_the_number_of_annotations_reindexed(self, db_session, pyramid_request, es, factories):
+        factories.Annotation.create_batch(3, updated=datetime.datetime(2018, 3, 1))
+
+        count, errored = catchup(db_session, es, pyramid_request,
+                                 since=datetime.datetime(2018, 2, 1))
+
+        assert count == 3
+        assert errored == set()
+
+    def test_it_also_reindexes_into_the_new_index_during_a_reindex(self,
+                                                                   db_session,
+                                                                   pyramid_request,
+                                                                   es,
+                                                                   BatchIndexer,
+                                                                   settings_service,
+                                                                   factories):
+        settings_service.put(SETTING_NEW_INDEX, 'hypothesis-new')
+        factories.Annotation(updated=datetime.datetime(2018, 3, 1))
+
+        catchup(db_session, es, pyramid_request, since=datetime.datetime(2018, 2, 1))
+
+        BatchIndexer.assert_any_call(db_session, es, pyramid_request, target_index=None)
+        BatchIndexer.assert_any_call(db_session, es, pyramid_request, target_index='hypothesis-new')
+
+    def test_it_resumes_from_the_checkpoint(self, db_session, pyramid_request, es, batchindexer, settings_service, factories):
+        settings_service.put(SETTING_CHECKPOINT, '2018-02-01T00:00:00.000000')
+        factories.Annotation(updated=datetime.datetime(2018, 1, 1))
+        changed = factories.Annotation(updated=datetime.datetime(2018, 3, 1))
+
+        catchup(db_session, es, pyramid_request)
+
+        batchindexer.index.assert_called_once_with([changed.id])
+
+    def test_it_sets_the_checkpoint_on_the_first_run(self, db_session, pyramid_request, es, batchindexer, settings_service, factories):
+        factories.Annotation()
+
+        catchup(db_session, es, pyramid_request)
+
+        assert not batchindexer.index.called
+        assert settings_service.get(SETTING_CHECKPOINT) is not None
+
+    def test_it_advances_the_checkpoint(self, db_session, pyramid_request, es, settings_service):
+        settings_service.put(SETTING_CHECKPOINT, '2018-02-01T00:00:00.000000')
+
+        catchup(db_session, es, pyramid_request)
+
+        assert settings_service.get(SETTING_CHECKPOINT) > '2018-02-01T00:00:00.000000'
+
+    def test_it_does_not_advance_the_checkpoint_if_anything_failed(self,
+                                                                   db_session,
+                                                                   pyramid_request,
+                                                                   es,
+                                                                   batchindexer,
+                                                                   settings_service,
+                                                                   factories):
+        settings_service.put(SETTING_CHECKPOINT, '2018-02-01T00:00:00.000000')
+        annotation = factories.Annotation(updated=datetime.datetime(2018, 3, 1))
+        batchindexer.index.return_value = {annotation.id}
+
+        _, errored = catchup(db_session, es, pyramid_request)
+
+        assert errored == {annotation.id}
+        assert settings_service.get(SETTING_CHECKPOINT) == '2018-02-01T00:00:00.000000'
+
+    @pytest.fixture
+    def BatchIndexer(self, patch):
+        return patch('h.indexer.catchup.BatchIndexer')
+
+    @pytest.fixture
+    def batchindexer(self, BatchIndexer):
+        indexer = BatchIndexer.return_value
+        indexer.index.return_value = set()
+        indexer.delete.return_value = set()
+        return indexer
+
+    @pytest.fixture
+    def es(self):
+        return mock.Mock()
+
+    @pytest.fixture
+    def settings_service(self, pyramid_config):
+        service = FakeSettingsService()
+        pyramid_config.register_service(service, name='settings')
+        return service
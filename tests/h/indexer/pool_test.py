@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import mock
+import pytest
+
+from h.indexer import pool
+
+
+def job(session, es, request, n):
+    return session, es, request, n
+
+
+class TestImapUnordered(object):
+    def test_it_runs_jobs_in_this_process_with_one_worker(self):
+        results = pool.imap_unordered(job, [(1,), (2,)], 'session', 'es', 'request')
+
+        assert list(results) == [('session', 'es', 'request', 1),
+                                 ('session', 'es', 'request', 2)]
+
+    def test_it_requires_bootstrap_with_multiple_workers(self):
+        with pytest.raises(ValueError):
+            list(pool.imap_unordered(job, [(1,)], 'session', 'es', 'request', workers=2))
+
+    def test_it_runs_jobs_with_each_workers_own_request(self, Pool):
+        worker_request = mock.Mock(db='worker-session', es='worker-es')
+        bootstrap = mock.Mock(return_value=worker_request)
+
+        results = pool.imap_unordered(job, [(1,)], 'session', 'es', 'request',
+                                      workers=2, bootstrap=bootstrap)
+
+        assert list(results) == [('worker-session', 'worker-es', worker_request, 1)]
+        Pool.assert_called_once_with(2, mock.ANY, (bootstrap,))
+
+    def test_it_terminates_the_pool(self, Pool):
+        bootstrap = mock.Mock()
+
+        list(pool.imap_unordered(job, [(1,)], 'session', 'es', 'request',
+                                 workers=2, bootstrap=bootstrap))
+
+        Pool.return_value.terminate.assert_called_once_with()
+
+    @pytest.fixture
+    def Pool(self, patch):
+        Pool = patch('h.indexer.pool.multiprocessing.Pool')
+
+        def imap_unordered(func, calls):
+            _, initializer, initargs = Pool.call_args[0]
+            initializer(*initargs)
+            return [func(call) for call in calls]
+
+        Pool.return_value.imap_unordered.side_effect = imap_unordered
+        return Pool
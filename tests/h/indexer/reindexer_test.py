@@ -1,18 +1,72 @@
 # -*- coding: utf-8 -*-
 
 from __future__ import unicode_literals
+import datetime
+import json
+
 import mock
 import pytest
 
-from h.indexer.reindexer import reindex, SETTING_NEW_INDEX
+from h.indexer.reindexer import (
+    current_new_index,
+    reindex,
+    NEW_INDEX_CACHE_TTL,
+    SETTING_NEW_INDEX,
+    SETTING_PROGRESS,
+    SETTING_WINDOWS,
+)
 from h.search import client
+from h.search.index import Window
+
+
+class FakeSettingsService(object):
+    def __init__(self):
+        self._data = {}
+
+    def get(self, key):
+        return self._data.get(key)
+
+    def put(self, key, value):
+        self._data[key] = value
+
+    def delete(self, key):
+        self._data.pop(key, None)
+
+
+class TestCurrentNewIndex(object):
+    def test_returns_the_new_index_name(self, settings):
+        settings.put(SETTING_NEW_INDEX, 'hypothesis-abcd1234')
+
+        assert current_new_index(settings) == 'hypothesis-abcd1234'
+
+    def test_returns_none_when_not_reindexing(self, settings):
+        assert current_new_index(settings) is None
+
+    def test_caches_the_new_index_name(self, settings):
+        settings.put(SETTING_NEW_INDEX, 'hypothesis-abcd1234')
+        current_new_index(settings)
+        settings.delete(SETTING_NEW_INDEX)
+
+        assert current_new_index(settings) == 'hypothesis-abcd1234'
+
+    def test_caches_that_there_is_no_new_index(self, settings):
+        current_new_index(settings)
+        settings.put(SETTING_NEW_INDEX, 'hypothesis-abcd1234')
+
+        assert current_new_index(settings) is None
+
+    @pytest.fixture
+    def settings(self):
+        return FakeSettingsService()
 
 
-@pytest.mark.usefixtures('BatchIndexer',
+@pytest.mark.usefixtures('batchindexer',
+                         'annotation_windows',
                          'configure_index',
                          'get_aliased_index',
                          'update_aliased_index',
-                         'settings_service')
+                         'settings_service',
+                         'sleep')
 class TestReindex(object):
     def test_sets_op_type_to_create(self, pyramid_request, es, BatchIndexer):
         reindex(mock.sentinel.session, es, pyramid_request)
@@ -20,22 +74,40 @@ class TestReindex(object):
         _, kwargs = BatchIndexer.call_args
         assert kwargs['op_type'] == 'create'
 
-    def test_indexes_annotations(self, pyramid_request, es, batchindexer):
-        """Should call .index() on the batch indexer instance."""
+    def test_splits_annotations_into_windows(self, pyramid_request, es, annotation_windows):
         reindex(mock.sentinel.session, es, pyramid_request)
 
-        batchindexer.index.assert_called_once_with()
+        annotation_windows.assert_called_once_with(mock.sentinel.session)
+
+    def test_indexes_each_window(self, pyramid_request, es, batchindexer, windows):
+        reindex(mock.sentinel.session, es, pyramid_request)
+
+        assert batchindexer.export_window.mock_calls == [mock.call(w) for w in windows]
+
+    def test_passes_chunk_size_to_indexer(self, pyramid_request, es, BatchIndexer):
+        reindex(mock.sentinel.session, es, pyramid_request, chunk_size=500)
+
+        _, kwargs = BatchIndexer.call_args
+        assert kwargs['chunk_size'] == 500
+
+    def test_passes_writers_to_indexer(self, pyramid_request, es, BatchIndexer):
+        reindex(mock.sentinel.session, es, pyramid_request, writers=4)
+
+        _, kwargs = BatchIndexer.call_args
+        assert kwargs['writers'] == 4
 
     def test_retries_failed_annotations(self, pyramid_request, es, batchindexer):
-        """Should call .index() a second time with any failed annotation IDs."""
-        batchindexer.index.return_value = ['abc123', 'def456']
+        """Should call .index() with any failed annotation IDs."""
+        batchindexer.export_window.side_effect = [{'abc123'}, {'def456'}]
+
+        reindex(mock.sentinel.session, es, pyramid_request)
+
+        batchindexer.index.assert_called_once_with({'abc123', 'def456'})
 
+    def test_does_not_retry_when_nothing_failed(self, pyramid_request, es, batchindexer):
         reindex(mock.sentinel.session, es, pyramid_request)
 
-        assert batchindexer.index.mock_calls == [
-            mock.call(),
-            mock.call(['abc123', 'def456']),
-        ]
+        assert not batchindexer.index.called
 
     def test_creates_new_index(self, pyramid_request, es, configure_index, matchers):
         """Creates a new target index."""
@@ -61,8 +133,8 @@ class TestReindex(object):
         update_aliased_index.assert_called_once_with(es, 'hypothesis-abcd1234')
 
     def test_does_not_update_alias_if_indexing_fails(self, pyramid_request, es, batchindexer, update_aliased_index):
-        """Don't call update_aliased_index if index() fails..."""
-        batchindexer.index.side_effect = RuntimeError('fail')
+        """Don't call update_aliased_index if export_window() fails..."""
+        batchindexer.export_window.side_effect = RuntimeError('fail')
 
         try:
             reindex(mock.sentinel.session, es, pyramid_request)
@@ -77,25 +149,120 @@ class TestReindex(object):
         with pytest.raises(RuntimeError):
             reindex(mock.sentinel.session, es, mock.sentinel.request)
 
-    def test_stores_new_index_name_in_settings(self, pyramid_request, es, settings_service, configure_index):
+    def test_raises_if_multiple_workers_without_bootstrap(self, pyramid_request, es):
+        with pytest.raises(ValueError):
+            reindex(mock.sentinel.session, es, pyramid_request, workers=2)
+
+    def test_stores_new_index_name_in_settings(self, pyramid_request, es, settings_service, configure_index, batchindexer):
         configure_index.return_value = 'hypothesis-abcd1234'
+        batchindexer.export_window.side_effect = RuntimeError('boom!')
+
+        with pytest.raises(RuntimeError):
+            reindex(mock.sentinel.session, es, pyramid_request)
+
+        assert settings_service.get(SETTING_NEW_INDEX) == 'hypothesis-abcd1234'
+
+    def test_records_progress_after_each_window(self, pyramid_request, es, settings_service, batchindexer):
+        batchindexer.export_window.side_effect = [set(), RuntimeError('boom!')]
+
+        with pytest.raises(RuntimeError):
+            reindex(mock.sentinel.session, es, pyramid_request)
+
+        assert json.loads(settings_service.get(SETTING_PROGRESS)) == {'below': 1, 'done': []}
+
+    def test_resumes_interrupted_reindex(self,
+                                         pyramid_request,
+                                         es,
+                                         batchindexer,
+                                         configure_index,
+                                         update_aliased_index,
+                                         windows):
+        batchindexer.export_window.side_effect = [set(), RuntimeError('boom!')]
+        with pytest.raises(RuntimeError):
+            reindex(mock.sentinel.session, es, pyramid_request)
+        batchindexer.export_window.reset_mock()
+        batchindexer.export_window.side_effect = None
+        configure_index.reset_mock()
 
         reindex(mock.sentinel.session, es, pyramid_request)
 
-        settings_service.put.assert_called_once_with(SETTING_NEW_INDEX, 'hypothesis-abcd1234')
+        assert not configure_index.called
+        assert batchindexer.export_window.mock_calls == [mock.call(windows[1])]
+        update_aliased_index.assert_called_once_with(es, 'hypothesis-new')
 
-    def test_deletes_index_name_setting(self, pyramid_request, es, settings_service):
+    def test_deletes_settings_when_reindexed(self, pyramid_request, es, settings_service):
         reindex(mock.sentinel.session, es, pyramid_request)
 
-        settings_service.delete.assert_called_once_with(SETTING_NEW_INDEX)
+        assert settings_service.get(SETTING_NEW_INDEX) is None
+        assert settings_service.get(SETTING_WINDOWS) is None
+        assert settings_service.get(SETTING_PROGRESS) is None
+
+    def test_waits_for_indexers_to_write_to_new_index(self, pyramid_request, es, settings_service, sleep, batchindexer):
+        def check_sleep(seconds):
+            assert current_new_index(settings_service) == 'hypothesis-new'
+            assert not batchindexer.export_window.called
+        sleep.side_effect = check_sleep
+        # Cache the absence of a reindex, as an indexer task would have done.
+        current_new_index(settings_service)
+
+        reindex(mock.sentinel.session, es, pyramid_request)
 
-    def test_deletes_index_name_setting_when_exception_raised(self, pyramid_request, es, settings_service, batchindexer):
-        batchindexer.index.side_effect = RuntimeError('boom!')
+        sleep.assert_called_once_with(NEW_INDEX_CACHE_TTL)
 
+    def test_does_not_wait_when_resuming(self, pyramid_request, es, batchindexer, sleep):
+        batchindexer.export_window.side_effect = [set(), RuntimeError('boom!')]
         with pytest.raises(RuntimeError):
             reindex(mock.sentinel.session, es, pyramid_request)
+        batchindexer.export_window.side_effect = None
+        sleep.reset_mock()
+
+        reindex(mock.sentinel.session, es, pyramid_request)
+
+        assert not sleep.called
+
+    def test_clears_new_index_cache_when_reindexed(self, pyramid_request, es, settings_service, sleep):
+        sleep.side_effect = lambda _: current_new_index(settings_service)
 
-        settings_service.delete.assert_called_once_with(SETTING_NEW_INDEX)
+        reindex(mock.sentinel.session, es, pyramid_request)
+
+        assert current_new_index(settings_service) is None
+
+    def test_indexes_windows_in_a_worker_pool(self, pyramid_request, es, Pool, batchindexer, update_aliased_index):
+        pyramid_request.es = es
+        bootstrap = mock.Mock(return_value=pyramid_request)
+
+        reindex(mock.sentinel.session, es, pyramid_request, workers=3, bootstrap=bootstrap)
+
+        Pool.assert_called_once_with(3, mock.ANY, (bootstrap,))
+        assert batchindexer.export_window.call_count == 2
+        update_aliased_index.assert_called_once_with(es, 'hypothesis-new')
+
+    @pytest.fixture
+    def Pool(self, patch):
+        Pool = patch('h.indexer.pool.multiprocessing.Pool')
+
+        def imap_unordered(func, jobs):
+            _, initializer, initargs = Pool.call_args[0]
+            initializer(*initargs)
+            return [func(job) for job in jobs]
+
+        Pool.return_value.imap_unordered.side_effect = imap_unordered
+        return Pool
+
+    @pytest.fixture
+    def sleep(self, patch):
+        return patch('h.indexer.reindexer.time.sleep')
+
+    @pytest.fixture
+    def windows(self):
+        return [Window(datetime.datetime(2018, 1, 1), datetime.datetime(2018, 2, 1, 12, 30)),
+                Window(datetime.datetime(2018, 2, 1, 12, 30), None)]
+
+    @pytest.fixture
+    def annotation_windows(self, patch, windows):
+        annotation_windows = patch('h.indexer.reindexer.annotation_windows')
+        annotation_windows.return_value = windows
+        return annotation_windows
 
     @pytest.fixture
     def BatchIndexer(self, patch):
@@ -103,7 +270,9 @@ class TestReindex(object):
 
     @pytest.fixture
     def configure_index(self, patch):
-        return patch('h.indexer.reindexer.configure_index')
+        configure_index = patch('h.indexer.reindexer.configure_index')
+        configure_index.return_value = 'hypothesis-new'
+        return configure_index
 
     @pytest.fixture
     def get_aliased_index(self, patch):
@@ -118,7 +287,9 @@ class TestReindex(object):
     @pytest.fixture
     def batchindexer(self, BatchIndexer):
         indexer = BatchIndexer.return_value
-        indexer.index.return_value = []
+        indexer.index.return_value = set()
+        indexer.export_window.return_value = set()
+        indexer.indexed = 0
         return indexer
 
     @pytest.fixture
@@ -130,7 +301,7 @@ class TestReindex(object):
 
     @pytest.fixture
     def settings_service(self, pyramid_config):
-        service = mock.Mock()
+        service = FakeSettingsService()
         pyramid_config.register_service(service, name='settings')
         return service
 
@@ -1,32 +1,33 @@
 # -*- coding: utf-8 -*-
 
 from __future__ import unicode_literals
+import mock
 import pytest
 
 from h import events
 from h.indexer import subscribers
 
 
-@pytest.mark.usefixtures('add_annotation', 'delete_annotation')
+@pytest.mark.usefixtures('index_batch', 'delete_annotation')
 class TestSubscribeAnnotationEvent(object):
 
     @pytest.mark.parametrize('action', ['create', 'update'])
-    def test_it_enqueues_add_annotation_celery_task(self,
-                                                    action,
-                                                    add_annotation,
-                                                    delete_annotation,
-                                                    pyramid_request):
+    def test_it_adds_annotation_to_the_index_batch(self,
+                                                   action,
+                                                   index_batch,
+                                                   delete_annotation,
+                                                   pyramid_request):
         event = events.AnnotationEvent(pyramid_request,
                                        {'id': 'test_annotation_id'},
                                        action)
 
         subscribers.subscribe_annotation_event(event)
 
-        add_annotation.delay.assert_called_once_with(event.annotation_id)
+        index_batch.add.assert_called_once_with(event.annotation_id)
         assert not delete_annotation.delay.called
 
     def test_it_enqueues_delete_annotation_celery_task_for_delete(self,
-                                                                  add_annotation,
+                                                                  index_batch,
                                                                   delete_annotation,
                                                                   pyramid_request):
         event = events.AnnotationEvent(pyramid_request,
@@ -36,11 +37,12 @@ class TestSubscribeAnnotationEvent(object):
         subscribers.subscribe_annotation_event(event)
 
         delete_annotation.delay.assert_called_once_with(event.annotation_id)
-        assert not add_annotation.delay.called
+        assert not index_batch.add.called
 
     @pytest.fixture
-    def add_annotation(self, patch):
-        return patch('h.indexer.subscribers.add_annotation')
+    def index_batch(self, pyramid_request):
+        pyramid_request.index_batch = mock.Mock(spec_set=['add'])
+        return pyramid_request.index_batch
 
     @pytest.fixture
     def delete_annotation(self, patch):
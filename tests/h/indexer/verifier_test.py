@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import mock
+import pytest
+
+from h.indexer import verifier
+from h.util.datetime import utc_iso8601
+
+
+@pytest.mark.usefixtures('scan')
+class TestVerify(object):
+    def test_it_counts_checked_annotations(self, db_session, es, pyramid_request, factories, index):
+        for annotation in factories.Annotation.create_batch(3):
+            index(annotation)
+
+        report = verifier.verify(db_session, es, pyramid_request)
+
+        assert report.checked == 3
+        assert report.ok
+
+    def test_it_reports_missing_annotations(self, db_session, es, pyramid_request, factories):
+        annotation = factories.Annotation()
+
+        report = verifier.verify(db_session, es, pyramid_request)
+
+        assert report.missing == 1
+        assert report.examples['missing'] == [annotation.id]
+        assert not report.ok
+
+    def test_it_reports_annotations_marked_deleted_in_the_index_as_missing(self,
+                                                                          db_session,
+                                                                          es,
+                                                                          pyramid_request,
+                                                                          factories,
+                                                                          index):
+        annotation = factories.Annotation()
+        index(annotation, deleted=True)
+
+        report = verifier.verify(db_session, es, pyramid_request)
+
+        assert report.missing == 1
+
+    def test_it_reports_stale_annotations(self, db_session, es, pyramid_request, factories, index):
+        annotation = factories.Annotation()
+        index(annotation, updated='2001-01-01T00:00:00+00:00')
+
+        report = verifier.verify(db_session, es, pyramid_request)
+
+        assert report.stale == 1
+        assert report.examples['stale'] == [annotation.id]
+
+    def test_it_ignores_deleted_annotations(self, db_session, es, pyramid_request, factories):
+        factories.Annotation(deleted=True)
+
+        report = verifier.verify(db_session, es, pyramid_request)
+
+        assert report.checked == 0
+
+    def test_it_reports_orphaned_annotations(self, db_session, es, pyramid_request, factories, scan):
+        deleted = factories.Annotation(deleted=True)
+        scan.return_value = [{'_id': deleted.id}]
+
+        report = verifier.verify(db_session, es, pyramid_request)
+
+        assert report.orphaned == 1
+        assert report.examples['orphaned'] == [deleted.id]
+
+    def test_it_reports_indexed_annotations_with_invalid_ids_as_orphaned(self,
+                                                                         db_session,
+                                                                         es,
+                                                                         pyramid_request,
+                                                                         factories,
+                                                                         scan):
+        annotation = factories.Annotation()
+        scan.return_value = [{'_id': 'not-a-valid-id'}, {'_id': annotation.id}]
+
+        report = verifier.verify(db_session, es, pyramid_request)
+
+        assert report.orphaned == 1
+        assert report.examples['orphaned'] == ['not-a-valid-id']
+
+    def test_it_limits_the_number_of_examples(self, db_session, es, pyramid_request, factories):
+        factories.Annotation.create_batch(verifier.EXAMPLES + 1)
+
+        report = verifier.verify(db_session, es, pyramid_request)
+
+        assert report.missing == verifier.EXAMPLES + 1
+        assert len(report.examples['missing']) == verifier.EXAMPLES
+
+    def test_it_does_not_fix_by_default(self, db_session, es, pyramid_request, factories, BatchIndexer):
+        factories.Annotation()
+
+        verifier.verify(db_session, es, pyramid_request)
+
+        assert not BatchIndexer.called
+
+    def test_fix_reindexes_missing_and_stale_annotations(self,
+                                                         db_session,
+                                                         es,
+                                                         pyramid_request,
+                                                         factories,
+                                                         index,
+                                                         BatchIndexer):
+        missing = factories.Annotation()
+        stale = factories.Annotation()
+        index(stale, updated='2001-01-01T00:00:00+00:00')
+
+        verifier.verify(db_session, es, pyramid_request, fix=True)
+
+        ids, = BatchIndexer.return_value.index.call_args[0]
+        assert sorted(ids) == sorted([missing.id, stale.id])
+
+    def test_fix_marks_orphaned_annotations_deleted(self,
+                                                    db_session,
+                                                    es,
+                                                    pyramid_request,
+                                                    factories,
+                                                    scan,
+                                                    BatchIndexer):
+        deleted = factories.Annotation(deleted=True)
+        scan.return_value = [{'_id': deleted.id}]
+
+        verifier.verify(db_session, es, pyramid_request, fix=True)
+
+        BatchIndexer.return_value.delete.assert_called_once_with([deleted.id])
+
+    @pytest.fixture
+    def es(self):
+        es = mock.Mock(index='hypothesis')
+        es.docs = {}
+
+        def mget(body, **kwargs):
+            return {'docs': [dict(_id=id_, found=id_ in es.docs, _source=es.docs.get(id_, {}))
+                             for id_ in body['ids']]}
+
+        es.conn.mget.side_effect = mget
+        return es
+
+    @pytest.fixture
+    def index(self, es):
+        def index(annotation, **source):
+            source.setdefault('updated', utc_iso8601(annotation.updated))
+            es.docs[annotation.id] = source
+        return index
+
+    @pytest.fixture
+    def scan(self, patch):
+        scan = patch('h.indexer.verifier.es_helpers.scan')
+        scan.return_value = []
+        return scan
+
+    @pytest.fixture
+    def BatchIndexer(self, patch):
+        BatchIndexer = patch('h.indexer.verifier.BatchIndexer')
+        BatchIndexer.return_value.index.return_value = set()
+        return BatchIndexer
@@ -130,6 +130,30 @@ def test_jsonld_id_link(factories, pyramid_config, pyramid_request):
     assert link == 'http://example.com/annos/e22AJlHYQNCG70bXL7gr1w'
 
 
+def test_json_link_generates_route_once_per_request(pyramid_config, pyramid_request):
+    pyramid_config.add_route('api.annotation', '/annos/{id}')
+    first, second = FakeAnnotation(), FakeAnnotation()
+    first.id, second.id = 'first', 'second'
+
+    with mock.patch.object(pyramid_request, 'route_url',
+                           wraps=pyramid_request.route_url) as route_url:
+        links.json_link(pyramid_request, first)
+        link = links.json_link(pyramid_request, second)
+
+    assert route_url.call_count == 1
+    assert link == 'http://example.com/annos/second'
+
+
+def test_json_link_quotes_the_annotation_id(pyramid_config, pyramid_request):
+    pyramid_config.add_route('api.annotation', '/annos/{id}')
+    annotation = FakeAnnotation()
+    annotation.id = 'an id/with?unsafe#chars'
+
+    link = links.json_link(pyramid_request, annotation)
+
+    assert link == pyramid_request.route_url('api.annotation', id=annotation.id)
+
+
 @pytest.mark.parametrize('uri,formatted', [
     ('http://notsecure.com', 'notsecure.com'),
     ('https://secure.com', 'secure.com'),
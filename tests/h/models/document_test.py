@@ -675,6 +675,12 @@ class TestMergeDocuments(object):
         assert 0 == \
             db_session.query(models.Annotation).filter_by(document_id=duplicate_2.id).count()
 
+    def test_merge_documents_invalidates_cached_uri_expansions(self, db_session, merge_data,
+                                                               uri_expansion_cache):
+        document.merge_documents(db_session, merge_data)
+
+        uri_expansion_cache.pop.assert_any_call('httpx://en.wikipedia.org/wiki/Main_Page')
+
     def test_raises_retryable_error_when_flush_fails(self, db_session, merge_data, monkeypatch):
         def err():
             raise sa.exc.IntegrityError(None, None, None)
@@ -965,6 +971,29 @@ class TestUpdateDocumentMetadata(object):
         Document.find_or_create_by_uris.return_value.count.return_value = 1
         return Document
 
+    def test_it_invalidates_cached_uri_expansions(self,
+                                                  annotation,
+                                                  Document,
+                                                  session,
+                                                  uri_expansion_cache):
+        document_ = Document.find_or_create_by_uris.return_value.first.return_value
+        document_.document_uris = [
+            mock.Mock(uri_normalized='httpx://example.com/example_1'),
+            mock.Mock(uri_normalized='httpx://example.com/example_2'),
+        ]
+
+        document.update_document_metadata(session,
+                                          annotation.target_uri,
+                                          [],
+                                          [],
+                                          annotation.created,
+                                          annotation.updated)
+
+        assert uri_expansion_cache.pop.call_args_list == [
+            mock.call('httpx://example.com/example_1'),
+            mock.call('httpx://example.com/example_2'),
+        ]
+
     @pytest.fixture
     def merge_documents(self, patch):
         return patch('h.models.document.merge_documents')
@@ -1023,3 +1052,8 @@ def mock_document_meta(document=None):
 @pytest.fixture
 def log(patch):
     return patch('h.models.document.log')
+
+
+@pytest.fixture
+def uri_expansion_cache(patch):
+    return patch('h.models.document.uri_expansion_cache')
@@ -9,6 +9,7 @@ import pytest
 from h.nipsa import subscribers
 
 FakeEvent = namedtuple('FakeEvent', ['request', 'annotation', 'annotation_dict'])
+FakeBatchEvent = namedtuple('FakeBatchEvent', ['request', 'annotation_dicts'])
 
 
 class FakeAnnotation(object):
@@ -70,3 +71,41 @@ class TestTransformAnnotation(object):
         service.hidden.return_value = False
         pyramid_config.register_service(service, name='annotation_moderation')
         return service
+
+
+@pytest.mark.usefixtures('nipsa_service', 'moderation_service')
+class TestTransformAnnotations(object):
+    def test_with_user_nipsa(self, nipsa_service, pyramid_request):
+        nipsa_service.is_flagged.side_effect = lambda userid: userid == 'george'
+        dicts = [{'id': 'ann-1', 'user': 'george'},
+                 {'id': 'ann-2', 'user': 'georgia'},
+                 {'id': 'ann-3'}]
+
+        subscribers.transform_annotations(FakeBatchEvent(request=pyramid_request,
+                                                         annotation_dicts=dicts))
+
+        assert [d.get('nipsa') for d in dicts] == [True, None, None]
+
+    def test_with_moderated_annotations(self, moderation_service, pyramid_request):
+        moderation_service.all_hidden.return_value = {'moderated'}
+        dicts = [{'id': 'normal'}, {'id': 'moderated'}]
+
+        subscribers.transform_annotations(FakeBatchEvent(request=pyramid_request,
+                                                         annotation_dicts=dicts))
+
+        moderation_service.all_hidden.assert_called_once_with(['normal', 'moderated'])
+        assert [d.get('nipsa') for d in dicts] == [None, True]
+
+    @pytest.fixture
+    def nipsa_service(self, pyramid_config):
+        service = mock.Mock(spec_set=['is_flagged'])
+        service.is_flagged.return_value = False
+        pyramid_config.register_service(service, name='nipsa')
+        return service
+
+    @pytest.fixture
+    def moderation_service(self, pyramid_config):
+        service = mock.Mock(spec_set=['all_hidden'])
+        service.all_hidden.return_value = set()
+        pyramid_config.register_service(service, name='annotation_moderation')
+        return service
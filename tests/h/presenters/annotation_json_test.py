@@ -137,6 +137,15 @@ class TestAnnotationJSONPresenter(object):
 
         assert 'enterprise' not in presented
 
+    def test_rejects_formatters_not_implementing_the_interface(self,
+                                                               group_service,
+                                                               fake_links_service):
+        resource = AnnotationContext(mock.Mock(), group_service, fake_links_service)
+        formatter = mock.Mock(spec_set=['preload', 'format'])
+
+        with pytest.raises(ValueError):
+            AnnotationJSONPresenter(resource, [formatter])
+
     def test_formatter_uses_annotation_resource(self, group_service, fake_links_service):
         annotation = mock.Mock(id='the-id', extra={})
         resource = AnnotationContext(annotation, group_service, fake_links_service)
@@ -65,6 +65,17 @@ class TestAnnotationSearchIndexPresenter(object):
         assert annotation_dict['target'][0]['scope'] == [
             'http://example.com/normalized']
 
+    def test_it_uses_the_given_thread_ids(self):
+        annotation = mock.Mock(
+            userid='acct:luke@hypothes.is',
+            thread_ids=['thread-id-1'],
+            extra={})
+
+        annotation_dict = AnnotationSearchIndexPresenter(annotation,
+                                                         thread_ids=['thread-id-2']).asdict()
+
+        assert annotation_dict['thread_ids'] == ['thread-id-2']
+
     @pytest.fixture
     def DocumentSearchIndexPresenter(self, patch):
         class_ = patch('h.presenters.annotation_searchindex.DocumentSearchIndexPresenter')
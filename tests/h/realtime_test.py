@@ -129,6 +129,21 @@ class TestPublisher(object):
                                                  routing_key='user',
                                                  headers=expected_headers)
 
+    def test_publish_nipsa(self, matchers, producer_pool, pyramid_request):
+        payload = {'userid': 'acct:foobar@example.com', 'nipsa': True}
+        producer = producer_pool['foobar'].acquire().__enter__()
+        exchange = realtime.get_exchange()
+
+        publisher = realtime.Publisher(pyramid_request)
+        publisher.publish_nipsa(payload)
+
+        expected_headers = matchers.MappingContaining('timestamp')
+        producer.publish.assert_called_once_with(payload,
+                                                 exchange=exchange,
+                                                 declare=[exchange],
+                                                 routing_key='nipsa',
+                                                 headers=expected_headers)
+
     @pytest.fixture
     def producer_pool(self, patch):
         return patch('h.realtime.producer_pool')
@@ -7,7 +7,9 @@ from collections import OrderedDict
 import mock
 import pytest
 
+from h import renderers
 from h.renderers import json_sorted_factory
+from h.renderers import NDJSONRenderer
 from h.renderers import SVGRenderer
 
 
@@ -23,6 +25,68 @@ class TestSortedJSONRenderer(object):
         assert result == '{"bar": 1, "baz": 5, "foo": "bang"}'
 
 
+class TestNDJSONRenderer(object):
+
+    def test_it_renders_one_item_per_line(self, system):
+        renderer = NDJSONRenderer(info=None)
+
+        result = renderer(({'id': id_} for id_ in ['a', 'b']), system)
+
+        assert b''.join(result) == b'{"id": "a"}\n{"id": "b"}\n'
+
+    def test_it_renders_nothing_for_no_items(self, system):
+        renderer = NDJSONRenderer(info=None)
+
+        result = renderer(iter([]), system)
+
+        assert b''.join(result) == b''
+
+    def test_it_splits_the_body_into_chunks(self, monkeypatch, system):
+        monkeypatch.setattr(renderers, 'NDJSON_CHUNK_SIZE', 10)
+        renderer = NDJSONRenderer(info=None)
+
+        result = renderer(({'id': 'x' * 20} for _ in range(3)), system)
+
+        assert len(result) == 3
+        assert b''.join(result) == ('{"id": "%s"}\n' % ('x' * 20) * 3).encode('utf-8')
+
+    def test_it_renders_objects_with_a_json_method(self, pyramid_request, system):
+        value = mock.Mock(spec_set=['__json__'])
+        value.__json__.return_value = 'encoded'
+        renderer = NDJSONRenderer(info=None)
+
+        result = renderer([value], system)
+
+        value.__json__.assert_called_once_with(pyramid_request)
+        assert b''.join(result) == b'"encoded"\n'
+
+    def test_it_raises_for_objects_it_cant_encode(self, system):
+        renderer = NDJSONRenderer(info=None)
+
+        with pytest.raises(TypeError):
+            renderer([object()], system)
+
+    def test_it_sets_the_content_type_and_length(self, pyramid_request, system):
+        renderer = NDJSONRenderer(info=None)
+
+        result = renderer([{'id': 'a'}], system)
+
+        assert pyramid_request.response.content_type == 'application/x-ndjson'
+        assert pyramid_request.response.content_length == len(b''.join(result))
+
+    def test_it_keeps_a_content_type_set_by_the_view(self, pyramid_request, system):
+        pyramid_request.response.content_type = 'application/x-custom+json'
+        renderer = NDJSONRenderer(info=None)
+
+        renderer([], system)
+
+        assert pyramid_request.response.content_type == 'application/x-custom+json'
+
+    @pytest.fixture
+    def system(self, pyramid_request):
+        return {'request': pyramid_request}
+
+
 class TestSVGRenderer(object):
     def test_it_sets_the_content_type(self, pyramid_request, system, svg_renderer):
         svg_renderer(mock.sentinel.svg_content, system)
@@ -74,6 +74,7 @@ def test_includeme():
         call('api.index', '/api/'),
         call('api.links', '/api/links'),
         call('api.annotations', '/api/annotations'),
+        call('api.annotations.batch', '/api/annotations/batch'),
         call('api.annotation',
              '/api/annotations/{id:[A-Za-z0-9_-]{20,22}}',
              factory='h.traversal:AnnotationRoot',
@@ -94,6 +95,7 @@ def test_includeme():
         call('api.debug_token', '/api/debug-token'),
         call('api.group_member', '/api/groups/{pubid}/members/{user}', factory='h.traversal.GroupRoot', traverse='/{pubid}'),
         call('api.search', '/api/search'),
+        call('api.export', '/api/export'),
         call('api.users', '/api/users'),
         call('api.user', '/api/users/{username}'),
         call('badge', '/api/badge'),
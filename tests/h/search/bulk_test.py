@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import json
+import threading
+import time
+
+import mock
+import pytest
+from elasticsearch1.exceptions import TransportError
+
+from h.search.bulk import pipelined_bulk
+
+
+class TestPipelinedBulk(object):
+    def test_it_sends_the_actions_in_chunks(self, client):
+        results = list(pipelined_bulk(client, actions(5), chunk_size=2))
+
+        assert sorted(len(ids) for ids in client.requests) == [1, 2, 2]
+        assert sorted(item['index']['_id'] for _, item in results) == ids(5)
+
+    def test_it_reports_successes_and_failures(self, client):
+        client.statuses = {'id-1': 400}
+
+        results = list(pipelined_bulk(client, actions(3), chunk_size=10))
+
+        assert sorted((item['index']['_id'], ok) for ok, item in results) == [
+            ('id-0', True), ('id-1', False), ('id-2', True)]
+
+    def test_it_sends_from_several_writers(self, client):
+        client.delay = 0.01
+
+        list(pipelined_bulk(client, actions(20), chunk_size=1, writers=4))
+
+        assert len(client.threads) > 1
+
+    def test_it_retries_actions_rejected_with_429(self, client, sleep):
+        client.statuses = {'id-1': [429, 429, 201]}
+
+        results = list(pipelined_bulk(client, actions(2), chunk_size=10))
+
+        assert all(ok for ok, _ in results)
+        assert client.requests == [ids(2), ['id-1'], ['id-1']]
+        assert sleep.call_args_list == [mock.call(1), mock.call(2)]
+
+    def test_it_retries_requests_rejected_with_429(self, client, sleep):
+        client.errors = [TransportError(429, 'too many requests')]
+
+        results = list(pipelined_bulk(client, actions(2), chunk_size=10))
+
+        assert all(ok for ok, _ in results)
+        assert len(results) == 2
+
+    def test_it_gives_up_after_max_retries(self, client, sleep):
+        client.statuses = {'id-0': 429}
+
+        results = list(pipelined_bulk(client, actions(1), chunk_size=10, max_retries=2))
+
+        assert [ok for ok, _ in results] == [False]
+        assert len(client.requests) == 3
+
+    def test_it_fails_the_chunk_if_the_request_fails(self, client):
+        client.errors = [TransportError(500, 'boom')]
+
+        results = list(pipelined_bulk(client, actions(2), chunk_size=10))
+
+        assert sorted((ok, item['index']['_id'], item['index']['status'])
+                      for ok, item in results) == [(False, 'id-0', 500),
+                                                   (False, 'id-1', 500)]
+
+    def test_it_bounds_the_number_of_waiting_chunks(self, client):
+        produced = []
+        client.block = threading.Event()
+
+        def tracked_actions():
+            for action in actions(10):
+                produced.append(action)
+                yield action
+
+        results = pipelined_bulk(client, tracked_actions(), chunk_size=1,
+                                 writers=1, queue_size=2)
+        thread = threading.Thread(target=list, args=(results,))
+        thread.daemon = True
+        thread.start()
+        thread.join(0.2)
+
+        # One chunk being sent, two waiting and one blocked trying to join them
+        assert len(produced) == 4
+
+        client.block.set()
+        thread.join(5)
+        assert len(produced) == 10
+
+    @pytest.fixture
+    def client(self):
+        return FakeClient()
+
+    @pytest.fixture
+    def sleep(self, patch):
+        return patch('h.search.bulk.time.sleep')
+
+
+class FakeClient(object):
+    """A fake Elasticsearch client which records the bulk requests sent."""
+
+    def __init__(self):
+        self.transport = mock.Mock(serializer=mock.Mock(dumps=json.dumps))
+        self.requests = []
+        self.threads = set()
+        self.statuses = {}
+        self.errors = []
+        self.block = None
+        self.delay = None
+        self._lock = threading.Lock()
+
+    def bulk(self, body):
+        if self.block is not None:
+            self.block.wait()
+        if self.delay is not None:
+            time.sleep(self.delay)
+        lines = [json.loads(line) for line in body.splitlines()]
+        ids = [line['index']['_id'] for line in lines[::2]]
+
+        with self._lock:
+            self.threads.add(threading.current_thread().ident)
+            self.requests.append(ids)
+            if self.errors:
+                raise self.errors.pop(0)
+            items = [{'index': {'_id': id_, 'status': self._status(id_)}}
+                     for id_ in ids]
+        return {'items': items}
+
+    def _status(self, id_):
+        status = self.statuses.get(id_, 201)
+        if isinstance(status, list):
+            return status.pop(0)
+        return status
+
+
+def actions(count):
+    return [({'index': {'_id': id_}}, {'id': id_}) for id_ in ids(count)]
+
+
+def ids(count):
+    return ['id-{}'.format(i) for i in range(count)]
@@ -221,3 +221,35 @@ class TestSearchWithSeparateReplies(object):
 
         assert len(result.reply_ids) == 3
         assert oldest_reply.id not in result.reply_ids
+
+    def test_replies_can_be_paginated(self, pyramid_request, Annotation):
+        annotation = Annotation(shared=True)
+        now = datetime.datetime.now()
+        five_mins = datetime.timedelta(minutes=5)
+        replies = [Annotation(updated=now - (five_mins * n), references=[annotation.id], shared=True)
+                   for n in range(4)]
+
+        result = search.Search(pyramid_request,
+                               separate_replies=True,
+                               _replies_limit=2,
+                               _replies_offset=2).run({})
+
+        assert result.reply_ids == [replies[2].id, replies[3].id]
+        assert result.reply_total == 4
+
+    def test_replies_are_included_in_uri_searches(self, pyramid_request, Annotation):
+        now = datetime.datetime.now()
+        five_mins = datetime.timedelta(minutes=5)
+        uri = 'http://example.com'
+        annotation = Annotation(target_uri=uri, updated=now + five_mins, shared=True)
+        reply = Annotation(target_uri=uri, references=[annotation.id], shared=True)
+        # This annotation is on the second page of results, so its reply
+        # shouldn't be included.
+        other_annotation = Annotation(target_uri=uri, updated=now, shared=True)
+        Annotation(target_uri=uri, references=[other_annotation.id], shared=True)
+
+        result = search.Search(pyramid_request, separate_replies=True).run({'uri': uri, 'limit': 1})
+
+        assert result.annotation_ids == [annotation.id]
+        assert result.reply_ids == [reply.id]
+        assert result.reply_total == 1
@@ -1,8 +1,12 @@
 from __future__ import unicode_literals
 import mock
 import pytest
+from elasticsearch1.exceptions import TransportError
 
 from h.search import core
+from h.search.query import extract_cursor
+from h.search.result_cache import ResultCache
+from h.util import uri
 
 
 class FakeStatsdClient(object):
@@ -33,7 +37,7 @@ class TestSearch(object):
     def test_run_searches_annotations(self, pyramid_request, _search_annotations):
         params = mock.Mock()
 
-        _search_annotations.return_value = (0, [], {})
+        _search_annotations.return_value = (0, [], {}, None)
 
         search = core.Search(pyramid_request)
         search.run(params)
@@ -45,7 +49,8 @@ class TestSearch(object):
                                   _search_replies,
                                   _search_annotations):
         annotation_ids = [mock.Mock(), mock.Mock()]
-        _search_annotations.return_value = (2, annotation_ids, {})
+        _search_annotations.return_value = (2, annotation_ids, {}, None)
+        _search_replies.return_value = ([], 0)
 
         search = core.Search(pyramid_request)
         search.run({})
@@ -60,17 +65,18 @@ class TestSearch(object):
         annotation_ids = ['id-1', 'id-3', 'id-6', 'id-5']
         reply_ids = ['reply-8', 'reply-5']
         aggregations = {'foo': 'bar'}
-        _search_annotations.return_value = (total, annotation_ids, aggregations)
-        _search_replies.return_value = reply_ids
+        _search_annotations.return_value = (total, annotation_ids, aggregations, 'cursor')
+        _search_replies.return_value = (reply_ids, 7)
 
         search = core.Search(pyramid_request)
         result = search.run({})
 
-        assert result == core.SearchResult(total, annotation_ids, reply_ids, aggregations)
+        assert result == core.SearchResult(total, annotation_ids, reply_ids, aggregations, 7,
+                                           'cursor')
 
-    def test_search_annotations_includes_replies_by_default(self, pyramid_request, query):
+    def test_run_includes_replies_by_default(self, pyramid_request, query):
         search = core.Search(pyramid_request)
-        search._search_annotations({})
+        search.run({})
 
         assert not query.TopLevelAnnotationsFilter.called, (
                 "Replies should not be filtered out of the 'rows' list if "
@@ -107,9 +113,25 @@ class TestSearch(object):
         foobaragg = mock.Mock(key='foobar')
         search.append_aggregation(foobaragg)
 
-        _, _, aggregations = search._search_annotations({})
+        _, _, aggregations, _ = search._search_annotations({})
         assert aggregations == {'foobar': foobaragg.parse_result.return_value}
 
+    def test_search_annotations_returns_a_cursor_after_a_full_page(self, pyramid_request):
+        search = core.Search(pyramid_request)
+        search.es.conn.search.return_value = dummy_search_results(count=2)
+
+        _, _, _, cursor = search._search_annotations({'limit': 2, 'cursor': ''})
+
+        assert extract_cursor({'cursor': cursor})['id'] == 'id_2'
+
+    def test_search_annotations_returns_no_cursor_after_the_last_page(self, pyramid_request):
+        search = core.Search(pyramid_request)
+        search.es.conn.search.return_value = dummy_search_results(count=1)
+
+        _, _, _, cursor = search._search_annotations({'limit': 2, 'cursor': ''})
+
+        assert cursor is None
+
     def test_search_annotations_works_with_stats_client(self, pyramid_request):
         search = core.Search(pyramid_request, stats=FakeStatsdClient())
         # This should not raise
@@ -117,14 +139,14 @@ class TestSearch(object):
 
     def test_search_replies_skips_search_by_default(self, pyramid_request):
         search = core.Search(pyramid_request)
-        search._search_replies(['id-1', 'id-2'])
 
+        assert search._search_replies(['id-1', 'id-2']) == ([], 0)
         assert not search.es.conn.search.called
 
-    def test_search_annotations_excludes_replies_when_asked(self, pyramid_request, query):
+    def test_run_excludes_replies_when_asked(self, pyramid_request, query):
         search = core.Search(pyramid_request, separate_replies=True)
 
-        search._search_annotations({})
+        search.run({})
 
         assert mock.call(query.TopLevelAnnotationsFilter()) in \
             search.builder.append_filter.call_args_list
@@ -147,9 +169,9 @@ class TestSearch(object):
             }
         }
 
-        assert search._search_replies(['id-1']) == ['reply-1', 'reply-2']
+        assert search._search_replies(['id-1']) == (['reply-1', 'reply-2'], 2)
 
-    def test_search_replies_logs_warning_if_there_are_too_many_replies(self, pyramid_request, log):
+    def test_search_replies_returns_total_number_of_replies(self, pyramid_request):
         search = core.Search(pyramid_request, separate_replies=True)
 
         search.es.conn.search.return_value = {
@@ -159,8 +181,19 @@ class TestSearch(object):
             }
         }
 
+        assert search._search_replies(['id-1']) == (['reply-1'], 1100)
+
+    def test_search_replies_searches_the_requested_page_of_replies(self, pyramid_request):
+        search = core.Search(pyramid_request,
+                             separate_replies=True,
+                             _replies_limit=50,
+                             _replies_offset=100)
+
         search._search_replies(['id-1'])
-        assert log.warn.call_count == 1
+
+        _, kwargs = search.es.conn.search.call_args
+        assert kwargs['body']['size'] == 50
+        assert kwargs['body']['from'] == 100
 
     def test_search_replies_works_with_stats_client(self, pyramid_request):
         search = core.Search(pyramid_request,
@@ -226,9 +259,237 @@ class TestSearch(object):
     def query(self, patch):
         return patch('h.search.core.query')
 
+
+@pytest.mark.usefixtures('storage')
+class TestSearchWithPrefetchedReplies(object):
+    def test_it_searches_annotations_and_replies_in_one_request(self, pyramid_request):
+        search = core.Search(pyramid_request, separate_replies=True)
+
+        search.run({'uri': 'http://example.com'})
+
+        assert search.es.conn.msearch.call_count == 1
+        assert not search.es.conn.search.called
+
+    def test_it_fetches_the_references_of_replies(self, pyramid_request):
+        search = core.Search(pyramid_request, separate_replies=True)
+
+        search.run({'uri': 'http://example.com'})
+
+        _, kwargs = search.es.conn.msearch.call_args
+        _, body, _, reply_body = kwargs['body']
+        assert body['_source'] is False
+        assert reply_body['_source'] == ['references']
+        assert {'exists': {'field': 'references'}} in reply_body['query']['filtered']['filter']['and']
+
+    def test_it_fetches_replies_on_equivalent_uris(self, pyramid_request, storage):
+        storage.expand_uri.side_effect = lambda _, uri: [uri, 'http://example.com/alias']
+        search = core.Search(pyramid_request, separate_replies=True)
+
+        search.run({'uri': 'http://example.com'})
+
+        _, kwargs = search.es.conn.msearch.call_args
+        _, _, _, reply_body = kwargs['body']
+        uri_filter = [f for f in reply_body['query']['filtered']['filter']['and']
+                      if 'terms' in f and 'target.scope' in f['terms']]
+        assert set(uri_filter[0]['terms']['target.scope']) == set(
+            uri.normalize_many(['http://example.com', 'http://example.com/alias']))
+
+    def test_it_fetches_many_more_replies_than_a_page(self, pyramid_request):
+        search = core.Search(pyramid_request, separate_replies=True)
+
+        search.run({'uri': 'http://example.com'})
+
+        _, kwargs = search.es.conn.msearch.call_args
+        _, _, _, reply_body = kwargs['body']
+        assert reply_body['size'] == core.PREFETCH_REPLIES_MAX
+
+    def test_it_returns_replies_to_the_page_of_annotations(self, pyramid_request):
+        search = core.Search(pyramid_request, separate_replies=True)
+
+        result = search.run({'uri': 'http://example.com'})
+
+        assert result.annotation_ids == ['id_1', 'id_2']
+        assert result.reply_ids == ['reply-1', 'reply-3']
+        assert result.reply_total == 2
+
+    def test_it_returns_a_cursor_for_the_next_page(self, pyramid_request):
+        search = core.Search(pyramid_request, separate_replies=True)
+
+        result = search.run({'uri': 'http://example.com', 'limit': 2, 'cursor': ''})
+
+        assert extract_cursor({'cursor': result.cursor})['id'] == 'id_2'
+
+    def test_it_returns_the_requested_page_of_replies(self, pyramid_request):
+        search = core.Search(pyramid_request,
+                             separate_replies=True,
+                             _replies_limit=1,
+                             _replies_offset=1)
+
+        result = search.run({'uri': 'http://example.com'})
+
+        assert result.reply_ids == ['reply-3']
+        assert result.reply_total == 2
+
+    def test_it_ignores_an_invalid_page_of_replies(self, pyramid_request):
+        search = core.Search(pyramid_request,
+                             separate_replies=True,
+                             _replies_limit='many',
+                             _replies_offset='some')
+
+        result = search.run({'uri': 'http://example.com'})
+
+        assert result.reply_ids == ['reply-1', 'reply-3']
+
+    def test_it_searches_replies_separately_if_there_are_too_many(self, pyramid_request):
+        msearch_response = pyramid_request.es.conn.msearch.return_value
+        msearch_response['responses'][1]['hits']['total'] = core.PREFETCH_REPLIES_MAX + 1
+        search = core.Search(pyramid_request, separate_replies=True)
+
+        search.run({'uri': 'http://example.com'})
+
+        assert search.es.conn.search.call_count == 2
+
+    def test_it_searches_replies_separately_if_the_request_fails(self, pyramid_request):
+        msearch_response = pyramid_request.es.conn.msearch.return_value
+        msearch_response['responses'][1] = {'error': 'SearchPhaseExecutionException[...]'}
+        search = core.Search(pyramid_request, separate_replies=True)
+
+        search.run({'uri': 'http://example.com'})
+
+        assert search.es.conn.search.call_count == 2
+
+    def test_it_searches_replies_separately_if_the_request_raises(self, pyramid_request):
+        pyramid_request.es.conn.msearch.side_effect = TransportError(500, 'Internal Server Error')
+        search = core.Search(pyramid_request, separate_replies=True)
+
+        search.run({'uri': 'http://example.com'})
+
+        assert search.es.conn.search.call_count == 2
+
+    @pytest.mark.parametrize('params', [
+        {},
+        {'group': '__world__'},
+        {'uri': 'http://example.com', 'user': 'acct:bob@example.com'},
+        {'uri': 'http://example.com', 'any': 'foo'},
+    ])
+    def test_it_searches_replies_separately_for_other_searches(self, pyramid_request, params):
+        search = core.Search(pyramid_request, separate_replies=True)
+
+        search.run(params)
+
+        assert not search.es.conn.msearch.called
+        assert search.es.conn.search.call_count == 2
+
+    def test_it_does_not_prefetch_replies_by_default(self, pyramid_request):
+        search = core.Search(pyramid_request)
+
+        search.run({'uri': 'http://example.com'})
+
+        assert not search.es.conn.msearch.called
+
+    @pytest.fixture
+    def pyramid_request(self, pyramid_request):
+        annotations = dummy_search_results(count=2)
+        replies = {'hits': {'total': 3, 'hits': [
+            {'_id': 'reply-1', '_source': {'references': ['id_1']}},
+            {'_id': 'reply-2', '_source': {'references': ['id_9']}},
+            {'_id': 'reply-3', '_source': {'references': ['id_2', 'reply-1']}},
+        ]}}
+        pyramid_request.es.conn.msearch.return_value = {'responses': [annotations, replies]}
+        return pyramid_request
+
     @pytest.fixture
-    def log(self, patch):
-        return patch('h.search.core.log')
+    def storage(self, patch):
+        storage = patch('h.search.query.storage')
+        storage.expand_uri.side_effect = lambda _, uri: [uri]
+        return storage
+
+
+@pytest.mark.usefixtures('storage')
+class TestSearchResultCache(object):
+    def test_it_caches_anonymous_searches(self, pyramid_request):
+        first = core.Search(pyramid_request).run({'uri': 'http://example.com'})
+        second = core.Search(pyramid_request).run({'uri': 'http://example.com'})
+
+        assert second == first
+        assert pyramid_request.es.conn.search.call_count == 1
+
+    def test_it_does_not_share_results_between_different_searches(self, pyramid_request):
+        core.Search(pyramid_request).run({'uri': 'http://example.com'})
+        core.Search(pyramid_request).run({'uri': 'http://example.org'})
+
+        assert pyramid_request.es.conn.search.call_count == 2
+
+    def test_it_does_not_cache_authenticated_searches(self, pyramid_config, pyramid_request):
+        pyramid_config.testing_securitypolicy('acct:foo@example.com')
+
+        core.Search(pyramid_request).run({'uri': 'http://example.com'})
+        core.Search(pyramid_request).run({'uri': 'http://example.com'})
+
+        assert pyramid_request.es.conn.search.call_count == 2
+
+    def test_it_does_not_cache_searches_without_a_uri(self, pyramid_request):
+        core.Search(pyramid_request).run({'group': '__world__'})
+        core.Search(pyramid_request).run({'group': '__world__'})
+
+        assert pyramid_request.es.conn.search.call_count == 2
+
+    def test_it_does_not_cache_without_a_result_cache(self, pyramid_config, pyramid_request):
+        del pyramid_config.registry['search.result_cache']
+
+        core.Search(pyramid_request).run({'uri': 'http://example.com'})
+        core.Search(pyramid_request).run({'uri': 'http://example.com'})
+
+        assert pyramid_request.es.conn.search.call_count == 2
+
+    def test_it_tags_results_with_the_searched_uris(self, pyramid_request, result_cache):
+        core.Search(pyramid_request).run({'uri': 'http://example.com'})
+
+        result_cache.invalidate([uri.normalize('http://example.com')])
+        core.Search(pyramid_request).run({'uri': 'http://example.com'})
+
+        assert pyramid_request.es.conn.search.call_count == 2
+
+    def test_it_tags_results_with_the_other_uris_of_the_document(self,
+                                                                  pyramid_request,
+                                                                  result_cache,
+                                                                  storage):
+        storage.expand_uri.side_effect = lambda _, uri: [uri, 'http://example.com/alias']
+        core.Search(pyramid_request).run({'uri': 'http://example.com'})
+
+        result_cache.invalidate([uri.normalize('http://example.com/alias')])
+        core.Search(pyramid_request).run({'uri': 'http://example.com'})
+
+        assert pyramid_request.es.conn.search.call_count == 2
+
+    def test_it_does_not_cache_failed_searches(self, pyramid_request):
+        pyramid_request.es.conn.msearch.return_value = {'responses': [
+            {'error': 'boom'}, dummy_search_results(0)]}
+
+        core.Search(pyramid_request, separate_replies=True).run({'uri': 'http://example.com'})
+        core.Search(pyramid_request, separate_replies=True).run({'uri': 'http://example.com'})
+
+        assert pyramid_request.es.conn.msearch.call_count == 2
+
+    @pytest.fixture
+    def result_cache(self):
+        return ResultCache(ttl=60)
+
+    @pytest.fixture
+    def pyramid_request(self, pyramid_request):
+        pyramid_request.es.index = 'hypothesis'
+        pyramid_request.es.t.annotation = 'annotation'
+        return pyramid_request
+
+    @pytest.fixture(autouse=True)
+    def register_result_cache(self, pyramid_config, result_cache):
+        pyramid_config.registry['search.result_cache'] = result_cache
+
+    @pytest.fixture
+    def storage(self, patch):
+        storage = patch('h.search.query.storage')
+        storage.expand_uri.side_effect = lambda _, uri: [uri]
+        return storage
 
 
 # @search_fixtures
@@ -295,6 +556,7 @@ def dummy_search_results(start=1, count=0, name='annotation'):
         out['hits']['hits'].append({
             '_id': 'id_{}'.format(i),
             '_source': {'name': '{}_{}'.format(name, i)},
+            'sort': [i, 'id_{}'.format(i)],
         })
 
     return out
@@ -306,8 +568,3 @@ def pyramid_request(pyramid_request):
     pyramid_request.es = mock.Mock(spec_set=['conn', 'index', 't'])
     pyramid_request.es.conn.search.return_value = dummy_search_results(0)
     return pyramid_request
-
-
-@pytest.fixture
-def log(patch):
-    return patch('h.search.core.log')
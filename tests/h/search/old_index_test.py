@@ -8,6 +8,8 @@ replaced by new tests in index_test.py.
 """
 from __future__ import unicode_literals
 
+import datetime
+
 import mock
 import pytest
 
@@ -16,15 +18,23 @@ from h.search import client
 from h.search import index
 
 
-@pytest.mark.usefixtures('presenters')
+@pytest.mark.usefixtures('presenters', 'fetch_thread_ids')
 class TestIndexAnnotation:
 
     def test_it_presents_the_annotation(self, es, presenters, pyramid_request):
-        annotation = mock.Mock()
+        annotation = mock.Mock(id='test_annotation_id')
+
+        index.index(es, annotation, pyramid_request)
+
+        presenters.AnnotationSearchIndexPresenter.assert_called_once_with(
+            annotation, thread_ids=['reply_id'])
+
+    def test_it_fetches_the_thread_ids(self, es, fetch_thread_ids, pyramid_request):
+        annotation = mock.Mock(id='test_annotation_id')
 
         index.index(es, annotation, pyramid_request)
 
-        presenters.AnnotationSearchIndexPresenter.assert_called_once_with(annotation)
+        fetch_thread_ids.assert_called_once_with(pyramid_request.db, ['test_annotation_id'])
 
     def test_it_creates_an_annotation_before_save_event(self,
                                                         AnnotationTransformEvent,
@@ -79,6 +89,13 @@ class TestIndexAnnotation:
         }
         return presenters
 
+    @pytest.fixture
+    def fetch_thread_ids(self, patch):
+        fetch_thread_ids = patch('h.search.index.storage.fetch_thread_ids')
+        fetch_thread_ids.side_effect = lambda session, ids: {
+            id_: ['reply_id'] for id_ in ids}
+        return fetch_thread_ids
+
 
 class TestDeleteAnnotation:
 
@@ -143,6 +160,94 @@ class TestBatchIndexer(object):
             indexer.es_client.conn, matchers.IterableWith([ann_2]),
             chunk_size=mock.ANY, raise_on_error=False, expand_action_callback=mock.ANY)
 
+    def test_index_passes_chunk_size_to_es(self, db_session, es, pyramid_request, streaming_bulk, factories):
+        indexer = index.BatchIndexer(db_session, es, pyramid_request, chunk_size=500)
+
+        indexer.index()
+
+        _, kwargs = streaming_bulk.call_args
+        assert kwargs['chunk_size'] == 500
+
+    def test_index_sends_bulk_requests_from_writer_threads(self, db_session, es, pyramid_request, patch, factories):
+        pipelined_bulk = patch('h.search.index.bulk.pipelined_bulk')
+        pipelined_bulk.return_value = []
+        indexer = index.BatchIndexer(db_session, es, pyramid_request, writers=3)
+
+        indexer.index()
+
+        _, kwargs = pipelined_bulk.call_args
+        assert kwargs['writers'] == 3
+
+    def test_index_window_indexes_annotations_updated_within_window(self, db_session, indexer, matchers, streaming_bulk, factories):
+        factories.Annotation(updated=datetime.datetime(2018, 1, 1))
+        inside = [factories.Annotation(updated=datetime.datetime(2018, 2, 1)),
+                  factories.Annotation(updated=datetime.datetime(2018, 2, 15))]
+        factories.Annotation(updated=datetime.datetime(2018, 3, 1))
+
+        indexer.index_window(index.Window(datetime.datetime(2018, 2, 1),
+                                          datetime.datetime(2018, 3, 1)))
+
+        streaming_bulk.assert_called_once_with(
+            indexer.es_client.conn, matchers.IterableWith(matchers.UnorderedList(inside)),
+            chunk_size=mock.ANY, raise_on_error=False, expand_action_callback=mock.ANY)
+
+    def test_index_window_is_unbounded_above_without_end(self, db_session, indexer, matchers, streaming_bulk, factories):
+        factories.Annotation(updated=datetime.datetime(2018, 1, 1))
+        later = factories.Annotation(updated=datetime.datetime(2018, 3, 1))
+        factories.Annotation(updated=datetime.datetime(2018, 3, 2), deleted=True)
+
+        indexer.index_window(index.Window(datetime.datetime(2018, 2, 1), None))
+
+        streaming_bulk.assert_called_once_with(
+            indexer.es_client.conn, matchers.IterableWith([later]),
+            chunk_size=mock.ANY, raise_on_error=False, expand_action_callback=mock.ANY)
+
+    def test_index_presents_thread_ids(self, db_session, indexer, streaming_bulk, factories):
+        root = factories.Annotation()
+        replies = [factories.Annotation(references=[root.id]),
+                   factories.Annotation(references=[root.id])]
+        db_session.flush()
+        results = {}
+
+        def fake_streaming_bulk(*args, **kwargs):
+            callback = kwargs.get('expand_action_callback')
+            for ann in args[1]:
+                results[ann.id] = callback(ann)[1]
+            return set()
+
+        streaming_bulk.side_effect = fake_streaming_bulk
+
+        indexer.index()
+
+        assert sorted(results[root.id]['thread_ids']) == sorted(r.id for r in replies)
+        assert results[replies[0].id]['thread_ids'] == []
+
+    def test_index_fetches_thread_ids_a_chunk_at_a_time(self, db_session, es, pyramid_request, streaming_bulk, factories, patch):
+        fetch_thread_ids = patch('h.search.index.storage.fetch_thread_ids')
+        fetch_thread_ids.side_effect = lambda session, ids: {id_: [] for id_ in ids}
+        factories.Annotation.create_batch(5)
+        indexer = index.BatchIndexer(db_session, es, pyramid_request, chunk_size=2)
+
+        def fake_streaming_bulk(*args, **kwargs):
+            callback = kwargs.get('expand_action_callback')
+            for ann in args[1]:
+                callback(ann)
+            return set()
+
+        streaming_bulk.side_effect = fake_streaming_bulk
+
+        indexer.index()
+
+        assert [len(ids) for (_, ids), _ in fetch_thread_ids.call_args_list] == [2, 2, 1]
+
+    def test_index_counts_indexed_annotations(self, db_session, indexer, streaming_bulk, factories):
+        streaming_bulk.return_value = [(True, {'index': {'_id': 'a'}}),
+                                       (False, {'index': {'_id': 'b', 'error': 'oops'}})]
+
+        indexer.index()
+
+        assert indexer.indexed == 2
+
     def test_index_correctly_presents_bulk_actions(self,
                                                    db_session,
                                                    indexer,
@@ -295,6 +400,111 @@ class TestBatchIndexer(object):
         result = indexer.index()
         assert len(result) == 0
 
+    def test_export_window_presents_annotations_like_index_window(self,
+                                                                   db_session,
+                                                                   indexer,
+                                                                   streaming_bulk,
+                                                                   factories):
+        document = factories.Document(title='The Title', web_uri='http://example.com/')
+        root = factories.Annotation(document=document, tags=['foo', 'bar'])
+        factories.Annotation(document=document, references=[root.id])
+        db_session.flush()
+        window = index.Window(datetime.datetime(1970, 1, 1), None)
+
+        indexed = self._bulk_actions(streaming_bulk, indexer.index_window, window)
+        exported = self._bulk_actions(streaming_bulk, indexer.export_window, window)
+
+        assert exported == indexed
+        assert len(exported) == 2
+
+    def test_export_window_exports_annotations_updated_within_window(self, db_session, indexer, streaming_bulk, factories):
+        factories.Annotation(updated=datetime.datetime(2018, 1, 1))
+        inside = [factories.Annotation(updated=datetime.datetime(2018, 2, 1)),
+                  factories.Annotation(updated=datetime.datetime(2018, 2, 15))]
+        factories.Annotation(updated=datetime.datetime(2018, 2, 20), deleted=True)
+        factories.Annotation(updated=datetime.datetime(2018, 3, 1))
+        db_session.flush()
+
+        actions = self._bulk_actions(streaming_bulk, indexer.export_window,
+                                     index.Window(datetime.datetime(2018, 2, 1),
+                                                  datetime.datetime(2018, 3, 1)))
+
+        assert sorted(data['id'] for _, data in actions) == sorted(a.id for a in inside)
+
+    def test_export_window_sets_op_type(self, db_session, es, pyramid_request, streaming_bulk, factories):
+        indexer = index.BatchIndexer(db_session, es, pyramid_request, op_type='create')
+        annotation = factories.Annotation()
+        db_session.flush()
+
+        actions = self._bulk_actions(streaming_bulk, indexer.export_window,
+                                     index.Window(datetime.datetime(1970, 1, 1), None))
+
+        assert actions[0][0] == {'create': {'_type': indexer.es_client.t.annotation,
+                                            '_index': 'hypothesis',
+                                            '_id': annotation.id}}
+
+    def test_export_window_notifies_a_batch_transform_event_per_chunk(self,
+                                                                      db_session,
+                                                                      es,
+                                                                      pyramid_request,
+                                                                      pyramid_config,
+                                                                      streaming_bulk,
+                                                                      factories):
+        indexer = index.BatchIndexer(db_session, es, pyramid_request, chunk_size=2)
+        factories.Annotation.create_batch(3)
+        db_session.flush()
+        batches = []
+
+        def transform(event):
+            batches.append(len(event.annotation_dicts))
+            for data in event.annotation_dicts:
+                data['transformed'] = True
+
+        pyramid_config.add_subscriber(transform, 'h.events.AnnotationBatchTransformEvent')
+
+        actions = self._bulk_actions(streaming_bulk, indexer.export_window,
+                                     index.Window(datetime.datetime(1970, 1, 1), None))
+
+        assert batches == [2, 1]
+        assert all(data['transformed'] for _, data in actions)
+
+    def test_export_window_returns_failed_ids(self, db_session, indexer, streaming_bulk, factories):
+        streaming_bulk.return_value = [(True, {'index': {'_id': 'id-1'}}),
+                                       (False, {'index': {'_id': 'id-2', 'error': 'oops'}})]
+
+        result = indexer.export_window(index.Window(datetime.datetime(1970, 1, 1), None))
+
+        assert result == {'id-2'}
+
+    def _bulk_actions(self, streaming_bulk, method, window):
+        actions = []
+
+        def fake_streaming_bulk(*args, **kwargs):
+            callback = kwargs.get('expand_action_callback')
+            actions.extend(callback(item) for item in args[1])
+            return []
+
+        streaming_bulk.side_effect = fake_streaming_bulk
+        method(window)
+        return sorted(actions, key=lambda action: action[1]['id'])
+
+    def test_delete_marks_annotations_deleted(self, indexer, streaming_bulk):
+        streaming_bulk.return_value = []
+
+        indexer.delete(['id-1', 'id-2'])
+
+        args, kwargs = streaming_bulk.call_args
+        assert list(args[1]) == [
+            {'_op_type': 'index', '_index': 'hypothesis', '_type': 'annotation',
+             '_id': id_, '_source': {'deleted': True}}
+            for id_ in ['id-1', 'id-2']]
+
+    def test_delete_returns_failed_ids(self, indexer, streaming_bulk):
+        streaming_bulk.return_value = [(True, {'index': {'_id': 'id-1'}}),
+                                       (False, {'index': {'_id': 'id-2', 'error': 'oops'}})]
+
+        assert indexer.delete(['id-1', 'id-2']) == {'id-2'}
+
     @pytest.fixture
     def indexer(self, db_session, es, pyramid_request):
         return index.BatchIndexer(db_session, es, pyramid_request)
@@ -308,6 +518,20 @@ class TestBatchIndexer(object):
         return patch('h.search.index.es_helpers.streaming_bulk')
 
 
+class TestAnnotationWindows(object):
+    def test_it_splits_annotations_by_updated_time(self, db_session, factories):
+        times = [datetime.datetime(2018, 1, d) for d in range(1, 6)]
+        for t in times:
+            factories.Annotation(updated=t)
+        factories.Annotation(updated=datetime.datetime(2017, 1, 1), deleted=True)
+
+        windows = index.annotation_windows(db_session, windowsize=2)
+
+        assert windows == [index.Window(times[0], times[2]),
+                           index.Window(times[2], times[4]),
+                           index.Window(times[4], None)]
+
+
 @pytest.fixture
 def es():
     mock_es = mock.create_autospec(client.Client, instance=True, spec_set=True,
@@ -1,12 +1,15 @@
 # -*- coding: utf-8 -*-
 
 from __future__ import unicode_literals
+import base64
+
 import mock
 import pytest
 from hypothesis import strategies as st
 from hypothesis import given
 from webob import multidict
 
+from h.schemas import ValidationError
 from h.search import query
 
 MISSING = object()
@@ -92,6 +95,14 @@ class TestBuilder(object):
         assert len(sort) == 1
         assert list(sort[0].keys()) == ["updated"]
 
+    def test_sort_breaks_ties_by_id_when_a_cursor_is_requested(self):
+        builder = query.Builder()
+
+        q = builder.build({"cursor": ""})
+
+        assert q["sort"] == [{'updated': {'ignore_unmapped': True, 'order': 'desc'}},
+                             {'id': {'ignore_unmapped': True, 'order': 'desc'}}]
+
     def test_sort_includes_ignore_unmapped(self):
         """'ignore_unmapped': True is used in the sort clause."""
         builder = query.Builder()
@@ -108,6 +119,84 @@ class TestBuilder(object):
 
         assert q["sort"] == [{'title': {'ignore_unmapped': True, 'order': 'desc'}}]
 
+    def test_cursor_round_trips(self):
+        builder = query.Builder()
+        body = builder.build({"limit": 2, "order": "asc", "cursor": ""})
+        hits = [{'_id': 'a', 'sort': [1000, 'a']},
+                {'_id': 'b', 'sort': [2000, 'b']}]
+
+        cursor = query.next_cursor(body, hits)
+
+        assert query.extract_cursor({'cursor': cursor}) == {
+            'field': 'updated', 'order': 'asc', 'value': 2000, 'id': 'b'}
+
+    def test_no_cursor_unless_one_was_requested(self):
+        builder = query.Builder()
+        body = builder.build({"limit": 1})
+
+        assert query.next_cursor(body, [{'_id': 'a', 'sort': [1000]}]) is None
+
+    def test_no_cursor_after_the_last_page(self):
+        builder = query.Builder()
+        body = builder.build({"limit": 2, "cursor": ""})
+
+        assert query.next_cursor(body, [{'_id': 'a', 'sort': [1000, 'a']}]) is None
+        assert query.next_cursor(body, []) is None
+
+    @pytest.mark.parametrize('order,op', [('desc', 'lt'), ('asc', 'gt')])
+    def test_cursor_filters_out_earlier_pages(self, order, op):
+        builder = query.Builder()
+        cursor = self.cursor(order=order)
+
+        q = builder.build({"cursor": cursor})
+
+        assert q["query"]["filtered"]["filter"]["and"] == [{'or': [
+            {'range': {'created': {op: 1000}}},
+            {'and': [
+                {'term': {'created': 1000}},
+                {'range': {'id': {op: 'abc'}}},
+            ]},
+        ]}]
+
+    def test_cursor_replaces_sort_and_offset(self):
+        builder = query.Builder()
+
+        q = builder.build({"cursor": self.cursor(), "sort": "title", "offset": 40})
+
+        assert q["from"] == 0
+        assert q["sort"] == [{'created': {'ignore_unmapped': True, 'order': 'desc'}},
+                             {'id': {'ignore_unmapped': True, 'order': 'desc'}}]
+
+    def test_empty_cursor_starts_from_the_first_page(self):
+        builder = query.Builder()
+
+        q = builder.build({"cursor": ""})
+
+        assert q["query"] == {"match_all": {}}
+
+    @pytest.mark.parametrize('cursor', [
+        'not a cursor',
+        '!!!!',
+        base64.urlsafe_b64encode(b'{"not": "a list"}').decode('ascii'),
+        base64.urlsafe_b64encode(b'["created", "sideways", 1000, "abc"]').decode('ascii'),
+        base64.urlsafe_b64encode(b'[{}, "desc", 1000, "abc"]').decode('ascii'),
+        base64.urlsafe_b64encode(b'["created", "desc", {"gt": 1}, "abc"]').decode('ascii'),
+        base64.urlsafe_b64encode(b'["created", "desc", [1000], "abc"]').decode('ascii'),
+        base64.urlsafe_b64encode(b'["created", "desc", null, "abc"]').decode('ascii'),
+        base64.urlsafe_b64encode(b'["created", "desc", true, "abc"]').decode('ascii'),
+    ])
+    def test_invalid_cursor_raises(self, cursor):
+        builder = query.Builder()
+
+        with pytest.raises(ValidationError):
+            builder.build({"cursor": cursor})
+
+    def cursor(self, order='desc'):
+        body = {'size': 1,
+                'sort': [{'created': {'ignore_unmapped': True, 'order': order}},
+                         {'id': {'ignore_unmapped': True, 'order': order}}]}
+        return query.next_cursor(body, [{'_id': 'abc', 'sort': [1000, 'abc']}])
+
     def test_order_defaults_to_desc(self):
         """'order': "desc" is returned in the q dict by default."""
         builder = query.Builder()
@@ -406,7 +495,7 @@ class TestUriFilter(object):
     @pytest.fixture
     def uri(self, patch):
         uri = patch('h.search.query.uri')
-        uri.normalize.side_effect = lambda x: x
+        uri.normalize_many.side_effect = lambda xs: list(xs)
         return uri
 
 
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import mock
+import pytest
+
+from h.search.result_cache import ResultCache
+
+
+class TestResultCache(object):
+    def test_get_returns_cached_response(self, cache):
+        cache.set({'method': 'search', 'body': {'size': 20}}, {'hits': {}})
+
+        assert cache.get({'method': 'search', 'body': {'size': 20}}) == {'hits': {}}
+
+    def test_get_returns_none_for_a_different_request(self, cache):
+        cache.set({'method': 'search', 'body': {'size': 20}}, {'hits': {}})
+
+        assert cache.get({'method': 'search', 'body': {'size': 10}}) is None
+
+    def test_get_returns_none_once_the_response_expires(self, cache, clock):
+        cache.set({'method': 'search'}, {'hits': {}})
+        clock.return_value = 60
+
+        assert cache.get({'method': 'search'}) is None
+
+    def test_invalidate_discards_responses_for_the_uris(self, cache):
+        cache.set({'body': 1}, 'one', uris=['http://example.com'])
+        cache.set({'body': 2}, 'two', uris=['http://example.org'])
+        cache.set({'body': 3}, 'three')
+
+        cache.invalidate(['http://example.com'])
+
+        assert [cache.get({'body': b}) for b in (1, 2, 3)] == [None, 'two', 'three']
+
+    def test_set_does_not_cache_responses_for_recently_changed_uris(self, cache, clock):
+        cache.invalidate(['http://example.com'])
+
+        cache.set({'body': 1}, 'one', uris=['http://example.com'])
+
+        assert cache.get({'body': 1}) is None
+
+    def test_set_caches_responses_for_changed_uris_again_after_ttl(self, cache, clock):
+        cache.invalidate(['http://example.com'])
+        clock.return_value = 60
+
+        cache.set({'body': 1}, 'one', uris=['http://example.com'])
+
+        assert cache.get({'body': 1}) == 'one'
+
+    @pytest.fixture
+    def clock(self):
+        return mock.Mock(spec_set=[], return_value=0)
+
+    @pytest.fixture
+    def cache(self, clock):
+        return ResultCache(ttl=60, clock=clock)
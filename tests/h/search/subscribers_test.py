@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import mock
+import pytest
+
+from h.events import AnnotationEvent
+from h.search import subscribers
+from h.search.result_cache import ResultCache
+
+
+@pytest.mark.usefixtures('fetch_annotation')
+class TestInvalidateResultCache(object):
+    def test_it_invalidates_the_annotations_uri(self, pyramid_request, result_cache):
+        event = AnnotationEvent(pyramid_request, 'test_annotation_id', 'create')
+
+        subscribers.invalidate_result_cache(event)
+
+        result_cache.invalidate.assert_called_once_with(['http://example.com/normalized'])
+
+    def test_it_does_nothing_if_the_annotation_is_missing(self, pyramid_request, result_cache, fetch_annotation):
+        fetch_annotation.return_value = None
+        event = AnnotationEvent(pyramid_request, 'test_annotation_id', 'delete')
+
+        subscribers.invalidate_result_cache(event)
+
+        assert not result_cache.invalidate.called
+
+    def test_it_does_nothing_without_a_result_cache(self, pyramid_request, fetch_annotation):
+        event = AnnotationEvent(pyramid_request, 'test_annotation_id', 'update')
+
+        subscribers.invalidate_result_cache(event)
+
+        assert not fetch_annotation.called
+
+    @pytest.fixture
+    def result_cache(self, pyramid_config):
+        result_cache = mock.create_autospec(ResultCache, instance=True, spec_set=True)
+        pyramid_config.registry['search.result_cache'] = result_cache
+        return result_cache
+
+    @pytest.fixture
+    def fetch_annotation(self, patch):
+        fetch_annotation = patch('h.search.subscribers.storage.fetch_annotation')
+        fetch_annotation.return_value = mock.Mock(
+            target_uri_normalized='http://example.com/normalized')
+        return fetch_annotation
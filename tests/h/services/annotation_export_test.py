@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import datetime
+
+import mock
+import pytest
+
+from h.services import annotation_export
+from h.services.annotation_export import AnnotationExportService
+from h.services.annotation_export import annotation_export_factory
+
+
+class TestAnnotationExportService(object):
+    def test_it_exports_shared_annotations_in_readable_groups(self, svc, factories):
+        expected = [factories.Annotation(shared=True, groupid='__world__'),
+                    factories.Annotation(shared=True, groupid='readable')]
+        factories.Annotation(shared=True, groupid='unreadable')
+
+        assert set(svc.export(10)) == set(a.id for a in expected)
+
+    def test_it_exports_the_users_private_annotations(self, svc, factories, user):
+        own = factories.Annotation(shared=False, userid=user.userid)
+        factories.Annotation(shared=False)
+
+        assert list(svc.export(10)) == [own.id]
+
+    def test_it_skips_deleted_annotations(self, svc, factories):
+        factories.Annotation(shared=True, deleted=True)
+
+        assert list(svc.export(10)) == []
+
+    def test_it_skips_nipsad_annotations(self, svc, factories, nipsa_service):
+        factories.Annotation(shared=True, userid='acct:nipsad@example.com')
+        nipsa_service.flagged_userids = frozenset(['acct:nipsad@example.com'])
+
+        assert list(svc.export(10)) == []
+
+    def test_it_exports_the_users_own_annotations_if_nipsad(self, svc, factories, nipsa_service, user):
+        own = factories.Annotation(shared=True, userid=user.userid)
+        nipsa_service.flagged_userids = frozenset([user.userid])
+
+        assert list(svc.export(10)) == [own.id]
+
+    def test_it_exports_nipsad_annotations_in_groups_the_user_created(self,
+                                                                      svc,
+                                                                      factories,
+                                                                      group_service,
+                                                                      nipsa_service):
+        annotation = factories.Annotation(shared=True,
+                                          groupid='readable',
+                                          userid='acct:nipsad@example.com')
+        nipsa_service.flagged_userids = frozenset(['acct:nipsad@example.com'])
+        group_service.groupids_created_by.return_value = ['readable']
+
+        assert list(svc.export(10)) == [annotation.id]
+
+    def test_it_exports_nipsad_annotations_with_replies(self, svc, factories, nipsa_service):
+        annotation = factories.Annotation(shared=True, userid='acct:nipsad@example.com',
+                                          updated=self.time(0))
+        reply = factories.Annotation(shared=True, references=[annotation.id],
+                                     updated=self.time(1))
+        nipsa_service.flagged_userids = frozenset(['acct:nipsad@example.com'])
+
+        assert list(svc.export(10)) == [annotation.id, reply.id]
+
+    def test_it_skips_moderated_annotations(self, svc, factories):
+        annotation = factories.Annotation(shared=True)
+        factories.AnnotationModeration(annotation=annotation)
+
+        assert list(svc.export(10)) == []
+
+    def test_it_exports_the_users_own_moderated_annotations(self, svc, factories, user):
+        own = factories.Annotation(shared=True, userid=user.userid)
+        factories.AnnotationModeration(annotation=own)
+
+        assert list(svc.export(10)) == [own.id]
+
+    def test_it_exports_moderated_annotations_in_groups_the_user_created(self,
+                                                                         svc,
+                                                                         factories,
+                                                                         group_service):
+        annotation = factories.Annotation(shared=True, groupid='readable')
+        factories.AnnotationModeration(annotation=annotation)
+        group_service.groupids_created_by.return_value = ['readable']
+
+        assert list(svc.export(10)) == [annotation.id]
+
+    def test_it_exports_moderated_annotations_with_replies(self, svc, factories):
+        annotation = factories.Annotation(shared=True, updated=self.time(0))
+        factories.AnnotationModeration(annotation=annotation)
+        reply = factories.Annotation(shared=True, references=[annotation.id],
+                                     updated=self.time(1))
+
+        assert list(svc.export(10)) == [annotation.id, reply.id]
+
+    def test_it_filters_by_group(self, svc, factories):
+        annotation = factories.Annotation(shared=True, groupid='readable')
+        factories.Annotation(shared=True, groupid='__world__')
+
+        assert list(svc.export(10, group='readable')) == [annotation.id]
+
+    def test_it_filters_by_user(self, svc, factories):
+        annotation = factories.Annotation(shared=True, userid='acct:amy@example.com')
+        factories.Annotation(shared=True, userid='acct:bob@example.com')
+
+        assert list(svc.export(10, userid='acct:amy@example.com')) == [annotation.id]
+
+    def test_it_filters_by_uri(self, svc, factories):
+        annotation = factories.Annotation(shared=True, target_uri='http://example.com/a')
+        factories.Annotation(shared=True, target_uri='http://example.com/b')
+
+        assert list(svc.export(10, uri='http://example.com/a')) == [annotation.id]
+
+    def test_it_exports_least_recently_updated_first(self, svc, factories):
+        annotations = [factories.Annotation(shared=True, updated=self.time(minutes))
+                       for minutes in [2, 0, 1]]
+
+        result = list(svc.export(10))
+
+        assert result == [annotations[1].id, annotations[2].id, annotations[0].id]
+
+    def test_it_exports_up_to_limit_annotations(self, svc, factories):
+        annotations = [factories.Annotation(shared=True, updated=self.time(minutes))
+                       for minutes in range(3)]
+
+        assert list(svc.export(2)) == [a.id for a in annotations[:2]]
+
+    def test_it_exports_annotations_updated_since(self, svc, factories):
+        annotations = [factories.Annotation(shared=True, updated=self.time(minutes))
+                       for minutes in range(3)]
+
+        result = list(svc.export(10, since=self.time(1)))
+
+        assert result == [a.id for a in annotations[1:]]
+
+    def test_it_resumes_after_an_annotation(self, svc, factories):
+        for _ in range(3):
+            factories.Annotation(shared=True, updated=self.time(1))
+        factories.Annotation(shared=True, updated=self.time(0))
+        exported = list(svc.export(10, since=self.time(1)))
+
+        result = list(svc.export(10, since=self.time(1), after=exported[0]))
+
+        assert result == exported[1:]
+
+    def test_it_presents_annotations_in_batches(self,
+                                                monkeypatch,
+                                                svc,
+                                                factories,
+                                                presentation_service):
+        monkeypatch.setattr(annotation_export, 'BATCH_SIZE', 2)
+        for minutes in range(3):
+            factories.Annotation(shared=True, updated=self.time(minutes))
+
+        list(svc.export(10))
+
+        batch_sizes = [len(args[0]) for args, _ in
+                       presentation_service.present_annotations.call_args_list]
+        assert batch_sizes == [2, 1]
+
+    def time(self, minutes):
+        return datetime.datetime(2018, 1, 1) + datetime.timedelta(minutes=minutes)
+
+    @pytest.fixture
+    def svc(self, db_session, user, group_service, nipsa_service, presentation_service):
+        return AnnotationExportService(db_session, user, group_service, nipsa_service,
+                                       presentation_service)
+
+
+@pytest.mark.usefixtures('group_service', 'nipsa_service', 'presentation_service')
+class TestAnnotationExportFactory(object):
+    def test_it_returns_service(self, pyramid_request):
+        svc = annotation_export_factory(None, pyramid_request)
+
+        assert isinstance(svc, AnnotationExportService)
+
+    def test_it_provides_the_services(self,
+                                      pyramid_request,
+                                      group_service,
+                                      nipsa_service,
+                                      presentation_service):
+        svc = annotation_export_factory(None, pyramid_request)
+
+        assert svc.session == pyramid_request.db
+        assert svc.user == pyramid_request.user
+        assert svc.group_service == group_service
+        assert svc.nipsa_service == nipsa_service
+        assert svc.presentation_service == presentation_service
+
+
+@pytest.fixture
+def user():
+    return mock.Mock(userid='acct:exporter@example.com')
+
+
+@pytest.fixture
+def group_service(pyramid_config):
+    service = mock.Mock(spec_set=['groupids_readable_by', 'groupids_created_by'])
+    service.groupids_readable_by.return_value = ['__world__', 'readable']
+    service.groupids_created_by.return_value = []
+    pyramid_config.register_service(service, name='group')
+    return service
+
+
+@pytest.fixture
+def nipsa_service(pyramid_config):
+    service = mock.Mock(spec_set=['flagged_userids'], flagged_userids=frozenset())
+    pyramid_config.register_service(service, name='nipsa')
+    return service
+
+
+@pytest.fixture
+def presentation_service(pyramid_config):
+    service = mock.Mock(spec_set=['present_annotations'])
+    service.present_annotations.side_effect = lambda annotations: [a.id for a in annotations]
+    pyramid_config.register_service(service, name='annotation_json_presentation')
+    return service
@@ -31,11 +31,45 @@ class TestAnnotationJSONPresentationService(object):
         svc = self.svc(services)
         assert formatters.AnnotationHiddenFormatter.return_value in svc.formatters
 
-    def test_initializes_moderation_formatter(self, services, formatters):
+    def test_initializes_moderation_formatter(self, matchers, services, formatters):
         self.svc(services)
         formatters.AnnotationModerationFormatter.assert_called_once_with(services['flag_count'],
                                                                          mock.sentinel.user,
-                                                                         mock.sentinel.has_permission)
+                                                                         matchers.AnyCallable())
+
+    def test_moderation_formatter_checks_permissions_once_per_group(self, services, formatters):
+        has_permission = mock.Mock(return_value=True)
+        self.svc(services, has_permission=has_permission)
+        _, _, check = formatters.AnnotationModerationFormatter.call_args[0]
+        group = mock.Mock(pubid='abc123')
+
+        assert check('admin', group) is True
+        assert check('admin', group) is True
+
+        has_permission.assert_called_once_with('admin', group)
+
+    def test_moderation_formatter_checks_permissions_on_other_contexts_every_time(self,
+                                                                                services,
+                                                                                formatters):
+        has_permission = mock.Mock(return_value=False)
+        self.svc(services, has_permission=has_permission)
+        _, _, check = formatters.AnnotationModerationFormatter.call_args[0]
+
+        check('admin', None)
+        check('admin', None)
+
+        assert has_permission.call_count == 2
+
+    def test_hidden_formatter_checks_permissions_once_per_group(self, services, formatters):
+        has_permission = mock.Mock(return_value=True)
+        self.svc(services, has_permission=has_permission)
+        _, moderator_check, _ = formatters.AnnotationHiddenFormatter.call_args[0]
+        group = mock.Mock(pubid='abc123')
+
+        moderator_check(group)
+        moderator_check(group)
+
+        has_permission.assert_called_once_with('admin', group)
 
     def test_it_configures_moderation_formatter(self, services, formatters):
         svc = self.svc(services)
@@ -86,7 +120,29 @@ class TestAnnotationJSONPresentationService(object):
 
         svc.present_all(['ann-1'])
 
-        traversal.AnnotationContext.assert_called_once_with(ann, svc.group_svc, svc.links_svc)
+        traversal.AnnotationContext.assert_called_once_with(ann, svc.group_svc, svc.links_svc,
+                                                            group_principals={})
+
+    def test_present_all_shares_group_principals_between_resources(self, svc, storage, traversal):
+        storage.fetch_ordered_annotations.return_value = [mock.Mock(), mock.Mock()]
+
+        svc.present_all(['ann-1', 'ann-2'])
+
+        first, second = traversal.AnnotationContext.call_args_list
+        assert first[1]['group_principals'] is second[1]['group_principals']
+
+    def test_present_all_forgets_permissions_checked_before(self, services, formatters,
+                                                            storage):
+        has_permission = mock.Mock(return_value=True)
+        svc = self.svc(services, has_permission=has_permission)
+        _, _, check = formatters.AnnotationModerationFormatter.call_args[0]
+        group = mock.Mock(pubid='abc123')
+
+        check('admin', group)
+        svc.present_all(['ann-1'])
+        check('admin', group)
+
+        assert has_permission.call_count == 2
 
     def test_present_all_presents_annotation_resources(self, svc, storage, traversal, present):
         storage.fetch_ordered_annotations.return_value = [mock.Mock()]
@@ -109,8 +165,26 @@ class TestAnnotationJSONPresentationService(object):
         result = svc.present_all(['ann-1'])
         assert result == [present.return_value]
 
+    def test_present_annotations_preloads_formatters_with_the_annotation_ids(self, svc):
+        formatter = mock.Mock(spec_set=['preload'])
+        svc.formatters = [formatter]
+
+        svc.present_annotations([mock.Mock(id='ann-1'), mock.Mock(id='ann-2')])
+
+        formatter.preload.assert_called_once_with(['ann-1', 'ann-2'])
+
+    def test_present_annotations_presents_annotation_resources(self, svc, traversal, present):
+        ann = mock.Mock()
+
+        result = svc.present_annotations([ann])
+
+        traversal.AnnotationContext.assert_called_once_with(ann, svc.group_svc, svc.links_svc,
+                                                            group_principals={})
+        present.assert_called_once_with(svc, traversal.AnnotationContext.return_value)
+        assert result == [present.return_value]
+
     @pytest.fixture
-    def svc(self, services, render_user_info=True):
+    def svc(self, services, render_user_info=True, has_permission=mock.sentinel.has_permission):
         return AnnotationJSONPresentationService(session=mock.sentinel.db_session,
                                                  user=mock.sentinel.user,
                                                  group_svc=services['group'],
@@ -119,7 +193,7 @@ class TestAnnotationJSONPresentationService(object):
                                                  flag_count_svc=services['flag_count'],
                                                  moderation_svc=services['annotation_moderation'],
                                                  user_svc=services['user'],
-                                                 has_permission=mock.sentinel.has_permission,
+                                                 has_permission=has_permission,
                                                  render_user_info=render_user_info)
 
     @pytest.fixture
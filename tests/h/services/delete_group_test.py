@@ -25,6 +25,13 @@ class TestDeleteGroupService(object):
 
         assert group in db_session.deleted
 
+    def test_delete_invalidates_cached_groupids(self, svc, factories):
+        group = factories.Group()
+
+        svc.delete(group)
+
+        svc.cache.clear.assert_called_once_with()
+
     def test_delete_deletes_annotations(self, svc, factories, storage, pyramid_request):
         group = factories.Group()
         annotations = [factories.Annotation(groupid=group.pubid),
@@ -55,7 +62,8 @@ class TestDeleteGroupService(object):
 
 
 @pytest.fixture
-def svc(db_session, pyramid_request):
+def svc(db_session, pyramid_request, patch):
+    patch('h.services.delete_group.groupids_cache')
     pyramid_request.db = db_session
     return delete_group_service_factory({}, pyramid_request)
 
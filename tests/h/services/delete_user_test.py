@@ -77,8 +77,16 @@ class TestDeleteUserService(object):
 
         assert group not in db_session.deleted
 
+    def test_delete_invalidates_cached_groupids(self, factories, svc):
+        user = factories.User()
+
+        svc.delete(user)
+
+        svc.cache.clear.assert_called_once_with()
+
     @pytest.fixture
-    def svc(self, db_session, pyramid_request):
+    def svc(self, db_session, pyramid_request, patch):
+        patch('h.services.delete_user.groupids_cache')
         pyramid_request.db = db_session
         return delete_user_service_factory({}, pyramid_request)
 
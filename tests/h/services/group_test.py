@@ -4,12 +4,16 @@ from __future__ import unicode_literals
 
 import mock
 import pytest
+import transaction
 
 from h.models import Group, User, GroupScope
 from h.models.group import JoinableBy, ReadableBy, WriteableBy
+from h.services import group as group_module
 from h.services.group import GroupService
 from h.services.group import groups_factory
+from h.services.group import invalidate_cache
 from h.services.user import UserService
+from h.util.cache import LRUCache
 from tests.common.matchers import Matcher
 
 
@@ -485,6 +489,140 @@ class TestGroupServiceGroupIds(object):
     def test_created_by_returns_empty_list_for_missing_user(self, svc):
         assert svc.groupids_created_by(None) == []
 
+    def test_readable_by_is_cached_for_missing_user(self, svc, db_session, factories):
+        svc.groupids_readable_by(None)
+
+        group = factories.Group(readable_by=ReadableBy.world)
+        db_session.flush()
+
+        assert group.pubid not in svc.groupids_readable_by(None)
+
+    def test_readable_by_queries_once_per_transaction_for_users(self, svc, db_session, factories):
+        user = factories.User()
+        db_session.flush()
+
+        with mock.patch.object(db_session, 'query', wraps=db_session.query) as query:
+            first = svc.groupids_readable_by(user)
+            second = svc.groupids_readable_by(user)
+
+        assert query.call_count == 1
+        assert first == second
+
+    def test_readable_by_is_cached_for_users_until_the_transaction_ends(self, svc, db_session, factories):
+        user = factories.User()
+        db_session.flush()
+        svc.groupids_readable_by(user)
+
+        group = factories.Group(readable_by=ReadableBy.members)
+        group.members.append(user)
+        db_session.flush()
+
+        assert group.pubid not in svc.groupids_readable_by(user)
+
+    def test_created_by_is_cached(self, svc, db_session, factories):
+        user = factories.User()
+        db_session.flush()
+        svc.groupids_created_by(user)
+
+        group = factories.Group(creator=user)
+        db_session.flush()
+
+        assert group.pubid not in svc.groupids_created_by(user)
+
+    def test_member_join_updates_readable_by(self, svc, db_session, factories):
+        user = factories.User()
+        group = factories.Group(readable_by=ReadableBy.members)
+        db_session.flush()
+        svc.groupids_readable_by(user)
+
+        svc.member_join(group, user.userid)
+        db_session.flush()
+
+        assert group.pubid in svc.groupids_readable_by(user)
+
+    def test_member_leave_updates_readable_by(self, svc, db_session, factories):
+        user = factories.User()
+        group = factories.Group(readable_by=ReadableBy.members)
+        group.members.append(user)
+        db_session.flush()
+        svc.groupids_readable_by(user)
+
+        svc.member_leave(group, user.userid)
+        db_session.flush()
+
+        assert group.pubid not in svc.groupids_readable_by(user)
+
+    def test_creating_a_group_updates_readable_by(self, svc, db_session, creator, origins):
+        svc.groupids_readable_by(None)
+
+        group = svc.create_open_group('Anteater fans', creator.userid, origins=origins)
+        db_session.flush()
+
+        assert group.pubid in svc.groupids_readable_by(None)
+
+    def test_creating_a_group_updates_readable_by_for_users(self, svc, db_session, creator):
+        svc.groupids_readable_by(creator)
+
+        group = svc.create_private_group('Anteater fans', creator.userid)
+        db_session.flush()
+
+        assert group.pubid in svc.groupids_readable_by(creator)
+
+    def test_creating_a_group_updates_created_by(self, svc, db_session, creator):
+        svc.groupids_created_by(creator)
+
+        group = svc.create_private_group('Anteater fans', creator.userid)
+
+        assert group.pubid in svc.groupids_created_by(creator)
+
+    def test_creating_a_group_invalidates_the_cache_after_commit(self,
+                                                                 db_session,
+                                                                 usr_svc,
+                                                                 publish,
+                                                                 creator,
+                                                                 invalidate_cache):
+        tm = mock.sentinel.tm
+        svc = GroupService(db_session, usr_svc, publish=publish, cache=LRUCache(),
+                           transaction_manager=tm)
+
+        svc.create_private_group('Anteater fans', creator.userid)
+
+        invalidate_cache.assert_called_once_with(svc.cache, tm)
+
+    @pytest.fixture
+    def invalidate_cache(self, patch):
+        return patch('h.services.group.invalidate_cache')
+
+
+class TestInvalidateCache(object):
+    def test_it_clears_the_cache(self, cache):
+        cache.set(('readable', None), ('abc',))
+
+        invalidate_cache(cache)
+
+        assert len(cache) == 0
+
+    def test_it_clears_the_cache_again_after_commit(self, cache):
+        tm = transaction.TransactionManager()
+        tm.begin()
+
+        invalidate_cache(cache, tm)
+        cache.set(('readable', None), ('stale',))
+        tm.commit()
+
+        assert len(cache) == 0
+
+    def test_it_clears_the_process_wide_cache_by_default(self):
+        group_module.CACHE.set(('readable', None), ('abc',))
+
+        invalidate_cache()
+
+        assert len(group_module.CACHE) == 0
+
+    @pytest.fixture
+    def cache(self):
+        return LRUCache()
+
 
 @pytest.mark.usefixtures('user_service')
 class TestGroupsFactory(object):
@@ -498,6 +636,18 @@ class TestGroupsFactory(object):
 
         assert svc.session == pyramid_request.db
 
+    def test_uses_process_wide_cache(self, pyramid_request):
+        svc = groups_factory(None, pyramid_request)
+
+        assert svc.cache is group_module.CACHE
+
+    def test_provides_request_transaction_manager(self, pyramid_request):
+        pyramid_request.tm = mock.sentinel.tm
+
+        svc = groups_factory(None, pyramid_request)
+
+        assert svc.transaction_manager == mock.sentinel.tm
+
     def test_wraps_user_service_as_user_fetcher(self, pyramid_request, user_service):
         svc = groups_factory(None, pyramid_request)
 
@@ -543,7 +693,7 @@ def publish():
 
 @pytest.fixture
 def svc(db_session, usr_svc, publish):
-    return GroupService(db_session, usr_svc, publish=publish)
+    return GroupService(db_session, usr_svc, publish=publish, cache=LRUCache())
 
 
 @pytest.fixture
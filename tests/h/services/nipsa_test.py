@@ -2,63 +2,83 @@
 
 from __future__ import unicode_literals
 
+import threading
+import time
+
+import mock
 import pytest
+import transaction
 
+from h.services import nipsa
+from h.services.nipsa import NipsaCache
 from h.services.nipsa import NipsaService
 from h.services.nipsa import nipsa_factory
 
 
 @pytest.mark.usefixtures('users', 'reindex_user_annotations')
 class TestNipsaService(object):
-    def test_flagged_userids_returns_set_of_userids(self, db_session):
-        svc = NipsaService(db_session)
-
+    def test_flagged_userids_returns_set_of_userids(self, svc):
         assert svc.flagged_userids == set(['acct:renata@example.com',
                                            'acct:cecilia@example.com'])
 
-    def test_is_flagged_returns_true_for_flagged_users(self, db_session, users):
-        svc = NipsaService(db_session)
-
+    def test_is_flagged_returns_true_for_flagged_users(self, svc):
         assert svc.is_flagged('acct:renata@example.com')
         assert svc.is_flagged('acct:cecilia@example.com')
 
-    def test_is_flagged_returns_false_for_unflagged_users(self, db_session):
-        svc = NipsaService(db_session)
-
+    def test_is_flagged_returns_false_for_unflagged_users(self, svc):
         assert not svc.is_flagged('acct:dominic@example.com')
         assert not svc.is_flagged('acct:romeo@example.com')
 
-    def test_flag_sets_nipsa_true(self, db_session, users):
-        svc = NipsaService(db_session)
-
+    def test_flag_sets_nipsa_true(self, svc, users):
         svc.flag(users['dominic'])
 
         assert users['dominic'].nipsa is True
 
-    def test_flag_triggers_reindex_job(self, db_session, users, reindex_user_annotations):
-        svc = NipsaService(db_session)
+    def test_flag_updates_cache(self, svc, users):
+        svc.flag(users['dominic'])
 
+        assert svc.is_flagged('acct:dominic@example.com')
+
+    def test_flag_publishes_change(self, svc, users, publish):
         svc.flag(users['dominic'])
 
-        reindex_user_annotations.delay.assert_called_once_with('acct:dominic@example.com')
+        publish.assert_called_once_with('acct:dominic@example.com', True)
 
-    def test_unflag_sets_nipsa_false(self, db_session, users):
-        svc = NipsaService(db_session)
+    def test_flag_triggers_reindex_job(self, svc, users, reindex_user_annotations):
+        svc.flag(users['dominic'])
+
+        reindex_user_annotations.delay.assert_called_once_with('acct:dominic@example.com')
 
+    def test_unflag_sets_nipsa_false(self, svc, users):
         svc.unflag(users['renata'])
 
         assert users['renata'].nipsa is False
 
-    def test_unflag_triggers_reindex_job(self, db_session, users, reindex_user_annotations):
-        svc = NipsaService(db_session)
+    def test_unflag_updates_cache(self, svc, users):
+        svc.unflag(users['renata'])
+
+        assert not svc.is_flagged('acct:renata@example.com')
+
+    def test_unflag_publishes_change(self, svc, users, publish):
+        svc.unflag(users['renata'])
 
+        publish.assert_called_once_with('acct:renata@example.com', False)
+
+    def test_unflag_triggers_reindex_job(self, svc, users, reindex_user_annotations):
         svc.unflag(users['renata'])
 
         reindex_user_annotations.delay.assert_called_once_with('acct:renata@example.com')
 
-    def test_clear_resets_cache(self, db_session, users):
-        svc = NipsaService(db_session)
+    def test_flagged_userids_are_shared_between_instances(self, db_session, cache, users):
+        svc = NipsaService(db_session, cache=cache)
+        assert not svc.is_flagged('acct:dominic@example.com')
+
+        users['dominic'].nipsa = True
+        other_svc = NipsaService(db_session, cache=cache)
+
+        assert not other_svc.is_flagged('acct:dominic@example.com')
 
+    def test_clear_resets_cache(self, svc, users):
         assert svc.flagged_userids == set(['acct:renata@example.com',
                                            'acct:cecilia@example.com'])
 
@@ -69,12 +89,173 @@ class TestNipsaService(object):
                                            'acct:cecilia@example.com',
                                            'acct:dominic@example.com'])
 
+    def test_defers_changes_until_the_transaction_commits(self,
+                                                          db_session,
+                                                          cache,
+                                                          publish,
+                                                          reindex_user_annotations,
+                                                          users):
+        tm = transaction.TransactionManager()
+        svc = NipsaService(db_session, cache=cache, publish=publish, transaction_manager=tm)
+        svc.flagged_userids
+
+        svc.flag(users['dominic'])
+
+        assert not svc.is_flagged('acct:dominic@example.com')
+        assert not publish.called
+        assert not reindex_user_annotations.delay.called
+
+        tm.commit()
+
+        assert svc.is_flagged('acct:dominic@example.com')
+        publish.assert_called_once_with('acct:dominic@example.com', True)
+        reindex_user_annotations.delay.assert_called_once_with('acct:dominic@example.com')
+
+    def test_discards_changes_if_the_transaction_aborts(self,
+                                                        db_session,
+                                                        cache,
+                                                        publish,
+                                                        reindex_user_annotations,
+                                                        users):
+        tm = transaction.TransactionManager()
+        svc = NipsaService(db_session, cache=cache, publish=publish, transaction_manager=tm)
+        svc.flagged_userids
+
+        svc.flag(users['dominic'])
+        tm.abort()
+        tm.commit()
+
+        assert not svc.is_flagged('acct:dominic@example.com')
+        assert not publish.called
+        assert not reindex_user_annotations.delay.called
+
+    def test_uses_process_wide_cache_by_default(self, db_session):
+        svc = NipsaService(db_session)
+
+        assert svc.cache is nipsa.CACHE
+
+    @pytest.fixture
+    def svc(self, db_session, cache, publish):
+        return NipsaService(db_session, cache=cache, publish=publish)
 
-def test_nipsa_factory(pyramid_request):
-    svc = nipsa_factory(None, pyramid_request)
+    @pytest.fixture
+    def publish(self):
+        return mock.Mock(spec_set=[])
 
-    assert isinstance(svc, NipsaService)
-    assert svc.session == pyramid_request.db
+
+@pytest.mark.usefixtures('users')
+class TestNipsaCache(object):
+    def test_get_loads_flagged_userids(self, cache, db_session):
+        assert cache.get(db_session) == frozenset(['acct:renata@example.com',
+                                                   'acct:cecilia@example.com'])
+
+    def test_get_does_not_reload_before_ttl(self, cache, clock, db_session, users):
+        cache.get(db_session)
+        users['dominic'].nipsa = True
+        clock.return_value = 59
+
+        assert 'acct:dominic@example.com' not in cache.get(db_session)
+
+    def test_get_reloads_after_ttl(self, cache, clock, db_session, users):
+        cache.get(db_session)
+        users['dominic'].nipsa = True
+        clock.return_value = 60
+
+        assert 'acct:dominic@example.com' in cache.get(db_session)
+
+    def test_get_loads_once_for_concurrent_callers(self, cache):
+        session = mock.Mock(spec_set=['query'])
+
+        def query(*args):
+            time.sleep(0.05)
+            return mock.Mock(filter_by=mock.Mock(return_value=[]))
+        session.query.side_effect = query
+
+        threads = [threading.Thread(target=cache.get, args=(session,)) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert session.query.call_count == 1
+
+    def test_update_adds_flagged_userid(self, cache, db_session):
+        cache.get(db_session)
+
+        cache.update('acct:dominic@example.com', True)
+
+        assert 'acct:dominic@example.com' in cache.get(db_session)
+
+    def test_update_removes_unflagged_userid(self, cache, db_session):
+        cache.get(db_session)
+
+        cache.update('acct:renata@example.com', False)
+
+        assert 'acct:renata@example.com' not in cache.get(db_session)
+
+    def test_update_does_not_modify_previously_returned_sets(self, cache, db_session):
+        userids = cache.get(db_session)
+
+        cache.update('acct:dominic@example.com', True)
+
+        assert 'acct:dominic@example.com' not in userids
+
+    def test_update_bumps_version(self, cache, db_session):
+        cache.get(db_session)
+        version = cache.version
+
+        cache.update('acct:dominic@example.com', True)
+
+        assert cache.version > version
+
+    def test_update_before_load_is_ignored(self, cache, db_session):
+        cache.update('acct:dominic@example.com', True)
+
+        assert 'acct:dominic@example.com' not in cache.get(db_session)
+
+    def test_invalidate_reloads_on_next_get(self, cache, db_session, users):
+        cache.get(db_session)
+        users['dominic'].nipsa = True
+
+        cache.invalidate()
+
+        assert 'acct:dominic@example.com' in cache.get(db_session)
+
+
+class TestNipsaFactory(object):
+    def test_it_returns_nipsa_service(self, pyramid_request):
+        svc = nipsa_factory(None, pyramid_request)
+
+        assert isinstance(svc, NipsaService)
+        assert svc.session == pyramid_request.db
+
+    def test_it_defers_changes_until_the_request_transaction_commits(self, pyramid_request):
+        pyramid_request.tm = mock.sentinel.tm
+
+        svc = nipsa_factory(None, pyramid_request)
+
+        assert svc.transaction_manager == mock.sentinel.tm
+
+    def test_it_publishes_changes_to_realtime(self, pyramid_request):
+        pyramid_request.realtime = mock.Mock(spec_set=['publish_nipsa'])
+        svc = nipsa_factory(None, pyramid_request)
+
+        svc.publish('acct:dominic@example.com', True)
+
+        pyramid_request.realtime.publish_nipsa.assert_called_once_with({
+            'userid': 'acct:dominic@example.com',
+            'nipsa': True,
+        })
+
+
+@pytest.fixture
+def clock():
+    return mock.Mock(spec_set=[], return_value=0)
+
+
+@pytest.fixture
+def cache(clock):
+    return NipsaCache(ttl=60, clock=clock)
 
 
 @pytest.fixture
@@ -8,7 +8,7 @@ import pytest
 import mock
 
 from h.models.annotation import Annotation
-from h.models.document import Document, DocumentURI
+from h.models.document import Document, DocumentURI, uri_expansion_cache
 
 from h import storage
 from h.schemas import ValidationError
@@ -35,6 +35,28 @@ class TestFetchAnnotation(object):
         assert storage.fetch_annotation(db_session, 'foo') is None
 
 
+class TestFetchAnnotations(object):
+
+    def test_it_returns_the_annotations_by_id(self, db_session, factories):
+        ann_1 = factories.Annotation()
+        ann_2 = factories.Annotation()
+        factories.Annotation()
+
+        result = storage.fetch_annotations(db_session, [ann_1.id, ann_2.id])
+
+        assert result == {ann_1.id: ann_1, ann_2.id: ann_2}
+
+    def test_it_ignores_invalid_ids(self, db_session, factories):
+        annotation = factories.Annotation()
+
+        result = storage.fetch_annotations(db_session, ['foo', annotation.id])
+
+        assert result == {annotation.id: annotation}
+
+    def test_it_returns_nothing_if_no_ids_are_valid(self, db_session):
+        assert storage.fetch_annotations(db_session, ['foo']) == {}
+
+
 class TestFetchOrderedAnnotations(object):
 
     def test_it_returns_annotations_for_ids_in_the_same_order(self, db_session, factories):
@@ -58,6 +80,41 @@ class TestFetchOrderedAnnotations(object):
                                                             query_processor=only_maria)
 
 
+class TestFetchThreadIds(object):
+
+    def test_it_returns_the_ids_of_each_threads_replies(self, db_session, factories):
+        root = factories.Annotation()
+        reply = factories.Annotation(references=[root.id])
+        subreply = factories.Annotation(references=[root.id, reply.id])
+        db_session.flush()
+
+        thread_ids = storage.fetch_thread_ids(db_session, [root.id])
+
+        assert sorted(thread_ids[root.id]) == sorted([reply.id, subreply.id])
+
+    def test_it_returns_empty_lists_for_annotations_without_replies(self, db_session, factories):
+        root = factories.Annotation()
+        reply = factories.Annotation(references=[root.id])
+        lonely = factories.Annotation()
+        db_session.flush()
+
+        thread_ids = storage.fetch_thread_ids(db_session, [reply.id, lonely.id])
+
+        assert thread_ids == {reply.id: [], lonely.id: []}
+
+    def test_it_fetches_many_threads_at_once(self, db_session, factories):
+        roots = factories.Annotation.create_batch(3)
+        replies = [factories.Annotation(references=[root.id]) for root in roots]
+        db_session.flush()
+
+        thread_ids = storage.fetch_thread_ids(db_session, [root.id for root in roots])
+
+        assert thread_ids == {root.id: [reply.id] for root, reply in zip(roots, replies)}
+
+    def test_it_returns_an_empty_dict_when_given_no_ids(self, db_session):
+        assert storage.fetch_thread_ids(db_session, []) == {}
+
+
 class TestExpandURI(object):
 
     def test_expand_uri_no_document(self, db_session):
@@ -90,6 +147,32 @@ class TestExpandURI(object):
             'http://bar.com/'
         ]
 
+    def test_expand_uri_caches_document_uris(self, db_session):
+        storage.expand_uri(db_session, 'http://foo.com/')
+
+        document = Document(document_uris=[
+            DocumentURI(uri='http://foo.com/', claimant='http://bar.com'),
+            DocumentURI(uri='http://bar.com/', claimant='http://bar.com'),
+        ])
+        db_session.add(document)
+        db_session.flush()
+
+        assert storage.expand_uri(db_session, 'http://foo.com/') == ['http://foo.com/']
+
+    def test_expand_uri_shares_cache_between_equivalent_uris(self, db_session):
+        document = Document(document_uris=[
+            DocumentURI(uri='http://foo.com/', claimant='http://bar.com'),
+            DocumentURI(uri='http://bar.com/', claimant='http://bar.com'),
+        ])
+        db_session.add(document)
+        db_session.flush()
+        storage.expand_uri(db_session, 'http://foo.com/')
+        misses = uri_expansion_cache.misses
+
+        storage.expand_uri(db_session, 'https://foo.com')
+
+        assert uri_expansion_cache.misses == misses
+
 
 @pytest.mark.usefixtures('models', 'group_service', 'update_document_metadata')
 class TestCreateAnnotation(object):
@@ -345,6 +428,117 @@ class TestCreateAnnotation(object):
         }
 
 
+@pytest.mark.usefixtures('security_policy')
+class TestCreateAnnotations(object):
+
+    def test_it_creates_the_annotations(self, pyramid_request, group_service, db_session):
+        datas = [self.annotation_data(text='one'), self.annotation_data(text='two')]
+
+        result = storage.create_annotations(pyramid_request, datas, group_service)
+
+        assert [a.text for a in result] == ['one', 'two']
+        assert db_session.query(Annotation).count() == 2
+
+    def test_it_reports_annotations_it_cannot_create(self,
+                                                     pyramid_request,
+                                                     group_service,
+                                                     db_session):
+        group_service.find.side_effect = lambda groupid: (
+            None if groupid == 'missing-group' else mock.DEFAULT)
+        datas = [self.annotation_data(groupid='missing-group'),
+                 self.annotation_data(text='two')]
+
+        result = storage.create_annotations(pyramid_request, datas, group_service)
+
+        assert isinstance(result[0], ValidationError)
+        assert str(result[0]).startswith('group: ')
+        assert result[1].text == 'two'
+        assert db_session.query(Annotation).count() == 1
+
+    def test_it_sets_group_for_replies(self, pyramid_request, group_service, factories):
+        parent = factories.Annotation(groupid='parent-group')
+        data = self.annotation_data(references=[parent.id])
+
+        [reply] = storage.create_annotations(pyramid_request, [data], group_service)
+
+        assert reply.groupid == 'parent-group'
+
+    def test_it_reports_replies_to_annotations_which_do_not_exist(self,
+                                                                  pyramid_request,
+                                                                  group_service):
+        data = self.annotation_data(references=['missing_annotation_id'])
+
+        [result] = storage.create_annotations(pyramid_request, [data], group_service)
+
+        assert str(result).startswith('references.0: ')
+
+    def test_it_updates_each_document_once(self,
+                                           monkeypatch,
+                                           pyramid_request,
+                                           group_service):
+        update_document_metadata = mock.Mock(wraps=storage.update_document_metadata)
+        monkeypatch.setattr(storage, 'update_document_metadata', update_document_metadata)
+        datas = [self.annotation_data(target_uri='http://example.com/a'),
+                 self.annotation_data(target_uri='http://example.com/b'),
+                 self.annotation_data(target_uri='http://example.com/a')]
+
+        result = storage.create_annotations(pyramid_request, datas, group_service)
+
+        assert update_document_metadata.call_count == 2
+        assert result[0].document == result[2].document
+        assert result[0].document != result[1].document
+
+    def test_it_attaches_annotations_to_documents_merged_by_later_ones(self,
+                                                                      pyramid_request,
+                                                                      group_service,
+                                                                      db_session):
+        data_a = self.annotation_data(target_uri='http://example.com/a')
+        data_b = self.annotation_data(target_uri='http://example.com/b')
+        # The second annotation's document is also known as the first's
+        # target, so updating it merges the first's document into it.
+        data_merge = self.annotation_data(target_uri='http://example.com/b')
+        data_merge['document']['document_uri_dicts'] = [{
+            'claimant': 'http://example.com/b',
+            'uri': 'http://example.com/a',
+            'type': 'rel-alternate',
+            'content_type': '',
+        }]
+        storage.create_annotations(pyramid_request, [data_b], group_service)
+
+        result = storage.create_annotations(pyramid_request, [data_a, data_merge],
+                                            group_service)
+
+        assert result[0].document == result[1].document
+        assert db_session.query(Document).count() == 1
+
+    def annotation_data(self, **kwargs):
+        data = {
+            'userid': 'acct:test@localhost',
+            'text': 'text',
+            'tags': [],
+            'shared': True,
+            'target_uri': 'http://www.example.com/example.html',
+            'groupid': '__world__',
+            'references': [],
+            'target_selectors': [],
+            'document': {
+                'document_uri_dicts': [],
+                'document_meta_dicts': [],
+            }
+        }
+        data.update(kwargs)
+        return data
+
+    @pytest.fixture
+    def pyramid_request(self, pyramid_request, db_session):
+        pyramid_request.db = db_session
+        return pyramid_request
+
+    @pytest.fixture
+    def security_policy(self, pyramid_config):
+        pyramid_config.testing_securitypolicy('acct:test@localhost', permissive=True)
+
+
 @pytest.mark.usefixtures('models', 'update_document_metadata')
 class TestUpdateAnnotation(object):
 
@@ -449,6 +643,22 @@ class TestUpdateAnnotation(object):
 
         assert str(exc.value).startswith('group: ')
 
+    def test_it_does_not_change_the_annotation_if_invalid(self,
+                                                          annotation_data,
+                                                          pyramid_request,
+                                                          group_service,
+                                                          scoped_open_group):
+        annotation = pyramid_request.db.query.return_value.get.return_value
+        annotation.updated = mock.sentinel.original_updated
+        annotation_data['target_uri'] = 'http://www.bar.com/baz/ding.html'
+        group_service.find.return_value = scoped_open_group
+
+        with pytest.raises(ValidationError):
+            storage.update_annotation(pyramid_request, 'test_annotation_id', annotation_data, group_service)
+
+        assert annotation.updated == mock.sentinel.original_updated
+        assert annotation.target_uri != annotation_data['target_uri']
+
     def test_it_allows_when_group_scope_matches(self, annotation_data, pyramid_request, group_service, scoped_open_group, models):
         annotation_data['target_uri'] = 'http://www.foo.com/baz/ding.html'
 
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import pytest
+from jsonpointer import JsonPointer, JsonPointerException
+
+from h.streamer import filter
+
+
+class TestFilterHandler(object):
+    def test_it_matches_uri_one_of(self):
+        handler = make_handler([uri_clause(['http://example.com', 'http://example.org'])])
+
+        assert handler.match(ANNOTATION, 'create')
+
+    def test_it_does_not_match_other_uris(self):
+        handler = make_handler([uri_clause(['http://example.net'])])
+
+        assert not handler.match(ANNOTATION, 'create')
+
+    def test_it_folds_field_and_clause_values(self):
+        handler = make_handler([uri_clause(['HTTP://EXAMPLE.COM/CAFÉ'])])
+
+        assert handler.match({'uri': 'http://example.com/café'}, 'create')
+
+    def test_matches_tests_whether_list_fields_contain_value(self):
+        handler = make_handler([{'field': '/tags', 'operator': 'matches', 'value': 'Foo'}])
+
+        assert handler.match(ANNOTATION, 'create')
+
+    def test_matches_tests_for_substrings_of_string_fields(self):
+        handler = make_handler([{'field': '/text', 'operator': 'matches', 'value': 'QUICK'}])
+
+        assert handler.match(ANNOTATION, 'create')
+
+    @pytest.mark.parametrize('operator,value,expected', [
+        ('equals', 'acct:bob@example.com', True),
+        ('equals', 'acct:alice@example.com', False),
+        ('gt', 'acct:alice@example.com', True),
+        ('lt', 'acct:alice@example.com', False),
+        ('first_of', 'a', True),
+        ('match_of', ['alice', 'bob'], True),
+        ('match_of', ['alice', 'carol'], False),
+        ('lene', 20, True),
+        ('leng', 30, False),
+    ])
+    def test_operators(self, operator, value, expected):
+        handler = make_handler([{'field': '/user', 'operator': operator, 'value': value}])
+
+        assert handler.match(ANNOTATION, 'create') is expected
+
+    def test_it_matches_any_of_a_list_of_fields(self):
+        handler = make_handler([{'field': ['/missing', '/tags'],
+                                 'operator': 'matches',
+                                 'value': 'bar'}])
+
+        assert handler.match(ANNOTATION, 'create')
+
+    def test_missing_fields_do_not_match(self):
+        handler = make_handler([{'field': '/missing', 'operator': 'equals', 'value': 'x'}])
+
+        assert not handler.match(ANNOTATION, 'create')
+
+    @pytest.mark.parametrize('match_policy,expected', [
+        ('include_any', True),
+        ('include_all', False),
+        ('exclude_any', False),
+        ('exclude_all', True),
+    ])
+    def test_match_policies(self, match_policy, expected):
+        handler = make_handler([uri_clause(['http://example.com']),
+                                uri_clause(['http://example.net'])],
+                               match_policy=match_policy)
+
+        assert handler.match(ANNOTATION, 'create') is expected
+
+    def test_it_matches_everything_without_clauses(self):
+        handler = make_handler([])
+
+        assert handler.match(ANNOTATION, 'create')
+
+    @pytest.mark.parametrize('action,expected', [
+        ('create', True),
+        ('delete', False),
+        ('past', True),
+        (None, True),
+    ])
+    def test_it_checks_actions(self, action, expected):
+        handler = make_handler([], actions={'create': True})
+
+        assert handler.match(ANNOTATION, action) is expected
+
+    def test_it_accepts_targets(self):
+        handler = make_handler([uri_clause(['http://example.com'])])
+
+        assert handler.match(filter.Target(ANNOTATION), 'create')
+
+    def test_it_raises_for_invalid_pointers(self):
+        with pytest.raises(JsonPointerException):
+            make_handler([{'field': 'uri', 'operator': 'equals', 'value': 'x'}])
+
+    @pytest.mark.parametrize('filter_', [
+        {'actions': {}, 'match_policy': 'include_some', 'clauses': [{
+            'field': '/uri', 'operator': 'equals', 'value': 'x'}]},
+        {'actions': {}, 'match_policy': 'include_any', 'clauses': [{
+            'field': '/uri', 'operator': 'resembles', 'value': 'x'}]},
+        {'actions': {}, 'match_policy': 'include_any', 'clauses': [{
+            'field': '/uri', 'operator': 'equals'}]},
+    ])
+    def test_it_raises_for_invalid_filters(self, filter_):
+        with pytest.raises(ValueError):
+            filter.FilterHandler(filter_)
+
+
+class TestTarget(object):
+    def test_field_returns_value_and_folded_value(self):
+        target = filter.Target(ANNOTATION)
+
+        assert target.field('/tags', JsonPointer('/tags')) == (['Foo', 'bar'], ['foo', 'bar'])
+
+    def test_field_returns_none_for_missing_fields(self):
+        target = filter.Target(ANNOTATION)
+
+        assert target.field('/missing', JsonPointer('/missing')) == (None, None)
+
+
+ANNOTATION = {
+    'uri': 'http://example.com',
+    'user': 'acct:bob@example.com',
+    'text': 'The quick brown fox',
+    'tags': ['Foo', 'bar'],
+}
+
+
+def make_handler(clauses, match_policy='include_any', actions=None):
+    if actions is None:
+        actions = {'create': True, 'update': True, 'delete': True}
+    return filter.FilterHandler({'actions': actions,
+                                 'match_policy': match_policy,
+                                 'clauses': clauses})
+
+
+def uri_clause(uris):
+    return {'field': '/uri', 'operator': 'one_of', 'value': uris}
@@ -7,6 +7,7 @@ from gevent.queue import Queue
 from pyramid import security
 from pyramid import registry
 
+from h.db.types import InvalidUUID
 from h.streamer import messages
 
 
@@ -14,8 +15,11 @@ class FakeSocket(object):
     client_id = None
     filter = None
     terminated = None
+    # The sockets created by the current test, see the fake_sockets fixture
+    instances = None
 
     def __init__(self, client_id):
+        self.instances.append(self)
         self.client_id = client_id
         self.terminated = False
         self.filter = mock.MagicMock()
@@ -127,7 +131,7 @@ class TestProcessMessages(object):
 
 
 class TestHandleMessage(object):
-    def test_calls_handler_with_list_of_sockets(self, websocket):
+    def test_calls_handler_with_sockets(self, websocket):
         handler = mock.Mock(return_value=None)
         session = mock.sentinel.db_session
         settings = mock.sentinel.settings
@@ -136,14 +140,14 @@ class TestHandleMessage(object):
 
         messages.handle_message(message, settings, session, topic_handlers={'foo': handler})
 
-        handler.assert_called_once_with(message.payload, list(websocket.instances), settings, session)
+        handler.assert_called_once_with(message.payload, websocket.instances, settings, session)
 
     @pytest.fixture
     def websocket(self, patch):
         return patch('h.streamer.websocket.WebSocket')
 
 
-@pytest.mark.usefixtures('fetch_annotation', 'groupfinder_service', 'links_service', 'nipsa_service')
+@pytest.mark.usefixtures('fetch_annotation', 'groupfinder_service', 'links_service', 'nipsa_service', 'subscriptions')
 class TestHandleAnnotationEvent(object):
     def test_it_fetches_the_annotation(self, fetch_annotation, presenter_asdict):
         message = {
@@ -215,6 +219,63 @@ class TestHandleAnnotationEvent(object):
             annotation_resource.return_value)
         assert presenters.AnnotationJSONPresenter.return_value.asdict.called
 
+    def test_it_only_considers_sockets_subscribed_to_the_annotation_uri(self,
+                                                                       fetch_annotation,
+                                                                       presenter_asdict,
+                                                                       subscriptions):
+        message = {'action': '_', 'annotation_id': '_', 'src_client_id': '_'}
+        subscribed = FakeSocket('giraffe')
+        unsubscribed = FakeSocket('zebra')
+        session = mock.sentinel.db_session
+        settings = {'foo': 'bar'}
+        presenter_asdict.return_value = self.serialized_annotation()
+        subscriptions.candidates.side_effect = None
+        subscriptions.candidates.return_value = [subscribed]
+
+        messages.handle_annotation_event(message, [subscribed, unsubscribed], settings, session)
+
+        subscriptions.candidates.assert_called_once_with(fetch_annotation.return_value.target_uri)
+        assert len(subscribed.send_json_payloads) == 1
+        assert unsubscribed.send_json_payloads == []
+        assert not unsubscribed.filter.match.called
+
+    def test_it_only_considers_the_given_sockets(self, presenter_asdict):
+        message = {'action': '_', 'annotation_id': '_', 'src_client_id': '_'}
+        given = FakeSocket('giraffe')
+        other = FakeSocket('zebra')
+        presenter_asdict.return_value = self.serialized_annotation()
+
+        messages.handle_annotation_event(message, [given], {}, mock.sentinel.db_session)
+
+        assert len(given.send_json_payloads) == 1
+        assert other.send_json_payloads == []
+
+    def test_it_serializes_the_annotation_once_for_all_sockets(self, presenters):
+        message = {'action': '_', 'annotation_id': '_', 'src_client_id': '_'}
+        sockets = [FakeSocket('giraffe'), FakeSocket('zebra'), FakeSocket('okapi')]
+        for socket in sockets:
+            socket.registry = sockets[0].registry
+        session = mock.sentinel.db_session
+        settings = {'foo': 'bar'}
+        presenters.AnnotationJSONPresenter.return_value.asdict.return_value = (
+            self.serialized_annotation())
+
+        messages.handle_annotation_event(message, sockets, settings, session)
+
+        presenters.AnnotationJSONPresenter.assert_called_once_with(mock.ANY)
+        assert [len(s.send_json_payloads) for s in sockets] == [1, 1, 1]
+
+    def test_it_does_not_serialize_the_annotation_if_no_socket_needs_it(self, presenters):
+        message = {'action': '_', 'annotation_id': '_', 'src_client_id': '_'}
+        socket = FakeSocket('giraffe')
+        socket.filter = None
+        session = mock.sentinel.db_session
+        settings = {'foo': 'bar'}
+
+        messages.handle_annotation_event(message, [socket], settings, session)
+
+        assert not presenters.AnnotationJSONPresenter.called
+
     def test_notification_format(self, presenter_asdict):
         """Check the format of the returned notification in the happy case."""
         message = {
@@ -427,6 +488,162 @@ class TestHandleAnnotationEvent(object):
         return patch('h.streamer.messages.AnnotationContext')
 
 
+class TestHandleAnnotationBatch(object):
+    def test_it_handles_the_batch_payloads(self, handle_annotation_events, websocket):
+        batch = [messages.Message(topic='annotation', payload={'annotation_id': 'a'}),
+                 messages.Message(topic='annotation', payload={'annotation_id': 'b'})]
+        session = mock.sentinel.db_session
+        settings = mock.sentinel.settings
+
+        messages.handle_annotation_batch(batch, settings, session)
+
+        handle_annotation_events.assert_called_once_with([{'annotation_id': 'a'}, {'annotation_id': 'b'}],
+                                                         websocket.WebSocket.instances,
+                                                         settings,
+                                                         session)
+
+    @pytest.fixture
+    def handle_annotation_events(self, patch):
+        return patch('h.streamer.messages.handle_annotation_events')
+
+    @pytest.fixture
+    def websocket(self, patch):
+        return patch('h.streamer.messages.websocket')
+
+
+@pytest.mark.usefixtures('groupfinder_service', 'links_service', 'presenters', 'subscriptions')
+class TestHandleAnnotationEvents(object):
+    def test_it_fetches_all_the_annotations_in_one_query(self, fetch_ordered_annotations):
+        session = mock.sentinel.db_session
+
+        messages.handle_annotation_events([event('a'), event('b'), event('a')], [], {}, session)
+
+        fetch_ordered_annotations.assert_called_once_with(session, mock.ANY, query_processor=mock.ANY)
+        assert sorted(fetch_ordered_annotations.call_args[0][1]) == ['a', 'b']
+
+    def test_it_falls_back_to_fetching_annotations_one_by_one_on_invalid_ids(self,
+                                                                            fetch_ordered_annotations,
+                                                                            fetch_annotation,
+                                                                            fake_sockets):
+        fetch_ordered_annotations.side_effect = InvalidUUID('bad')
+        fetch_annotation.side_effect = lambda session, id_: annotation(id_) if id_ == 'a' else None
+        socket = FakeSocket('giraffe')
+
+        messages.handle_annotation_events([event('a'), event('bad')], fake_sockets, {},
+                                          mock.sentinel.db_session)
+
+        assert len(socket.send_json_payloads) == 1
+
+    def test_it_shares_nipsa_and_group_services_across_the_batch(self, nipsa_service, groupfinder_service):
+        messages.handle_annotation_events([event('a'), event('b')], [], {}, mock.sentinel.db_session)
+
+        assert nipsa_service.call_count == 1
+        assert groupfinder_service.call_count == 1
+
+    def test_it_sends_notifications_for_each_event_in_order(self, fake_sockets):
+        socket = FakeSocket('giraffe')
+
+        messages.handle_annotation_events([event('b', 'create'), event('a', 'update')], fake_sockets, {},
+                                          mock.sentinel.db_session)
+
+        assert [p['options']['action'] for p in socket.send_json_payloads] == ['create', 'update']
+
+    def test_it_skips_missing_annotations(self, fake_sockets):
+        socket = FakeSocket('giraffe')
+
+        messages.handle_annotation_events([event('missing'), event('a')], fake_sockets, {},
+                                          mock.sentinel.db_session)
+
+        assert len(socket.send_json_payloads) == 1
+
+    def test_it_sends_the_other_events_if_one_fails(self, fake_sockets, sentry):
+        socket = FakeSocket('giraffe')
+        socket.send_json = mock.Mock(side_effect=[ValueError('boom'), None])
+
+        messages.handle_annotation_events([event('a'), event('b')], fake_sockets, {},
+                                          mock.sentinel.db_session)
+
+        assert socket.send_json.call_count == 2
+        sentry.return_value.captureException.assert_called_once_with()
+
+    def test_it_only_sends_to_the_given_sockets(self):
+        socket = FakeSocket('giraffe')
+
+        messages.handle_annotation_events([event('a')], [], {}, mock.sentinel.db_session)
+
+        assert socket.send_json_payloads == []
+
+    def test_it_does_not_send_nipsad_annotations(self, nipsa_service, fake_sockets):
+        nipsa_service.return_value.is_flagged.side_effect = lambda userid: userid == 'acct:a@example.com'
+        socket = FakeSocket('giraffe')
+
+        messages.handle_annotation_events([event('a'), event('b')], fake_sockets, {}, mock.sentinel.db_session)
+
+        assert len(socket.send_json_payloads) == 1
+
+    @pytest.fixture
+    def sentry(self, patch):
+        return patch('h.streamer.messages.h.sentry.get_client')
+
+    @pytest.fixture
+    def fetch_ordered_annotations(self, patch):
+        fetch = patch('h.streamer.messages.storage.fetch_ordered_annotations')
+        fetch.side_effect = lambda session, ids, query_processor: [annotation(id_) for id_ in ids
+                                                                   if id_ != 'missing']
+        return fetch
+
+    @pytest.fixture(autouse=True)
+    def fetch_annotation(self, patch, fetch_ordered_annotations):
+        return patch('h.streamer.messages.storage.fetch_annotation')
+
+    @pytest.fixture
+    def presenters(self, patch):
+        presenters = patch('h.streamer.messages.presenters')
+        presenters.AnnotationJSONPresenter.return_value.asdict.return_value = {
+            'permissions': {'read': ['group:__world__']}}
+        return presenters
+
+    @pytest.fixture
+    def links_service(self, patch):
+        return patch('h.streamer.messages.LinksService')
+
+    @pytest.fixture
+    def groupfinder_service(self, patch):
+        return patch('h.streamer.messages.GroupfinderService')
+
+    @pytest.fixture(autouse=True)
+    def nipsa_service(self, patch):
+        service = patch('h.streamer.messages.NipsaService')
+        service.return_value.is_flagged.return_value = False
+        return service
+
+
+def event(annotation_id, action='create'):
+    return {'annotation_id': annotation_id, 'action': action, 'src_client_id': 'pigeon'}
+
+
+def annotation(id_):
+    return mock.Mock(id=id_,
+                     userid='acct:{}@example.com'.format(id_),
+                     target_uri='http://example.com')
+
+
+@pytest.fixture(autouse=True)
+def fake_sockets(monkeypatch):
+    """Collect the :py:class:`FakeSocket` instances created by each test."""
+    sockets = []
+    monkeypatch.setattr(FakeSocket, 'instances', sockets)
+    return sockets
+
+
+@pytest.fixture
+def subscriptions(patch, fake_sockets):
+    """Subscribe every :py:class:`FakeSocket` created by a test to all URIs."""
+    subscriptions = patch('h.streamer.messages.websocket.WebSocket.subscriptions')
+    subscriptions.candidates.side_effect = lambda uri: list(fake_sockets)
+    return subscriptions
+
+
 class TestHandleUserEvent(object):
     def test_sends_session_change_when_joining_or_leaving_group(self):
         session_model = mock.Mock()
@@ -460,3 +677,13 @@ class TestHandleUserEvent(object):
         messages.handle_user_event(message, [socket], None, None)
 
         assert socket.send_json_payloads == []
+
+
+class TestHandleNipsaEvent(object):
+    def test_it_updates_the_nipsa_cache(self, patch):
+        cache = patch('h.streamer.messages.nipsa.CACHE')
+        message = {'userid': 'acct:amy@example.com', 'nipsa': True}
+
+        messages.handle_nipsa_event(message, [], None, None)
+
+        cache.update.assert_called_once_with('acct:amy@example.com', True)
@@ -1,9 +1,11 @@
 # -*- coding: utf-8 -*-
 
 from __future__ import unicode_literals
+import gevent
 import mock
 from mock import call
 import pytest
+from gevent.queue import Full, Queue
 
 from h.streamer import messages
 from h.streamer import streamer
@@ -35,6 +37,7 @@ def test_process_work_queue_uses_appropriate_topic_handlers_for_realtime_message
     topic_handlers = {
         'annotation': messages.handle_annotation_event,
         'user': messages.handle_user_event,
+        'nipsa': messages.handle_nipsa_event,
     }
 
     messages.handle_message.assert_called_once_with(mock.ANY,
@@ -123,3 +126,186 @@ def websocket_handle_message(patch):
 @pytest.fixture(autouse=True)
 def messages_handle_message(patch):
     return patch('h.streamer.messages.handle_message')
+
+
+class TestLane(object):
+    def test_put_queues_message(self):
+        lane = streamer.Lane('test', key=lambda m: m)
+
+        lane.put('foo')
+
+        assert lane.queues[0].get_nowait() == 'foo'
+
+    def test_put_assigns_messages_with_the_same_key_to_the_same_queue(self):
+        lane = streamer.Lane('test', key=lambda m: m[0], workers=4)
+
+        for n in range(10):
+            lane.put(('a', n))
+
+        queue = [q for q in lane.queues if q.qsize()]
+        assert len(queue) == 1
+        assert [queue[0].get_nowait()[1] for _ in range(10)] == list(range(10))
+
+    def test_put_spreads_messages_across_queues(self):
+        lane = streamer.Lane('test', key=lambda m: m, workers=4)
+
+        for n in range(100):
+            lane.put(n)
+
+        assert all(q.qsize() for q in lane.queues)
+
+    def test_put_counts_dropped_messages_and_raises(self):
+        lane = streamer.Lane('test', key=lambda m: m, maxsize=1)
+        lane.put('foo')
+
+        with pytest.raises(Full):
+            lane.put('bar', timeout=0.01)
+        with pytest.raises(Full):
+            lane.put_nowait('baz')
+
+        assert lane.dropped == 2
+
+    def test_qsize_counts_all_queues(self):
+        lane = streamer.Lane('test', key=lambda m: m, workers=3)
+
+        for n in range(7):
+            lane.put(n)
+
+        assert lane.qsize() == 7
+
+    def test_resize_splits_maxsize_between_queues(self):
+        lane = streamer.Lane('test', key=lambda m: m, maxsize=100)
+
+        lane.resize(4)
+
+        assert [q.maxsize for q in lane.queues] == [25, 25, 25, 25]
+
+    def test_control_lane_keys_messages_by_socket(self):
+        message = websocket.Message(socket=mock.sentinel.socket, payload={})
+
+        assert streamer._socket_key(message) == id(mock.sentinel.socket)
+
+    def test_put_queues_message_without_a_key_if_there_is_one_queue(self):
+        lane = streamer.Lane('test')
+
+        lane.put('foo')
+
+        assert lane.queues[0].get_nowait() == 'foo'
+
+
+class TestStart(object):
+    def test_it_starts_a_worker_for_each_lane_queue(self, event, spawn):
+        event.app.registry.settings = {'h.streamer.control_workers': '2'}
+
+        streamer.start(event)
+
+        workers = [c for c in spawn.call_args_list
+                   if c[0][0] == streamer.process_work_queue]
+        queues = [c[0][2] for c in workers]
+        assert queues == streamer.CONTROL_LANE.queues + streamer.FANOUT_LANE.queues
+        assert len(queues) == 3
+
+    def test_it_starts_one_fanout_worker(self, event, spawn):
+        event.app.registry.settings = {'h.streamer.fanout_workers': '3'}
+
+        streamer.start(event)
+
+        assert len(streamer.FANOUT_LANE.queues) == 1
+
+    def test_it_sends_realtime_messages_to_the_fanout_lane(self, event, spawn):
+        event.app.registry.settings = {}
+
+        streamer.start(event)
+
+        consumers = [c for c in spawn.call_args_list
+                     if c[0][0] == messages.process_messages]
+        assert [c[0][2] for c in consumers] == ['annotation', 'user', 'nipsa']
+        assert all(c[0][3] is streamer.FANOUT_LANE for c in consumers)
+
+    @pytest.fixture
+    def event(self):
+        return mock.Mock()
+
+    @pytest.fixture
+    def spawn(self, patch, request):
+        def restore():
+            streamer.CONTROL_LANE.resize(1)
+        request.addfinalizer(restore)
+        return patch('h.streamer.streamer.gevent.spawn')
+
+
+class TestProcessWorkQueueBatching(object):
+    def test_it_handles_consecutive_annotation_events_together(self, session):
+        batch = [messages.Message(topic='annotation', payload={'annotation_id': str(n)})
+                 for n in range(3)]
+
+        streamer.process_work_queue({}, batch, session_factory=lambda _: session)
+
+        messages.handle_annotation_batch.assert_called_once_with(batch, {}, session)
+        assert not messages.handle_message.called
+        assert session.commit.call_count == 1
+
+    def test_it_limits_batch_size(self, session):
+        batch = [messages.Message(topic='annotation', payload={'annotation_id': str(n)})
+                 for n in range(5)]
+        settings = {'h.streamer.batch_size': 2}
+
+        streamer.process_work_queue(settings, batch, session_factory=lambda _: session)
+
+        assert messages.handle_annotation_batch.call_args_list == [
+            call(batch[0:2], settings, session),
+            call(batch[2:4], settings, session),
+        ]
+        messages.handle_message.assert_called_once_with(batch[4], settings, session, topic_handlers=mock.ANY)
+
+    def test_it_does_not_batch_across_other_messages(self, session):
+        ann1 = messages.Message(topic='annotation', payload={'annotation_id': '1'})
+        ann2 = messages.Message(topic='annotation', payload={'annotation_id': '2'})
+        user = messages.Message(topic='user', payload={'userid': 'foo'})
+        ws = websocket.Message(socket=mock.sentinel.SOCKET, payload='bar')
+        ann3 = messages.Message(topic='annotation', payload={'annotation_id': '3'})
+        ann4 = messages.Message(topic='annotation', payload={'annotation_id': '4'})
+        queue = [ann1, ann2, user, ws, ann3, ann4]
+
+        streamer.process_work_queue({}, queue, session_factory=lambda _: session)
+
+        assert messages.handle_annotation_batch.call_args_list == [
+            call([ann1, ann2], {}, session),
+            call([ann3, ann4], {}, session),
+        ]
+        messages.handle_message.assert_called_once_with(user, {}, session, topic_handlers=mock.ANY)
+        websocket.handle_message.assert_called_once_with(ws, session)
+
+    def test_it_waits_for_more_annotation_events(self, session):
+        queue = Queue()
+        ann1 = messages.Message(topic='annotation', payload={'annotation_id': '1'})
+        ann2 = messages.Message(topic='annotation', payload={'annotation_id': '2'})
+        queue.put(ann1)
+        gevent.spawn_later(0.01, queue.put, ann2)
+        gevent.spawn_later(0.05, queue.put, StopIteration)
+
+        streamer.process_work_queue({'h.streamer.batch_wait': 0.03},
+                                    queue,
+                                    session_factory=lambda _: session)
+
+        messages.handle_annotation_batch.assert_called_once_with([ann1, ann2], mock.ANY, session)
+
+    def test_it_stops_waiting_after_batch_wait(self, session):
+        queue = Queue()
+        ann1 = messages.Message(topic='annotation', payload={'annotation_id': '1'})
+        ann2 = messages.Message(topic='annotation', payload={'annotation_id': '2'})
+        queue.put(ann1)
+        gevent.spawn_later(0.05, queue.put, ann2)
+        gevent.spawn_later(0.06, queue.put, StopIteration)
+
+        streamer.process_work_queue({'h.streamer.batch_wait': 0.01},
+                                    queue,
+                                    session_factory=lambda _: session)
+
+        assert not messages.handle_annotation_batch.called
+        handled = [c[0][0] for c in messages.handle_message.call_args_list]
+        assert handled == [ann1, ann2]
+
+    @pytest.fixture(autouse=True)
+    def handle_annotation_batch(self, patch):
+        return patch('h.streamer.messages.handle_annotation_batch')
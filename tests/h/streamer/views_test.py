@@ -33,7 +33,7 @@ def test_websocket_view_adds_work_queue_to_environ(pyramid_request):
     views.websocket_view(pyramid_request)
     env = pyramid_request.environ
 
-    assert env['h.ws.streamer_work_queue'] == streamer.WORK_QUEUE
+    assert env['h.ws.streamer_work_queue'] == streamer.CONTROL_LANE
 
 
 @pytest.fixture
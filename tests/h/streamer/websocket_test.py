@@ -2,6 +2,7 @@
 
 from __future__ import unicode_literals
 from collections import namedtuple
+import gc
 
 import mock
 import pytest
@@ -89,6 +90,11 @@ class TestWebSocket(object):
         # A second closure (however unusual) should not raise
         client1.closed(1000)
 
+    def test_removes_self_from_subscriptions_when_closed(self, client, subscriptions):
+        client.closed(1000)
+
+        subscriptions.remove.assert_called_once_with(client)
+
     def test_enqueues_incoming_messages(self, client, queue):
         """Valid messages are pushed onto the queue."""
         message = FakeMessage('{"foo":"bar"}')
@@ -184,6 +190,10 @@ class TestWebSocket(object):
     def fake_socket_close(self, patch):
         return patch('h.streamer.websocket.WebSocket.close')
 
+    @pytest.fixture
+    def subscriptions(self, patch):
+        return patch('h.streamer.websocket.WebSocket.subscriptions')
+
     @pytest.fixture
     def fake_socket_send(self, patch):
         return patch('h.streamer.websocket.WebSocket.send')
@@ -292,6 +302,22 @@ class TestHandleFilterMessage(object):
 
         assert socket.filter is not None
 
+    def test_indexes_socket_subscriptions(self, socket, subscriptions):
+        filter_ = {
+            'actions': {},
+            'match_policy': 'include_any',
+            'clauses': [{
+                'field': '/uri',
+                'operator': 'one_of',
+                'value': ['http://example.com'],
+            }],
+        }
+        message = websocket.Message(socket=socket, payload={'filter': filter_})
+
+        websocket.handle_filter_message(message)
+
+        subscriptions.update.assert_called_once_with(socket, filter_)
+
     @mock.patch('h.streamer.websocket.storage.expand_uri')
     def test_expands_uris_in_uri_filter_with_session(self, expand_uri, socket):
         expand_uri.return_value = ['http://example.com',
@@ -364,12 +390,142 @@ class TestHandleFilterMessage(object):
         mock_reply.assert_called_once_with(matchers.MappingContaining('error'),
                                            ok=False)
 
+    def test_uncompilable_filter_error(self, matchers, socket):
+        message = websocket.Message(socket=socket, payload={
+            'type': 'filter',
+            'filter': {
+                'actions': {},
+                'match_policy': 'include_any',
+                'clauses': [{
+                    'field': 'uri',
+                    'operator': 'equals',
+                    'value': 'http://example.com',
+                }],
+            },
+        })
+
+        with mock.patch.object(websocket.Message, 'reply') as mock_reply:
+            websocket.handle_filter_message(message)
+
+        mock_reply.assert_called_once_with(matchers.MappingContaining('error'),
+                                           ok=False)
+        assert socket.filter is None
+
     @pytest.fixture
     def socket(self):
         socket = mock.Mock()
         socket.filter = None
         return socket
 
+    @pytest.fixture
+    def subscriptions(self, patch):
+        return patch('h.streamer.websocket.WebSocket.subscriptions')
+
+
+class TestSubscriptionIndex(object):
+    def test_candidates_includes_sockets_subscribed_to_uri(self, index, sockets):
+        index.update(sockets[0], uri_filter(['http://example.com/']))
+        index.update(sockets[1], uri_filter(['http://example.org/']))
+
+        assert index.candidates('http://example.com/') == [sockets[0]]
+
+    def test_candidates_folds_uris_like_filters_do(self, index, sockets):
+        index.update(sockets[0], uri_filter(['http://EXAMPLE.com/Caf\u00e9']))
+
+        assert index.candidates('http://example.com/cafe\u0301') == [sockets[0]]
+
+    def test_candidates_includes_sockets_subscribed_by_any_clause(self, index, sockets):
+        filter_ = uri_filter(['http://example.com/'])
+        filter_['clauses'].append({'field': '/uri',
+                                   'operator': 'one_of',
+                                   'value': ['http://example.org/']})
+        index.update(sockets[0], filter_)
+
+        assert index.candidates('http://example.org/') == [sockets[0]]
+
+    @pytest.mark.parametrize('filter_', [
+        {'match_policy': 'include_any', 'actions': {}, 'clauses': []},
+        {'match_policy': 'include_all', 'actions': {},
+         'clauses': [{'field': '/uri', 'operator': 'one_of', 'value': ['http://example.com/']}]},
+        {'match_policy': 'include_any', 'actions': {},
+         'clauses': [{'field': '/uri', 'operator': 'one_of', 'value': 'example.com'}]},
+        {'match_policy': 'include_any', 'actions': {},
+         'clauses': [{'field': '/uri', 'operator': 'matches', 'value': ['http://example.com/']}]},
+        {'match_policy': 'include_any', 'actions': {},
+         'clauses': [{'field': '/user', 'operator': 'one_of', 'value': ['acct:foo@example.com']}]},
+    ])
+    def test_candidates_always_includes_sockets_with_unindexable_filters(self, index, sockets, filter_):
+        index.update(sockets[0], filter_)
+
+        assert index.candidates('http://example.net/') == [sockets[0]]
+
+    def test_candidates_excludes_sockets_without_filters(self, index, sockets):
+        index.update(sockets[0], None)
+
+        assert index.candidates('http://example.com/') == []
+
+    def test_candidates_excludes_garbage_collected_sockets(self, index):
+        socket = mock.Mock()
+        index.update(socket, uri_filter(['http://example.com/']))
+
+        del socket
+        gc.collect()
+
+        assert index.candidates('http://example.com/') == []
+
+    def test_it_forgets_uris_of_garbage_collected_sockets(self, index):
+        socket = mock.Mock()
+        index.update(socket, uri_filter(['http://example.com/']))
+
+        del socket
+        gc.collect()
+
+        assert not index._by_uri
+        assert not index._uris
+
+    def test_update_replaces_previous_subscriptions(self, index, sockets):
+        index.update(sockets[0], uri_filter(['http://example.com/']))
+        index.update(sockets[0], uri_filter(['http://example.org/']))
+
+        assert index.candidates('http://example.com/') == []
+        assert index.candidates('http://example.org/') == [sockets[0]]
+
+    def test_remove_removes_socket(self, index, sockets):
+        index.update(sockets[0], uri_filter(['http://example.com/']))
+        index.update(sockets[1], {'match_policy': 'include_any', 'actions': {}, 'clauses': []})
+
+        index.remove(sockets[0])
+        index.remove(sockets[1])
+
+        assert index.candidates('http://example.com/') == []
+
+    def test_remove_forgets_uris_without_sockets(self, index, sockets):
+        index.update(sockets[0], uri_filter(['http://example.com/', 'http://example.org/']))
+        index.update(sockets[1], uri_filter(['http://example.org/']))
+
+        index.remove(sockets[0])
+
+        assert list(index._by_uri) == ['http://example.org/']
+
+    def test_remove_ignores_unknown_sockets(self, index, sockets):
+        index.remove(sockets[0])
+
+    @pytest.fixture
+    def index(self):
+        return websocket.SubscriptionIndex()
+
+    @pytest.fixture
+    def sockets(self):
+        return [mock.Mock(), mock.Mock()]
+
+
+def uri_filter(uris):
+    return {
+        'actions': {},
+        'match_policy': 'include_any',
+        'clauses': [{'field': '/uri', 'operator': 'one_of', 'value': uris}],
+    }
+
 
 class TestHandlePingMessage(object):
     def test_pong(self):
@@ -2,6 +2,8 @@
 
 from __future__ import unicode_literals
 
+import datetime
+
 import mock
 import pytest
 
@@ -97,6 +99,96 @@ class TestAddAnnotation(object):
         return patch('h.tasks.indexer.add_annotation.delay')
 
 
+@pytest.mark.usefixtures('celery', 'settings_service')
+class TestAddAnnotations(object):
+
+    def test_it_indexes_the_annotations(self, batch_indexer, celery):
+        indexer.add_annotations(['id-1', 'id-2'])
+
+        batch_indexer.assert_called_once_with(celery.request.db,
+                                              celery.request.es,
+                                              celery.request)
+        batch_indexer.return_value.index.assert_called_once_with({'id-1', 'id-2'})
+
+    def test_it_deduplicates_ids(self, batch_indexer):
+        indexer.add_annotations(['id-1', 'id-1'])
+
+        batch_indexer.return_value.index.assert_called_once_with({'id-1'})
+
+    def test_it_does_nothing_when_there_are_no_ids(self, batch_indexer):
+        indexer.add_annotations([])
+
+        assert not batch_indexer.called
+
+    def test_it_skips_annotations_updated_after_the_batch_was_queued(self, batch_indexer, factories):
+        unchanged = factories.Annotation(updated=datetime.datetime(2018, 3, 1, 12, 0))
+        changed = factories.Annotation(updated=datetime.datetime(2018, 3, 1, 13, 0))
+
+        indexer.add_annotations([unchanged.id, changed.id], queued='2018-03-01T12:30:00.000000')
+
+        batch_indexer.return_value.index.assert_called_once_with({unchanged.id})
+
+    def test_it_does_nothing_when_every_annotation_was_updated_after_the_batch_was_queued(self,
+                                                                                         batch_indexer,
+                                                                                         factories):
+        changed = factories.Annotation(updated=datetime.datetime(2018, 3, 1, 13, 0))
+
+        indexer.add_annotations([changed.id], queued='2018-03-01T12:30:00.000000')
+
+        assert not batch_indexer.called
+
+    def test_it_adds_thread_roots_to_the_batch(self, batch_indexer, factories):
+        root = factories.Annotation()
+        replies = factories.Annotation.create_batch(2, references=[root.id])
+
+        indexer.add_annotations([r.id for r in replies])
+
+        batch_indexer.return_value.index.assert_called_once_with(
+            {root.id} | {r.id for r in replies})
+
+    def test_during_reindex_adds_to_new_index(self, batch_indexer, celery, settings_service):
+        settings_service.put(SETTING_NEW_INDEX, 'hypothesis-abcdef123')
+
+        indexer.add_annotations(['id-1'])
+
+        batch_indexer.assert_any_call(celery.request.db,
+                                      celery.request.es,
+                                      celery.request,
+                                      target_index='hypothesis-abcdef123')
+        assert batch_indexer.return_value.index.call_count == 2
+
+    def test_it_logs_errored_ids(self, batch_indexer, log):
+        batch_indexer.return_value.index.return_value = {'id-1'}
+
+        indexer.add_annotations(['id-1'])
+
+        log.warning.assert_called_once_with('Failed to index annotations %s', {'id-1'})
+
+    @pytest.fixture
+    def batch_indexer(self, patch):
+        batch_indexer = patch('h.tasks.indexer.BatchIndexer')
+        batch_indexer.return_value.index.return_value = set()
+        return batch_indexer
+
+    @pytest.fixture
+    def log(self, patch):
+        return patch('h.tasks.indexer.log')
+
+
+@pytest.mark.usefixtures('celery')
+class TestCatchupAnnotations(object):
+    def test_it_catches_up(self, catchup, celery):
+        indexer.catchup_annotations()
+
+        catchup.assert_called_once_with(celery.request.db,
+                                        celery.request.es,
+                                        celery.request)
+
+    @pytest.fixture
+    def catchup(self, patch):
+        return patch('h.tasks.indexer.catchup')
+
+
 @pytest.mark.usefixtures('celery', 'delete', 'settings_service')
 class TestDeleteAnnotation(object):
 
@@ -116,6 +116,33 @@ class TestAnnotationContext(object):
         else:
             assert not pyramid_request.has_permission('read', res)
 
+    def test_acl_shared_remembers_group_principals(self,
+                                                   pyramid_config,
+                                                   group_service,
+                                                   links_service):
+        pyramid_config.set_authorization_policy(ACLAuthorizationPolicy())
+        group_principals = {}
+        for userid in ['jim', 'francis']:
+            ann = mock.Mock(deleted=False, shared=True, userid=userid, groupid='pals')
+            res = AnnotationContext(ann, group_service, links_service,
+                                    group_principals=group_principals)
+
+            assert (security.Allow, 'saoirse', 'read') in res.__acl__()
+
+        group_service.find.assert_called_once_with('pals')
+        assert group_principals == {'pals': set(['saoirse', 'jim'])}
+
+    def test_acl_shared_without_group_principals_looks_up_group_every_time(self,
+                                                                           group_service,
+                                                                           links_service):
+        ann = mock.Mock(deleted=False, shared=True, userid='jim', groupid='pals')
+        res = AnnotationContext(ann, group_service, links_service)
+
+        res.__acl__()
+        res.__acl__()
+
+        assert group_service.find.call_count == 2
+
     @pytest.fixture
     def groups(self):
         return {
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import mock
+import pytest
+
+from h.util.cache import LRUCache
+
+
+class TestLRUCache(object):
+
+    def test_get_returns_default_if_not_cached(self, cache):
+        assert cache.get('foo') is None
+        assert cache.get('foo', mock.sentinel.default) is mock.sentinel.default
+
+    def test_get_returns_cached_value(self, cache):
+        cache.set('foo', 'bar')
+
+        assert cache.get('foo') == 'bar'
+
+    def test_get_returns_cached_none(self, cache):
+        cache.set('foo', None)
+
+        assert cache.get('foo', mock.sentinel.default) is None
+
+    def test_get_counts_hits_and_misses(self, cache):
+        cache.set('foo', 'bar')
+
+        cache.get('foo')
+        cache.get('foo')
+        cache.get('baz')
+
+        assert (cache.hits, cache.misses) == (2, 1)
+
+    def test_get_returns_default_after_ttl(self, cache, clock):
+        cache.set('foo', 'bar')
+        clock.return_value = 60
+
+        assert cache.get('foo') is None
+
+    def test_entries_do_not_expire_without_ttl(self, clock):
+        cache = LRUCache(maxsize=3, clock=clock)
+        cache.set('foo', 'bar')
+        clock.return_value = 100000
+
+        assert cache.get('foo') == 'bar'
+
+    def test_set_evicts_least_recently_used_entry(self, cache):
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.set('c', 3)
+        cache.get('a')
+
+        cache.set('d', 4)
+
+        assert cache.get('b') is None
+        assert [cache.get(k) for k in 'acd'] == [1, 3, 4]
+        assert len(cache) == 3
+
+    def test_pop_discards_entry(self, cache):
+        cache.set('foo', 'bar')
+
+        cache.pop('foo')
+        cache.pop('missing')
+
+        assert cache.get('foo') is None
+
+    def test_discard_discards_matching_entries(self, cache):
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.set('c', 3)
+
+        cache.discard(lambda value: value % 2)
+
+        assert [cache.get(k) for k in 'abc'] == [None, 2, None]
+
+    def test_clear_discards_all_entries(self, cache):
+        cache.set('foo', 'bar')
+        cache.set('baz', 'qux')
+
+        cache.clear()
+
+        assert len(cache) == 0
+
+    @pytest.fixture
+    def clock(self):
+        return mock.Mock(spec_set=[], return_value=0)
+
+    @pytest.fixture
+    def cache(self, clock):
+        return LRUCache(maxsize=3, ttl=60, clock=clock)
@@ -9,7 +9,7 @@ import pytest
 import sqlalchemy as sa
 
 from h._compat import text_type
-from h.util.query import column_windows
+from h.util.query import column_window_bounds, column_windows, keyset_windows
 
 
 meta = sa.MetaData()
@@ -76,6 +76,104 @@ class TestColumnWindows(object):
         assert window_query_results(db_session, windows, filter_) == expected
 
 
+@pytest.mark.usefixtures('cw_table')
+class TestColumnWindowBounds(object):
+
+    @pytest.mark.parametrize('windowsize,expected', [
+        (100, [('a', None)]),
+        (13, [('a', 'n'), ('n', None)]),
+        (10, [('a', 'k'), ('k', 'u'), ('u', None)]),
+    ])
+    def test_it_returns_window_bounds(self, db_session, windowsize, expected):
+        testdata = [{'name': text_type(c), 'enabled': True}
+                    for c in ASCII_LOWERCASE]
+        db_session.execute(test_cw.insert().values(testdata))
+
+        bounds = column_window_bounds(db_session,
+                                      test_cw.c.name,
+                                      windowsize=windowsize)
+
+        assert list(bounds) == expected
+
+    def test_it_keeps_rows_with_the_same_value_in_one_window(self, db_session):
+        testdata = [{'name': text_type(c), 'enabled': True} for c in 'aaabbc']
+        db_session.execute(test_cw.insert().values(testdata))
+
+        bounds = column_window_bounds(db_session,
+                                      test_cw.c.name,
+                                      windowsize=2)
+
+        assert list(bounds) == [('a', 'b'), ('b', 'c'), ('c', None)]
+
+    def test_it_returns_no_bounds_for_an_empty_table(self, db_session):
+        bounds = column_window_bounds(db_session, test_cw.c.name)
+
+        assert list(bounds) == []
+
+
+@pytest.mark.usefixtures('cw_table')
+class TestKeysetWindows(object):
+
+    @pytest.mark.parametrize('windowsize,expected', [
+        (100, ['aabbccdd']),
+        (8, ['aabbccdd']),
+        (3, ['aab', 'bcc', 'dd']),
+        (2, ['aa', 'bb', 'cc', 'dd']),
+        (1, ['a', 'a', 'b', 'b', 'c', 'c', 'd', 'd']),
+    ])
+    def test_basic_windowing(self, db_session, windowsize, expected):
+        """Check that windowing returns the correct batches of rows."""
+        testdata = [{'name': text_type(c), 'enabled': True} for c in 'aabbccdd']
+        db_session.execute(test_cw.insert().values(testdata))
+
+        windows = keyset_windows(db_session,
+                                 (test_cw.c.name, test_cw.c.id),
+                                 windowsize=windowsize)
+
+        assert window_query_results(db_session, windows) == expected
+
+    @pytest.mark.parametrize('windowsize,expected', [
+        (100, ['abcdefghijklm']),
+        (10, ['abcdefghij', 'klm']),
+        (3, ['abc', 'def', 'ghi', 'jkl', 'm']),
+    ])
+    def test_filtered_windowing(self, db_session, windowsize, expected):
+        """Check that windowing respects the where clause."""
+        testdata = [{'name': text_type(c), 'enabled': c < 'n'}
+                    for c in ASCII_LOWERCASE]
+        db_session.execute(test_cw.insert().values(testdata))
+
+        filter_ = test_cw.c.enabled
+        windows = keyset_windows(db_session,
+                                 (test_cw.c.name, test_cw.c.id),
+                                 windowsize=windowsize,
+                                 where=filter_)
+
+        assert window_query_results(db_session, windows, filter_) == expected
+
+    def test_it_returns_no_windows_for_an_empty_table(self, db_session):
+        windows = keyset_windows(db_session, (test_cw.c.name, test_cw.c.id))
+
+        assert list(windows) == []
+
+    def test_it_excludes_rows_moved_past_the_end_during_iteration(self, db_session):
+        testdata = [{'name': text_type(c), 'enabled': True} for c in 'abcd']
+        db_session.execute(test_cw.insert().values(testdata))
+
+        results = []
+        for window in keyset_windows(db_session,
+                                     (test_cw.c.name, test_cw.c.id),
+                                     windowsize=2):
+            rows = db_session.query(test_cw.c.id, test_cw.c.name).filter(window).all()
+            results.extend(name for _, name in rows)
+            # Move the rows we've seen after the last row.
+            db_session.execute(test_cw.update()
+                               .where(test_cw.c.id.in_([id_ for id_, _ in rows]))
+                               .values(name='z' + test_cw.c.name))
+
+        assert results == ['a', 'b', 'c', 'd']
+
+
 def window_query_results(session, windows, filter_=None):
     """
     Fetch results using the passed windows and optional filter.
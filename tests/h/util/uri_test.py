@@ -177,3 +177,31 @@ def test_normalize(url_in, url_out):
 @pytest.mark.parametrize("url,_", TEST_URLS)
 def test_normalize_returns_unicode(url, _):
     assert isinstance(uri.normalize(url), text_type)
+
+
+def test_normalize_is_memoized():
+    uri.normalize.cache_clear()
+
+    uri.normalize('http://example.com/memoized')
+    uri.normalize('http://example.com/memoized')
+
+    assert uri.normalize.cache_info().hits == 1
+
+
+def test_normalize_many():
+    urls = [url_in for url_in, _ in TEST_URLS]
+
+    assert uri.normalize_many(urls) == [url_out for _, url_out in TEST_URLS]
+
+
+def test_normalize_many_preserves_order_and_duplicates():
+    urls = ['http://example.com/b', 'http://example.com/a', 'http://example.com/b']
+
+    assert uri.normalize_many(iter(urls)) == ['httpx://example.com/b',
+                                              'httpx://example.com/a',
+                                              'httpx://example.com/b']
+
+
+def test_normalize_many_returns_unicode():
+    assert all(isinstance(u, text_type)
+               for u in uri.normalize_many(url for url, _ in TEST_URLS))
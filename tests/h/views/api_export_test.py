@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import datetime
+
+import mock
+import pytest
+
+from h.schemas import ValidationError
+from h.views import api_export as views
+
+
+class TestExport(object):
+
+    def test_it_returns_the_exported_annotations(self, pyramid_request, export_service):
+        pyramid_request.params['group'] = 'abc123'
+
+        result = views.export(pyramid_request)
+
+        assert result == export_service.export.return_value
+
+    def test_it_exports_by_group(self, pyramid_request, export_service):
+        pyramid_request.params['group'] = 'abc123'
+
+        views.export(pyramid_request)
+
+        export_service.export.assert_called_once_with(views.LIMIT_DEFAULT,
+                                                      group='abc123',
+                                                      userid=None,
+                                                      uri=None,
+                                                      since=None,
+                                                      after=None)
+
+    @pytest.mark.parametrize('user,userid', [
+        ('bob', 'acct:bob@example.com'),
+        ('acct:bob@example.org', 'acct:bob@example.org'),
+    ])
+    def test_it_exports_by_user(self, pyramid_request, export_service, user, userid):
+        pyramid_request.params['user'] = user
+
+        views.export(pyramid_request)
+
+        assert export_service.export.call_args[1]['userid'] == userid
+
+    def test_it_exports_by_uri(self, pyramid_request, export_service):
+        pyramid_request.params['uri'] = 'http://example.com/'
+
+        views.export(pyramid_request)
+
+        assert export_service.export.call_args[1]['uri'] == 'http://example.com/'
+
+    def test_it_raises_if_no_filter_is_given(self, pyramid_request, export_service):
+        with pytest.raises(ValidationError):
+            views.export(pyramid_request)
+
+    @pytest.mark.parametrize('since,expected', [
+        ('2018-01-02T03:04:05', datetime.datetime(2018, 1, 2, 3, 4, 5)),
+        ('2018-01-02T03:04:05.678+00:00', datetime.datetime(2018, 1, 2, 3, 4, 5, 678000)),
+        ('2018-01-02T05:04:05+02:00', datetime.datetime(2018, 1, 2, 3, 4, 5)),
+    ])
+    def test_it_parses_since_as_utc(self, pyramid_request, export_service, since, expected):
+        pyramid_request.params['group'] = 'abc123'
+        pyramid_request.params['since'] = since
+
+        views.export(pyramid_request)
+
+        assert export_service.export.call_args[1]['since'] == expected
+
+    def test_it_raises_if_since_is_invalid(self, pyramid_request, export_service):
+        pyramid_request.params['group'] = 'abc123'
+        pyramid_request.params['since'] = 'yesterday-ish'
+
+        with pytest.raises(ValidationError):
+            views.export(pyramid_request)
+
+    def test_it_passes_after(self, pyramid_request, export_service):
+        pyramid_request.params['group'] = 'abc123'
+        pyramid_request.params['since'] = '2018-01-02T03:04:05'
+        pyramid_request.params['after'] = 'AVLlVTs1f9G3pW-EYc6q'
+
+        views.export(pyramid_request)
+
+        assert export_service.export.call_args[1]['after'] == 'AVLlVTs1f9G3pW-EYc6q'
+
+    def test_it_raises_if_after_is_given_without_since(self, pyramid_request, export_service):
+        pyramid_request.params['group'] = 'abc123'
+        pyramid_request.params['after'] = 'AVLlVTs1f9G3pW-EYc6q'
+
+        with pytest.raises(ValidationError):
+            views.export(pyramid_request)
+
+    @pytest.mark.parametrize('after', ["' OR 1=1", 'AVLlVTs1f9G3pW-EYc6q1'])
+    def test_it_raises_if_after_is_not_an_annotation_id(self,
+                                                        pyramid_request,
+                                                        export_service,
+                                                        after):
+        pyramid_request.params['group'] = 'abc123'
+        pyramid_request.params['since'] = '2018-01-02T03:04:05'
+        pyramid_request.params['after'] = after
+
+        with pytest.raises(ValidationError):
+            views.export(pyramid_request)
+
+    @pytest.mark.parametrize('limit,expected', [
+        ('1', 1),
+        ('500', 500),
+        ('1000000', views.LIMIT_MAX),
+    ])
+    def test_it_limits_the_export(self, pyramid_request, export_service, limit, expected):
+        pyramid_request.params['group'] = 'abc123'
+        pyramid_request.params['limit'] = limit
+
+        views.export(pyramid_request)
+
+        assert export_service.export.call_args[0] == (expected,)
+
+    @pytest.mark.parametrize('limit', ['0', '-5', 'many'])
+    def test_it_raises_if_limit_is_invalid(self, pyramid_request, export_service, limit):
+        pyramid_request.params['group'] = 'abc123'
+        pyramid_request.params['limit'] = limit
+
+        with pytest.raises(ValidationError):
+            views.export(pyramid_request)
+
+    @pytest.fixture
+    def export_service(self, pyramid_config):
+        svc = mock.Mock(spec_set=['export'])
+        pyramid_config.register_service(svc, name='annotation_export')
+        return svc
@@ -24,6 +24,7 @@ class TestIndex(object):
 
         pyramid_config.add_route('api.search', '/dummy/search')
         pyramid_config.add_route('api.annotations', '/dummy/annotations')
+        pyramid_config.add_route('api.annotations.batch', '/dummy/annotations/batch')
         pyramid_config.add_route('api.annotation', '/dummy/annotations/:id')
         pyramid_config.add_route('api.links', '/dummy/links')
 
@@ -43,6 +44,9 @@ class TestIndex(object):
         assert links['annotation']['update']['method'] == 'PATCH'
         assert links['annotation']['update']['url'] == (
             host + '/dummy/annotations/:id')
+        assert links['annotation']['batch']['method'] == 'POST'
+        assert links['annotation']['batch']['url'] == (
+            host + '/dummy/annotations/batch')
         assert links['search']['method'] == 'GET'
         assert links['search']['url'] == host + '/dummy/search'
 
@@ -87,18 +91,34 @@ class TestSearch(object):
         search = search_lib.Search.return_value
         search_lib.Search.assert_called_with(pyramid_request,
                                              separate_replies=False,
-                                             stats=pyramid_request.stats)
+                                             stats=pyramid_request.stats,
+                                             _replies_limit=200,
+                                             _replies_offset=0)
         search.run.assert_called_once_with(pyramid_request.params)
 
+    def test_it_passes_the_replies_page_to_search(self, pyramid_request, search_lib):
+        pyramid_request.params = {'_separate_replies': '1',
+                                  '_replies_limit': '50',
+                                  '_replies_offset': '100'}
+
+        views.search(pyramid_request)
+
+        search_lib.Search.assert_called_with(pyramid_request,
+                                             separate_replies='1',
+                                             stats=mock.ANY,
+                                             _replies_limit='50',
+                                             _replies_offset='100')
+        search_lib.Search.return_value.run.assert_called_once_with({})
+
     def test_it_presents_search_results(self, pyramid_request, search_run, presentation_service):
-        search_run.return_value = SearchResult(2, ['row-1', 'row-2'], [], {})
+        search_run.return_value = SearchResult(2, ['row-1', 'row-2'], [], {}, 0)
 
         views.search(pyramid_request)
 
         presentation_service.present_all.assert_called_once_with(['row-1', 'row-2'])
 
     def test_it_returns_search_results(self, pyramid_request, search_run, presentation_service):
-        search_run.return_value = SearchResult(2, ['row-1', 'row-2'], [], {})
+        search_run.return_value = SearchResult(2, ['row-1', 'row-2'], [], {}, 0)
 
         expected = {
             'total': 2,
@@ -107,9 +127,16 @@ class TestSearch(object):
 
         assert views.search(pyramid_request) == expected
 
+    def test_it_returns_the_cursor_for_the_next_page(self, pyramid_request, search_run):
+        search_run.return_value = SearchResult(2, ['row-1'], [], {}, 0, 'next-page')
+
+        result = views.search(pyramid_request)
+
+        assert result['cursor'] == 'next-page'
+
     def test_it_presents_replies(self, pyramid_request, search_run, presentation_service):
         pyramid_request.params = {'_separate_replies': '1'}
-        search_run.return_value = SearchResult(1, ['row-1'], ['reply-1', 'reply-2'], {})
+        search_run.return_value = SearchResult(1, ['row-1'], ['reply-1', 'reply-2'], {}, 2)
 
         views.search(pyramid_request)
 
@@ -117,12 +144,13 @@ class TestSearch(object):
 
     def test_it_returns_replies(self, pyramid_request, search_run, presentation_service):
         pyramid_request.params = {'_separate_replies': '1'}
-        search_run.return_value = SearchResult(1, ['row-1'], ['reply-1', 'reply-2'], {})
+        search_run.return_value = SearchResult(1, ['row-1'], ['reply-1', 'reply-2'], {}, 2)
 
         expected = {
             'total': 1,
             'rows': presentation_service.present_all(['row-1']),
-            'replies': presentation_service.present_all(['reply-1', 'reply-2'])
+            'replies': presentation_service.present_all(['reply-1', 'reply-2']),
+            'replies_total': 2,
         }
 
         assert views.search(pyramid_request) == expected
@@ -254,6 +282,266 @@ class TestCreate(object):
         return patch('h.views.api.CreateAnnotationSchema')
 
 
+@pytest.mark.usefixtures('AnnotationEvent',
+                         'annotation_resource',
+                         'create_schema',
+                         'update_schema',
+                         'links_service',
+                         'group_service',
+                         'presentation_service',
+                         'security_policy',
+                         'storage')
+class TestBatch(object):
+
+    def test_it_raises_if_the_payload_is_not_a_list(self, pyramid_request):
+        pyramid_request.json_body = {'action': 'create', 'data': {}}
+
+        with pytest.raises(views.PayloadError):
+            views.batch(pyramid_request)
+
+    def test_it_raises_if_there_are_too_many_operations(self, pyramid_request):
+        pyramid_request.json_body = [self.create({})] * (views.BATCH_LIMIT + 1)
+
+        with pytest.raises(ValidationError):
+            views.batch(pyramid_request)
+
+    @pytest.mark.parametrize('operation,reason', [
+        ('create', 'action: '),
+        ({'action': 'frobnicate'}, 'action: '),
+        ({'action': 'create'}, 'data: '),
+        ({'action': 'update', 'data': {}}, 'id: '),
+        ({'action': 'update', 'id': 'an-id'}, 'data: '),
+        ({'action': 'delete', 'id': 12345}, 'id: '),
+    ])
+    def test_it_reports_malformed_operations(self, pyramid_request, operation, reason):
+        pyramid_request.json_body = [operation]
+
+        result = views.batch(pyramid_request)
+
+        [item] = result['results']
+        assert item['status'] == 400
+        assert item['reason'].startswith(reason)
+
+    def test_it_validates_the_annotations_to_create(self, pyramid_request, create_schema):
+        pyramid_request.json_body = [self.create({'text': 'one'}), self.create({'text': 'two'})]
+
+        views.batch(pyramid_request)
+
+        create_schema.assert_called_with(pyramid_request)
+        assert create_schema.return_value.validate.call_args_list == [
+            mock.call({'text': 'one'}), mock.call({'text': 'two'})]
+
+    def test_it_reports_invalid_annotations(self, pyramid_request, create_schema, storage):
+        create_schema.return_value.validate.side_effect = ValidationError('asplode')
+        pyramid_request.json_body = [self.create({})]
+
+        result = views.batch(pyramid_request)
+
+        assert result['results'] == [{'status': 400, 'reason': 'asplode'}]
+        storage.create_annotations.assert_called_once_with(pyramid_request, [], mock.ANY)
+
+    def test_it_reports_non_ascii_reasons(self, pyramid_request, create_schema):
+        create_schema.return_value.validate.side_effect = ValidationError('caf\xe9')
+        pyramid_request.json_body = [self.create({})]
+
+        result = views.batch(pyramid_request)
+
+        assert result['results'] == [{'status': 400, 'reason': 'caf\xe9'}]
+
+    def test_it_creates_the_annotations_in_storage_at_once(self,
+                                                           pyramid_request,
+                                                           storage,
+                                                           group_service):
+        pyramid_request.json_body = [self.create({'text': 'one'}), self.create({'text': 'two'})]
+
+        views.batch(pyramid_request)
+
+        storage.create_annotations.assert_called_once_with(
+            pyramid_request, [{'text': 'one'}, {'text': 'two'}], group_service)
+
+    def test_it_reports_annotations_storage_could_not_create(self, pyramid_request, storage):
+        storage.create_annotations.side_effect = None
+        storage.create_annotations.return_value = [ValidationError('group: nope')]
+        pyramid_request.json_body = [self.create({})]
+
+        result = views.batch(pyramid_request)
+
+        assert result['results'] == [{'status': 400, 'reason': 'group: nope'}]
+
+    def test_it_publishes_an_event_for_each_annotation_created(self,
+                                                               AnnotationEvent,
+                                                               pyramid_request):
+        pyramid_request.json_body = [self.create({'text': 'one'}), self.create({'text': 'two'})]
+
+        views.batch(pyramid_request)
+
+        assert AnnotationEvent.call_args_list == [
+            mock.call(pyramid_request, 'created-one', 'create'),
+            mock.call(pyramid_request, 'created-two', 'create'),
+        ]
+        assert pyramid_request.notify_after_commit.call_count == 2
+
+    def test_it_fetches_the_annotations_to_change_at_once(self, pyramid_request, storage):
+        pyramid_request.json_body = [self.update('one', {}), self.delete('two')]
+
+        views.batch(pyramid_request)
+
+        storage.fetch_annotations.assert_called_once_with(pyramid_request.db, ['one', 'two'])
+
+    def test_it_reports_annotations_which_do_not_exist(self, pyramid_request, storage):
+        pyramid_request.json_body = [self.update('missing', {}), self.delete('also-missing')]
+
+        result = views.batch(pyramid_request)
+
+        assert [item['status'] for item in result['results']] == [404, 404]
+        assert not storage.update_annotation.called
+        assert not storage.delete_annotation.called
+
+    def test_it_reports_annotations_the_user_may_not_change(self,
+                                                            pyramid_config,
+                                                            pyramid_request,
+                                                            storage):
+        pyramid_config.testing_securitypolicy('acct:foo@example.com', permissive=False)
+        pyramid_request.json_body = [self.update('one', {}), self.delete('two')]
+
+        result = views.batch(pyramid_request)
+
+        assert [item['status'] for item in result['results']] == [404, 404]
+        assert not storage.update_annotation.called
+        assert not storage.delete_annotation.called
+
+    def test_it_updates_annotations_in_storage(self,
+                                               pyramid_request,
+                                               storage,
+                                               update_schema,
+                                               group_service):
+        pyramid_request.json_body = [self.update('one', {'text': 'new'})]
+
+        views.batch(pyramid_request)
+
+        annotation = storage.fetch_annotations.return_value['one']
+        update_schema.assert_called_once_with(pyramid_request,
+                                              annotation.target_uri,
+                                              annotation.groupid)
+        storage.update_annotation.assert_called_once_with(
+            pyramid_request, 'one', {'text': 'new'}, group_service)
+
+    def test_it_reports_invalid_updates(self, pyramid_request, update_schema):
+        update_schema.return_value.validate.side_effect = ValidationError('asplode')
+        pyramid_request.json_body = [self.update('one', {})]
+
+        result = views.batch(pyramid_request)
+
+        assert result['results'] == [{'status': 400, 'reason': 'asplode'}]
+
+    def test_it_publishes_an_event_for_each_annotation_updated(self,
+                                                               AnnotationEvent,
+                                                               pyramid_request,
+                                                               storage):
+        pyramid_request.json_body = [self.update('one', {})]
+
+        views.batch(pyramid_request)
+
+        AnnotationEvent.assert_called_once_with(pyramid_request,
+                                                storage.update_annotation.return_value.id,
+                                                'update')
+
+    def test_it_deletes_annotations_from_storage(self,
+                                                 AnnotationEvent,
+                                                 pyramid_request,
+                                                 storage):
+        pyramid_request.json_body = [self.delete('two')]
+
+        result = views.batch(pyramid_request)
+
+        storage.delete_annotation.assert_called_once_with(pyramid_request.db, 'two')
+        AnnotationEvent.assert_called_once_with(pyramid_request, 'two', 'delete')
+        assert result['results'] == [{'status': 200, 'id': 'two', 'deleted': True}]
+
+    def test_it_reports_annotations_changed_more_than_once(self, pyramid_request, storage):
+        pyramid_request.json_body = [self.update('one', {}), self.delete('one')]
+
+        result = views.batch(pyramid_request)
+
+        storage.fetch_annotations.assert_called_once_with(pyramid_request.db, ['one'])
+        assert not storage.delete_annotation.called
+        assert result['results'][0]['status'] == 200
+        assert result['results'][1]['status'] == 400
+        assert result['results'][1]['reason'].startswith('id: ')
+
+    def test_it_presents_the_annotations_saved_at_once(self,
+                                                       pyramid_request,
+                                                       presentation_service,
+                                                       storage):
+        pyramid_request.json_body = [self.update('one', {}), self.create({'text': 'one'})]
+
+        views.batch(pyramid_request)
+
+        annotations = presentation_service.present_annotations.call_args[0][0]
+        assert [a.id for a in annotations] == ['created-one',
+                                               storage.update_annotation.return_value.id]
+
+    def test_it_reports_results_in_the_order_of_the_operations(self, pyramid_request, storage):
+        pyramid_request.json_body = [self.delete('two'),
+                                     self.update('one', {}),
+                                     self.create({'text': 'one'}),
+                                     self.delete('missing')]
+
+        result = views.batch(pyramid_request)
+
+        assert result['results'] == [
+            {'status': 200, 'id': 'two', 'deleted': True},
+            {'status': 200,
+             'annotation': {'id': storage.update_annotation.return_value.id}},
+            {'status': 200, 'annotation': {'id': 'created-one'}},
+            {'status': 404, 'reason': mock.ANY},
+        ]
+
+    def create(self, data):
+        return {'action': 'create', 'data': data}
+
+    def update(self, id_, data):
+        return {'action': 'update', 'id': id_, 'data': data}
+
+    def delete(self, id_):
+        return {'action': 'delete', 'id': id_}
+
+    @pytest.fixture
+    def pyramid_request(self, pyramid_request):
+        pyramid_request.notify_after_commit = mock.Mock()
+        return pyramid_request
+
+    @pytest.fixture
+    def security_policy(self, pyramid_config):
+        pyramid_config.testing_securitypolicy('acct:foo@example.com', permissive=True)
+
+    @pytest.fixture
+    def create_schema(self, patch):
+        create_schema = patch('h.views.api.CreateAnnotationSchema')
+        create_schema.return_value.validate.side_effect = lambda data: data
+        return create_schema
+
+    @pytest.fixture
+    def update_schema(self, patch):
+        update_schema = patch('h.views.api.UpdateAnnotationSchema')
+        update_schema.return_value.validate.side_effect = lambda data: data
+        return update_schema
+
+    @pytest.fixture
+    def storage(self, storage):
+        storage.create_annotations.side_effect = lambda request, datas, group_service: [
+            mock.Mock(id='created-' + data['text']) for data in datas]
+        storage.fetch_annotations.return_value = {'one': mock.Mock(id='one'),
+                                                  'two': mock.Mock(id='two')}
+        return storage
+
+    @pytest.fixture
+    def presentation_service(self, presentation_service):
+        presentation_service.present_annotations.side_effect = lambda annotations: [
+            {'id': a.id} for a in annotations]
+        return presentation_service
+
+
 @pytest.mark.usefixtures('presentation_service')
 class TestRead(object):
 
@@ -489,7 +777,7 @@ def links_service(pyramid_config):
 
 @pytest.fixture
 def presentation_service(pyramid_config):
-    svc = mock.Mock(spec_set=['present', 'present_all'])
+    svc = mock.Mock(spec_set=['present', 'present_all', 'present_annotations'])
     pyramid_config.register_service(svc, name='annotation_json_presentation')
     return svc
 
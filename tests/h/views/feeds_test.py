@@ -105,7 +105,8 @@ def search_run(search):
     result = SearchResult(total=123,
                           annotation_ids=['foo', 'bar'],
                           reply_ids=[],
-                          aggregations={})
+                          aggregations={},
+                          reply_total=0)
     search_run = search.Search.return_value.run
     search_run.return_value = result
     return search_run